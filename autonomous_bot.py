@@ -8,9 +8,13 @@ import time
 import json
 import logging
 import os
+import random
 import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Dict, Optional
+from types import SimpleNamespace
+from typing import List, Dict, Optional, Tuple
 from dataclasses import dataclass
 
 from py_clob_client.client import ClobClient
@@ -18,6 +22,16 @@ from py_clob_client.clob_types import OrderArgs, OrderType
 from py_clob_client.order_builder.constants import BUY
 from openai import OpenAI
 
+from context_cache import ContextCache, hours_until_event, ttl_for_event
+from decision_cache import DecisionCache
+from keyword_matcher import KeywordMatcher
+from llm_budget import LLMBudget, edge_priority
+from llm_decisions import (BATCH_RESPONSE_FORMAT, batch_prompt, market_block, parse_batch,
+                           parse_decision, single_prompt)
+from pipeline import Pipeline, RateLimiter, Stage
+from quote_cache import QuoteCache
+from relevance_model import RelevanceModel
+
 
 # =========================
 # LOGGING
@@ -38,6 +52,15 @@ logger = logging.getLogger(__name__)
 # =========================
 CHAIN_ID = 137
 HOST = "https://clob.polymarket.com"
+GAMMA_API = "https://gamma-api.polymarket.com"
+
+PRIVATE_KEY = os.environ.get("PRIVATE_KEY")
+if not PRIVATE_KEY:
+    raise ValueError("PRIVATE_KEY environment variable is not set")
+
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+if not OPENAI_API_KEY:
+    raise ValueError("OPENAI_API_KEY environment variable is not set")
 
 # Trading parameters
 MAX_POSITION_USD = 40.0
@@ -46,8 +69,63 @@ MAX_SPREAD_PCT = 4.0
 MIN_LIQUIDITY = 50000
 SCAN_INTERVAL_SECONDS = 300
 MAX_MARKETS_PER_SCAN = 10000
-
-# Only sports keywords (keep improving this list)
+MIN_MID_PRICE = 0.20
+MAX_MID_PRICE = 0.80
+
+# Discovery asks Gamma only for events under these tags (slugs resolved to ids once);
+# pages are fetched GAMMA_PAGE_WORKERS at a time per tag and merged by event id
+SPORTS_TAG_SLUGS = ["sports"]
+GAMMA_PAGE_SIZE = 100
+GAMMA_PAGE_WORKERS = 4
+GAMMA_MAX_EVENTS = 5000  # Per tag
+
+# Gamma's bestBid/bestAsk can lag the book slightly - the prefilter lets markets this
+# close to the limits through to the CLOB check instead of dropping them
+GAMMA_SPREAD_SLACK_PCT = 1.0
+GAMMA_MID_SLACK = 0.02
+PRICE_BATCH_SIZE = 400  # Quotes (token + side) per POST /prices request
+QUOTE_TTL_SECONDS = 60  # Quotes younger than this are reused across find_markets / analyze_market
+EXECUTION_QUOTE_MAX_AGE = 5  # A BUY is re-priced at an ask no older than this just before it is posted
+MIN_EDGE = 0.05  # Fair value must beat the mid by this much to BUY
+
+# Real-time context is cached on disk per question and day; TTL shrinks as the event nears
+CONTEXT_CACHE_DB = "context_cache.db"
+CONTEXT_CACHE_MAX_BYTES = 50 * 1024 * 1024
+
+# A HOLD is reused (no LLM call) until the mid moves more than this, its context
+# expires, or the event is within DECISION_REFRESH_HOURS
+DECISION_PRICE_TOLERANCE = 0.02
+DECISION_REFRESH_HOURS = 1.0
+
+# Analysis pipeline: context fetches and decisions run on worker pools joined by
+# bounded queues; trades are still placed one at a time, in market order
+CONTEXT_WORKERS = 4
+DECISION_WORKERS = 4
+PIPELINE_QUEUE_DEPTH = 8  # Markets waiting per stage before upstream blocks
+LLM_REQUESTS_PER_MINUTE = 120  # Shared by context fetches and decisions
+CLOB_REQUESTS_PER_MINUTE = 300
+# Markets packed into one decision request (1 = one request per market); a worker
+# waits up to the linger time for a pack to fill before sending a partial one
+DECISION_BATCH_SIZE = 4
+DECISION_BATCH_LINGER_SECONDS = 1.0
+DECISION_TOKENS_PER_MARKET = 500  # max_tokens budget per market in a packed request
+PURCHASE_COOLDOWN_SECONDS = 3600  # Don't re-buy the same token within this window
+
+# Local relevance model (train with relevance_model.py): markets scoring below its learned
+# threshold skip the LLM. A few are let through anyway so the training data stays unbiased.
+RELEVANCE_MODEL_PATH = "relevance_model.json"
+RELEVANCE_EXPLORE_RATE = 0.05
+DECISIONS_LOG = "decisions_log.json"  # Every analysed market and its outcome - the model's training data
+
+# Hourly LLM budget (rolling window). Markets are analysed best expected edge first; each
+# reserves an estimated cost up front and is deferred to a later scan if it doesn't fit.
+LLM_CALLS_PER_HOUR = 400
+LLM_TOKENS_PER_HOUR = 1_500_000
+EST_CONTEXT_CALLS = 1.2  # Search model, sometimes plus the gpt-4o fallback
+EST_CONTEXT_TOKENS = 2500
+EST_DECISION_TOKENS = 1500
+
+# Only sports keywords (keep improving this list) - matching is case-insensitive
 SPORTS_KEYWORDS = [
     "win", "winner", "champion", "championship", "title",
     "match", "game", "series", "finals", "playoffs", "conference",
@@ -56,7 +134,7 @@ SPORTS_KEYWORDS = [
     "set", "ace", "break", "tournament",
     "nfl", "nba", "mlb", "nhl", "ufc", "atp", "wta", "fifa", "uefa",
     "premier league", "laliga", "bundesliga", "serie a", "ucl", "euros", "world cup",
-    "vs", " v ", "over", "under", "spread", "handicap", "moneyline", "o/u", "presidential", "2028", "Democratic"
+    "vs", " v ", "over", "under", "spread", "handicap", "moneyline", "o/u", "presidential", "2028", "democratic"
 ]
 
 ABSURD_KEYWORDS = [
@@ -64,9 +142,12 @@ ABSURD_KEYWORDS = [
     "apocalypse", "end of the world", "zombie", "vampire", "dragon", "unicorn",
     "time travel", "flat earth", "illuminati", "bigfoot", "loch ness",
     "second coming", "antichrist", "armageddon", "messiah", "resurrection",
-    "gta vi", "gta 6", "Bitcoin", "BTC", "Iran"
+    "gta vi", "gta 6", "bitcoin", "btc", "iran"
 ]
 
+# Both lists compiled into one matcher; absurd wins when a question hits both
+MARKET_CLASSIFIER = KeywordMatcher([("ABSURD", ABSURD_KEYWORDS), ("SPORTS", SPORTS_KEYWORDS)])
+
 
 @dataclass
 class Market:
@@ -75,25 +156,61 @@ class Market:
     price: float
     spread_pct: float
     liquidity: float
+    best_bid: float = 0.0
+    best_ask: float = 0.0
+    event_time: Optional[str] = None  # ISO start (or end) time of the game, from Gamma
+    market_id: Optional[str] = None  # Gamma market id
+
+
+def _float_or_none(value) -> Optional[float]:
+    try:
+        return float(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def quote_filter(best_bid: float, best_ask: float, spread_slack_pct: float = 0.0, mid_slack: float = 0.0) -> Optional[str]:
+    """Spread / mid-price screen shared by the Gamma prefilter and the CLOB check.
+    Returns the name of the failed check, or None if the quote passes."""
+    if best_bid <= 0 or best_ask <= 0:
+        return "no quote"
+    mid_price = (best_bid + best_ask) / 2.0
+    spread_pct = ((best_ask - best_bid) / best_ask) * 100.0
+    if spread_pct > MAX_SPREAD_PCT + spread_slack_pct:
+        return "spread"
+    # Avoid very high/low probs where edge is harder / fills worse
+    if mid_price < MIN_MID_PRICE - mid_slack or mid_price > MAX_MID_PRICE + mid_slack:
+        return "mid price"
+    return None
+
+
+def classify_market(question: str, market_id: Optional[str] = None) -> str:
+    """ABSURD, SPORTS or OTHER in one pass over the question; memoised per market id."""
+    return MARKET_CLASSIFIER.classify_cached(market_id, question)
+
+
+def is_absurd_market(question: str, market_id: Optional[str] = None) -> bool:
+    return classify_market(question, market_id) == "ABSURD"
 
 
-def is_absurd_market(question: str) -> bool:
-    q = question.lower()
-    return any(k in q for k in ABSURD_KEYWORDS)
+def detect_market_category(question: str, market_id: Optional[str] = None) -> str:
+    """Binary classifier: SPORTS or OTHER (absurd markets are never SPORTS)."""
+    return "SPORTS" if classify_market(question, market_id) == "SPORTS" else "OTHER"
 
 
-def detect_market_category(question: str) -> str:
-    """Binary classifier: SPORTS or OTHER."""
-    q = question.lower()
-    if any(k in q for k in SPORTS_KEYWORDS):
-        return "SPORTS"
-    return "OTHER"
+NO_CONTEXT = "Limited context available."
 
 
-def fetch_real_time_data_sports(question: str, openai_client: OpenAI) -> str:
+def _tokens_used(resp) -> int:
+    usage = getattr(resp, "usage", None)
+    return int(getattr(usage, "total_tokens", 0) or 0)
+
+
+def fetch_real_time_data_sports(question: str, openai_client: OpenAI):
     """
     Sports-only real-time context fetch.
     Tries gpt-4o-search-preview first, then falls back to gpt-4o.
+    Returns (context, tokens used across both attempts).
     """
     today = datetime.now().strftime("%B %d, %Y")
 
@@ -111,6 +228,8 @@ Today's date: {today}
 Be specific with numbers, dates, and sources.
 """
 
+    tokens = 0
+
     # First attempt: OpenAI search model (if you have access)
     try:
         resp = openai_client.chat.completions.create(
@@ -118,9 +237,10 @@ Be specific with numbers, dates, and sources.
             messages=[{"role": "user", "content": search_prompt}],
             max_tokens=2000,
         )
+        tokens += _tokens_used(resp)
         content = (resp.choices[0].message.content or "").strip()
         if len(content) >= 120:
-            return content
+            return content, tokens
         raise RuntimeError("Search response too short")
     except Exception as e:
         logger.debug(f"Web-search model failed or unavailable, fallback to gpt-4o: {e}")
@@ -142,38 +262,37 @@ Today's date: {today}
             temperature=0.2,
             max_tokens=1500,
         )
-        return (resp.choices[0].message.content or "Limited context available.").strip()
+        tokens += _tokens_used(resp)
+        return (resp.choices[0].message.content or NO_CONTEXT).strip(), tokens
     except Exception:
-        return "Limited context available."
+        return NO_CONTEXT, tokens
 
 
 class AutonomousBot:
     def __init__(self):
         logger.info("Initializing SPORTS-only Autonomous Trading Bot...")
 
-        import os
-PRIVATE_KEY = os.environ.get("PRIVATE_KEY")
-if not PRIVATE_KEY:
-    raise ValueError("PRIVATE_KEY environment variable is not set")
-
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY environment variable is not set")
-
-
-       # if not private_key:
-            raise SystemExit("Missing env var POLYMARKET_PRIVATE_KEY")
-        if not openai_key:
-            raise SystemExit("Missing env var OPENAI_API_KEY")
-
         from eth_account import Account
-        acct = Account.from_key(private_key)
+        acct = Account.from_key(PRIVATE_KEY)
         self.wallet_address = acct.address
 
-        self.clob = ClobClient(HOST, key=private_key, chain_id=CHAIN_ID)
+        self.clob = ClobClient(HOST, key=PRIVATE_KEY, chain_id=CHAIN_ID)
         self.clob.set_api_creds(self.clob.create_or_derive_api_creds())
 
-        self.openai = OpenAI(api_key=openai_key)
+        self.openai = OpenAI(api_key=OPENAI_API_KEY)
+        self.llm_limiter = RateLimiter(LLM_REQUESTS_PER_MINUTE)
+        self.clob_limiter = RateLimiter(CLOB_REQUESTS_PER_MINUTE)
+        # Same shape as the OpenAI client, but every completion waits its turn on llm_limiter
+        self.llm = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=self._llm_create)))
+        self.quotes = QuoteCache(self.clob, ttl=QUOTE_TTL_SECONDS, batch_size=PRICE_BATCH_SIZE,
+                                 limiter=self.clob_limiter)
+        self.context_cache = ContextCache(CONTEXT_CACHE_DB, max_bytes=CONTEXT_CACHE_MAX_BYTES)
+        self.decisions = DecisionCache(DECISION_PRICE_TOLERANCE, DECISION_REFRESH_HOURS)
+        self._sports_tag_ids: Optional[List[str]] = None
+        self.relevance = RelevanceModel.load(RELEVANCE_MODEL_PATH)
+        self.budget = LLMBudget(LLM_CALLS_PER_HOUR, LLM_TOKENS_PER_HOUR)
+        self.gated = 0
+        self._gate_lock = threading.Lock()
 
         self.scans_completed = 0
         self.trades_executed = 0
@@ -183,56 +302,192 @@ if not OPENAI_API_KEY:
         logger.info("✅ Bot initialized")
         logger.info(f"Wallet: {self.wallet_address}")
         logger.info("Mode: SPORTS ONLY")
+        if self.relevance is not None:
+            logger.info(f"Relevance gate: threshold {self.relevance.threshold:.4f} "
+                        f"({self.relevance.meta.get('samples', '?')} samples, "
+                        f"trained {self.relevance.meta.get('trained_at', '?')[:10]})")
+        else:
+            logger.info("Relevance gate: off (no model)")
+
+    def _llm_create(self, **kwargs):
+        self.llm_limiter.acquire()
+        resp = None
+        try:
+            resp = self.openai.chat.completions.create(**kwargs)
+            return resp
+        finally:
+            self.budget.record(_tokens_used(resp))
+
+    def priority(self, market: Market) -> float:
+        return edge_priority(market.liquidity, market.spread_pct, market.price,
+                             hours_until_event(market.event_time), MAX_SPREAD_PCT)
+
+    def reserve_budget(self, market: Market) -> bool:
+        """Reserve the market's estimated LLM cost; False if the hourly budget can't cover it."""
+        calls = 1.0 / DECISION_BATCH_SIZE
+        tokens = float(EST_DECISION_TOKENS)
+        if not self.context_cache.has(market.question):
+            calls += EST_CONTEXT_CALLS
+            tokens += EST_CONTEXT_TOKENS
+        return self.budget.reserve(market.token_id, calls, tokens)
+
+    def relevant(self, market: Market) -> bool:
+        """Whether the market is worth an LLM call, per the local relevance model."""
+        if self.relevance is None:
+            return True
+        score = self.relevance.score(market.question, market.price, market.spread_pct, market.liquidity,
+                                     hours_until_event(market.event_time))
+        if score >= self.relevance.threshold:
+            return True
+        if random.random() < RELEVANCE_EXPLORE_RATE:
+            logger.info(f"   🎲 Relevance {score:.3f} below {self.relevance.threshold:.3f} - analysing anyway")
+            return True
+        logger.info(f"   🚫 Relevance {score:.3f} below {self.relevance.threshold:.3f} - skipped")
+        with self._gate_lock:
+            self.gated += 1
+        return False
+
+    def log_decision(self, market: Market, mid_price: float, data: Dict, signal: bool):
+        """Append the analysed market and its outcome to the relevance model's training data."""
+        try:
+            with open(DECISIONS_LOG, "a") as f:
+                f.write(json.dumps({
+                    "timestamp": datetime.now().isoformat(),
+                    "token_id": market.token_id,
+                    "market_id": market.market_id,
+                    "question": market.question,
+                    "mid": mid_price,
+                    "spread_pct": market.spread_pct,
+                    "liquidity": market.liquidity,
+                    "hours_to_event": hours_until_event(market.event_time),
+                    "action": data.get("action"),
+                    "confidence": data.get("confidence"),
+                    "fair_value": data.get("fair_value"),
+                    "signal": signal
+                }) + "\n")
+        except OSError as e:
+            logger.warning(f"Couldn't log decision: {e}")
+
+    def on_cooldown(self, token_id: str) -> bool:
+        bought = self.recent_purchases.get(token_id)
+        return bought is not None and (datetime.now() - bought).total_seconds() < PURCHASE_COOLDOWN_SECONDS
+
+    def sports_tag_ids(self) -> List[str]:
+        """Gamma tag ids for SPORTS_TAG_SLUGS - resolved on first use, then cached."""
+        if self._sports_tag_ids is None:
+            ids = []
+            for slug in SPORTS_TAG_SLUGS:
+                response = requests.get(f"{GAMMA_API}/tags/slug/{slug}", timeout=10)
+                response.raise_for_status()
+                ids.append(str(response.json()["id"]))
+            self._sports_tag_ids = ids
+            logger.info(f"   🏷️  Sports tags: {', '.join(f'{s}={i}' for s, i in zip(SPORTS_TAG_SLUGS, ids))}")
+        return self._sports_tag_ids
+
+    def _fetch_events(self, params: Dict) -> Tuple[List[Dict], int, float]:
+        """One /events request: (events, payload bytes, parse seconds)"""
+        response = requests.get(f"{GAMMA_API}/events", params=params, timeout=10)
+        response.raise_for_status()
+        start = time.perf_counter()
+        events = response.json()
+        return events, len(response.content), time.perf_counter() - start
+
+    def fetch_sports_events(self) -> Tuple[List[Dict], int, float]:
+        """Open events under the sports tags, most liquid first: (events, payload bytes, parse seconds).
+
+        Each tag is paged GAMMA_PAGE_WORKERS pages at a time until a short page comes back.
+        Events listed under several tags are kept once."""
+        merged: Dict[str, Dict] = {}
+        size, parse = 0, 0.0
+        with ThreadPoolExecutor(max_workers=GAMMA_PAGE_WORKERS) as pool:
+            for tag_id in self.sports_tag_ids():
+                offset = 0
+                while offset < GAMMA_MAX_EVENTS:
+                    offsets = [offset + n * GAMMA_PAGE_SIZE for n in range(GAMMA_PAGE_WORKERS)]
+                    pages = pool.map(self._fetch_events, [{
+                        "tag_id": tag_id,
+                        "related_tags": "true",
+                        "closed": "false",
+                        "order": "liquidity",
+                        "ascending": "false",
+                        "limit": GAMMA_PAGE_SIZE,
+                        "offset": page_offset
+                    } for page_offset in offsets])
+                    short = False
+                    for events, page_size, page_parse in pages:
+                        size += page_size
+                        parse += page_parse
+                        short = short or len(events) < GAMMA_PAGE_SIZE
+                        for event in events:
+                            merged.setdefault(str(event.get("id")), event)
+                    if short:
+                        break
+                    offset = offsets[-1] + GAMMA_PAGE_SIZE
+
+        events = sorted(merged.values(), key=lambda e: float(e.get("liquidity") or 0), reverse=True)
+        return events, size, parse
 
     def find_markets(self) -> List[Market]:
-        """Find tradeable SPORTS markets only."""
+        """Find tradeable SPORTS markets only.
+
+        Gamma is asked for sports-tagged events only; keyword classification stays as a
+        second check. Cheap screens run first: keywords and liquidity, then spread and mid
+        price on Gamma's own bestBid/bestAsk. Only the survivors are confirmed against live
+        CLOB quotes, fetched in batches rather than two requests per market.
+        """
         try:
             logger.info("🔍 Scanning for SPORTS markets...")
 
-            response = requests.get(
-                "https://gamma-api.polymarket.com/events",
-                params={
+            start = time.time()
+            try:
+                events, size, parse = self.fetch_sports_events()
+            except Exception as e:
+                # Tag lookup or paging failed - fall back to every open event
+                logger.warning(f"   ⚠️  Sports tag query failed ({e}), fetching all events")
+                events, size, parse = self._fetch_events({
                     "limit": 10000,
                     "closed": "false",
                     "order": "liquidity",
                     "ascending": "false"
-                },
-                timeout=10
-            )
+                })
+            logger.info(f"   📥 {len(events)} events ({size / 1024:,.0f} KB) in {time.time() - start:.1f}s, "
+                        f"parsed in {parse * 1000:.0f} ms")
 
-            if response.status_code != 200:
-                logger.error(f"Failed to fetch markets (HTTP {response.status_code})")
-                return []
+            funnel: Dict[str, int] = {}  # stage: markets screened out there
 
-            events = response.json()
-            markets: List[Market] = []
+            def drop(stage):
+                funnel[stage] = funnel.get(stage, 0) + 1
 
+            # Stage 1: Gamma fields only - no extra requests
+            candidates = []
+            seen = 0
+            market_ids = []
             for event in events:
-                if len(markets) >= MAX_MARKETS_PER_SCAN:
-                    break
-
                 for market in event.get("markets", []):
-                    if len(markets) >= MAX_MARKETS_PER_SCAN:
-                        break
-
+                    seen += 1
                     question = market.get("question", "") or ""
                     if not question:
+                        drop("no question")
                         continue
 
+                    market_id = str(market.get("id") or "") or None
+                    if market_id:
+                        market_ids.append(market_id)
+                    category = classify_market(question, market_id)
+
                     # Hard block meme/unverifiable
-                    if is_absurd_market(question):
+                    if category == "ABSURD":
+                        drop("absurd")
                         continue
 
                     # SPORTS ONLY
-                    if detect_market_category(question) != "SPORTS":
+                    if category != "SPORTS":
+                        drop("not sports")
                         continue
 
-                    # Optional stricter sports heuristic: most match markets include vs/v
-                    ql = question.lower()
-
-
                     liquidity = float(market.get("liquidityClob", 0) or 0)
                     if liquidity < MIN_LIQUIDITY:
+                        drop("liquidity")
                         continue
 
                     token_ids_raw = market.get("clobTokenIds", [])
@@ -240,46 +495,59 @@ if not OPENAI_API_KEY:
                         try:
                             token_ids = json.loads(token_ids_raw)
                         except Exception:
-                            continue
+                            token_ids = []
                     else:
                         token_ids = token_ids_raw
 
                     if not token_ids:
+                        drop("no token")
                         continue
 
-                    token_id = token_ids[0]
-
-                    try:
-                        buy_price = self.clob.get_price(token_id, "BUY")
-                        sell_price = self.clob.get_price(token_id, "SELL")
-
-                        best_bid = float(buy_price.get("price", 0) or 0)
-                        best_ask = float(sell_price.get("price", 0) or 0)
-                        if best_bid <= 0 or best_ask <= 0:
+                    # Gamma's quote is for the first (YES) outcome - the token we trade
+                    gamma_bid = _float_or_none(market.get("bestBid"))
+                    gamma_ask = _float_or_none(market.get("bestAsk"))
+                    if gamma_bid is not None and gamma_ask is not None:
+                        failed = quote_filter(gamma_bid, gamma_ask, GAMMA_SPREAD_SLACK_PCT, GAMMA_MID_SLACK)
+                        if failed:
+                            drop(f"gamma {failed}")
                             continue
 
-                        mid_price = (best_bid + best_ask) / 2.0
-                        spread = best_ask - best_bid
-                        spread_pct = (spread / best_ask) * 100.0
-
-                        if spread_pct > MAX_SPREAD_PCT:
-                            continue
-
-                        # Avoid very high/low probs where edge is harder / fills worse
-                        if mid_price < 0.20 or mid_price > 0.80:
-                            continue
-
-                        markets.append(Market(
-                            token_id=token_id,
-                            question=question,
-                            price=mid_price,
-                            spread_pct=spread_pct,
-                            liquidity=liquidity
-                        ))
-
-                    except Exception:
-                        continue
+                    event_time = market.get("gameStartTime") or market.get("endDate") or event.get("endDate")
+                    candidates.append((token_ids[0], question, liquidity, event_time, market_id))
 
+            # Stage 2: confirm survivors against live CLOB quotes, batched
+            requests_before = self.quotes.requests
+            quotes = self.get_quotes([candidate[0] for candidate in candidates])
+            markets: List[Market] = []
+            for token_id, question, liquidity, event_time, market_id in candidates:
+                if len(markets) >= MAX_MARKETS_PER_SCAN:
+                    drop("scan limit")
+                    continue
+                best_bid, best_ask = quotes.get(token_id, (0.0, 0.0))
+                failed = quote_filter(best_bid, best_ask)
+                if failed:
+                    drop(f"clob {failed}")
+                    continue
+
+                markets.append(Market(
+                    token_id=token_id,
+                    question=question,
+                    price=(best_bid + best_ask) / 2.0,
+                    spread_pct=((best_ask - best_bid) / best_ask) * 100.0,
+                    liquidity=liquidity,
+                    best_bid=best_bid,
+                    best_ask=best_ask,
+                    event_time=event_time,
+                    market_id=market_id
+                ))
+
+            # Markets no longer listed have closed - their memoised categories can go
+            MARKET_CLASSIFIER.retain(market_ids)
+
+            logger.info(f"   Funnel: {seen} markets in {len(events)} events -> {len(candidates)} after Gamma "
+                        f"screen ({self.quotes.requests - requests_before} price requests) -> {len(markets)} tradeable")
+            for stage, count in funnel.items():
+                logger.info(f"      - {stage}: {count}")
             logger.info(f"✅ Found {len(markets)} SPORTS markets")
             return markets
 
@@ -287,66 +555,71 @@ if not OPENAI_API_KEY:
             logger.error(f"Market scan failed: {e}")
             return []
 
+    def get_quotes(self, token_ids: List[str]) -> Dict[str, tuple]:
+        """{token_id: (best_bid, best_ask)} through the shared quote cache.
+        Tokens without both sides are left out."""
+        return {t: (bid.price, ask.price) for t, (bid, ask) in self.quotes.bid_ask(token_ids).items()}
+
     def analyze_market(self, market: Market) -> Optional[Dict]:
         """Analyze SPORTS market with real-time context + GPT."""
+        # Defensive: SPORTS ONLY
+        if detect_market_category(market.question, market.market_id) != "SPORTS":
+            return None
+        if not self.relevant(market):
+            return None
+        if not self.reserve_budget(market):
+            logger.info("   ⏳ Deferred: hourly LLM budget spent")
+            return None
         try:
-            # Defensive: SPORTS ONLY
-            if detect_market_category(market.question) != "SPORTS":
-                return None
+            return self.decide(market, *self.fetch_context(market))
+        finally:
+            self.budget.release(market.token_id)
+
+    def fetch_context(self, market: Market) -> Tuple[str, float]:
+        """(real-time context, when it expires) for the market, from the disk cache when still fresh.
+        Context that isn't cached expires at once."""
+        cached = self.context_cache.get(market.question)
+        if cached is not None:
+            logger.info(f"   ♻️  Context from cache ({len(cached[0])} chars)")
+            return cached
+
+        logger.info("   🌐 Fetching sports context...")
+        start = time.time()
+        real_time_context, tokens = fetch_real_time_data_sports(market.question, self.llm)
+        latency = time.time() - start
+        logger.info(f"   ✅ Context fetched ({len(real_time_context)} chars, {latency:.1f}s, {tokens} tokens)")
+        if real_time_context == NO_CONTEXT:
+            return real_time_context, time.time()
+        expires_at = self.context_cache.put(market.question, real_time_context,
+                                            ttl_for_event(market.event_time), latency, tokens)
+        return real_time_context, expires_at
+
+    def current_quote(self, market: Market, max_age: Optional[float] = None) -> Optional[Tuple[float, float, float]]:
+        """(best bid, best ask, quote age) - reuses the quotes find_markets fetched if still fresh"""
+        quote = self.quotes.bid_ask([market.token_id], max_age=max_age).get(market.token_id)
+        if quote is None:
+            return None
+        bid_quote, ask_quote = quote
+        if bid_quote.price <= 0 or ask_quote.price <= 0:
+            return None
+        return bid_quote.price, ask_quote.price, max(bid_quote.age, ask_quote.age)
 
-            buy_price_data = self.clob.get_price(market.token_id, "BUY")
-            sell_price_data = self.clob.get_price(market.token_id, "SELL")
+    def _market_block(self, market: Market, quote, real_time_context: str) -> str:
+        best_bid, best_ask, quote_age = quote
+        return market_block(market.question, best_bid, best_ask, market.spread_pct, market.liquidity,
+                            quote_age, real_time_context)
 
-            best_bid = float(buy_price_data.get("price", 0) or 0)
-            best_ask = float(sell_price_data.get("price", 0) or 0)
-            if best_bid <= 0 or best_ask <= 0:
+    def request_decision(self, market: Market, real_time_context: str) -> Optional[Tuple[Tuple, Dict]]:
+        """One GPT request for one market: (quote, decision) or None."""
+        try:
+            quote = self.current_quote(market)
+            if quote is None:
                 return None
-
-            mid_price = (best_bid + best_ask) / 2.0
-
-            logger.info("   🌐 Fetching sports context...")
-            real_time_context = fetch_real_time_data_sports(market.question, self.openai)
-            logger.info(f"   ✅ Context fetched ({len(real_time_context)} chars)")
-
+            mid_price = (quote[0] + quote[1]) / 2.0
             today = datetime.now().strftime("%B %d, %Y")
+            prompt = single_prompt(today, self._market_block(market, quote, real_time_context), mid_price)
 
-            prompt = f"""You are an expert SPORTS prediction market trader with access to real-time context.
-Today's date: {today}
-
-MARKET: {market.question}
-YOU ARE EVALUATING: Buying YES outcome tokens.
-
-CURRENT MARKET DATA:
-- Implied YES probability (mid): {mid_price * 100:.1f}%
-- Buy (ask): ${best_ask:.4f}
-- Sell (bid): ${best_bid:.4f}
-- Spread: {market.spread_pct:.1f}%
-- Liquidity: ${market.liquidity:,.0f}
-
-REAL-TIME CONTEXT:
-{real_time_context}
-
-TASK:
-Estimate TRUE probability for YES based on the context.
-BUY only if:
-- fair_value >= market_price + 0.05 (>=5% absolute edge)
-- confidence >= 0.72
-- evidence is concrete (scores, injuries, odds), not vibes
-
-Respond ONLY with JSON:
-{{
-  "action": "BUY or HOLD",
-  "confidence": 0.0-1.0,
-  "fair_value": 0.0-1.0,
-  "market_price": {mid_price:.4f},
-  "edge": "fair_value - market_price (absolute)",
-  "key_evidence": "top 2-3 concrete data points",
-  "main_risk": "biggest risk",
-  "reasoning": "brief, specific"
-}}
-"""
-
-            resp = self.openai.chat.completions.create(
+            resp = self.llm.chat.completions.create(
                 model="gpt-4o",
                 messages=[{"role": "user", "content": prompt}],
                 response_format={"type": "json_object"},
@@ -356,16 +629,82 @@ Respond ONLY with JSON:
 
             content = (resp.choices[0].message.content or "").strip()
             try:
-                data = json.loads(content)
+                data = parse_decision(json.loads(content))
             except json.JSONDecodeError as e:
                 logger.error(f"JSON parse error: {e} content={content[:200]}")
                 return None
-
-            required = ["action", "confidence", "fair_value"]
-            if not all(k in data for k in required):
-                logger.error(f"Missing required fields: {data}")
+            if data is None:
+                logger.error(f"Missing or invalid fields: {content[:200]}")
                 return None
+            return quote, data
 
+        except Exception as e:
+            logger.error(f"Analysis failed: {e}")
+            return None
+
+    def request_decisions(self, items: List[Tuple[Market, str, float]]
+                          ) -> List[Optional[Tuple[Market, Tuple, Dict, float]]]:
+        """GPT decisions for several (market, context, context expiry) items, packed into one request;
+        each result is (market, quote, decision, context expiry).
+        Markets whose item comes back missing or malformed are re-asked one at a time.
+        Releases the markets' budget reservations once done."""
+        try:
+            return self._request_decisions(items)
+        finally:
+            for market, _, _ in items:
+                self.budget.release(market.token_id)
+
+    def _request_decisions(self, items: List[Tuple[Market, str, float]]
+                           ) -> List[Optional[Tuple[Market, Tuple, Dict, float]]]:
+        if len(items) == 1:
+            market, real_time_context, expires_at = items[0]
+            result = self.request_decision(market, real_time_context)
+            return [(market, *result, expires_at) if result else None]
+
+        quotes = {}
+        blocks = []
+        for n, (market, real_time_context, _) in enumerate(items):
+            quote = self.current_quote(market)
+            if quote is not None:
+                quotes[n] = quote
+                blocks.append((f"m{n + 1}", self._market_block(market, quote, real_time_context)))
+
+        found = {}
+        if blocks:
+            try:
+                today = datetime.now().strftime("%B %d, %Y")
+                start = time.time()
+                resp = self.llm.chat.completions.create(
+                    model="gpt-4o",
+                    messages=[{"role": "user", "content": batch_prompt(today, blocks)}],
+                    response_format=BATCH_RESPONSE_FORMAT,
+                    temperature=0.2,
+                    max_tokens=DECISION_TOKENS_PER_MARKET * len(blocks)
+                )
+                found = parse_batch(resp.choices[0].message.content or "", [market_id for market_id, _ in blocks])
+                logger.info(f"   🧮 Packed decision: {len(found)}/{len(blocks)} markets in one request "
+                            f"({time.time() - start:.1f}s, {_tokens_used(resp)} tokens)")
+            except Exception as e:
+                logger.error(f"Packed analysis failed: {e}")
+
+        results = []
+        for n, (market, real_time_context, expires_at) in enumerate(items):
+            data = found.get(f"m{n + 1}")
+            if data is not None:
+                results.append((market, quotes[n], data, expires_at))
+                continue
+            if n in quotes:
+                logger.info(f"   ↩️  Re-asking singly: {market.question[:60]}")
+            result = self.request_decision(market, real_time_context)
+            results.append((market, *result, expires_at) if result else None)
+        return results
+
+    def evaluate(self, market: Market, quote, data: Dict, context_expires_at: float) -> Optional[Dict]:
+        """Log a GPT decision and apply the guardrails; returns a BUY signal or None.
+        The decision is remembered until the context it was made on expires."""
+        best_bid, best_ask, _ = quote
+        mid_price = (best_bid + best_ask) / 2.0
+        try:
             action = str(data["action"]).upper()
             confidence = float(data["confidence"])
             fair_value = float(data["fair_value"])
@@ -377,20 +716,22 @@ Respond ONLY with JSON:
             logger.info(f"   ⚠️  Risk: {data.get('main_risk','N/A')}")
 
             # Guardrails
+            hold = None
             if action != "BUY":
-                return None
-
-            edge_abs = fair_value - mid_price
-            if edge_abs < 0.05:
-                logger.info("   ⏭️  HOLD: Edge < 5%")
-                return None
-
-            if confidence < CONFIDENCE_THRESHOLD:
-                logger.info("   ⏭️  HOLD: Confidence below threshold")
-                return None
-
-            if fair_value < 0.60:
-                logger.info("   ⏭️  HOLD: Fair value < 60% guardrail")
+                hold = action
+            elif fair_value - mid_price < MIN_EDGE:
+                hold = f"Edge < {MIN_EDGE:.0%}"
+            elif confidence < CONFIDENCE_THRESHOLD:
+                hold = "Confidence below threshold"
+            elif fair_value < 0.60:
+                hold = "Fair value < 60% guardrail"
+
+            self.decisions.record(market.token_id, "HOLD" if hold else "BUY", fair_value, confidence,
+                                  mid_price, context_expires_at)
+            self.log_decision(market, mid_price, data, signal=hold is None)
+            if hold:
+                if action == "BUY":
+                    logger.info(f"   ⏭️  HOLD: {hold}")
                 return None
 
             return {
@@ -407,6 +748,27 @@ Respond ONLY with JSON:
             logger.error(f"Analysis failed: {e}")
             return None
 
+    def decide(self, market: Market, real_time_context: str, context_expires_at: float) -> Optional[Dict]:
+        """Ask GPT for a decision on the market given its context; returns a BUY signal or None."""
+        result = self.request_decision(market, real_time_context)
+        return self.evaluate(market, *result, context_expires_at) if result else None
+
+    def reprice(self, market: Market, signal: Dict) -> bool:
+        """Move a BUY signal to the current ask just before it is posted; False if the edge is gone."""
+        quote = self.current_quote(market, max_age=EXECUTION_QUOTE_MAX_AGE)
+        if quote is None:
+            logger.info("   ⏭️  No current quote - skipping BUY")
+            return False
+        best_bid, best_ask, _ = quote
+        mid_price = (best_bid + best_ask) / 2.0
+        if signal["fair_value"] - mid_price < MIN_EDGE:
+            logger.info(f"   ⏭️  Edge gone: fair {signal['fair_value']:.0%} vs market {mid_price:.0%} now")
+            return False
+        if best_ask != signal["price"]:
+            logger.info(f"   🔄 Ask moved ${signal['price']:.4f} -> ${best_ask:.4f} since the decision")
+            signal["price"] = best_ask
+        return True
+
     def execute_trade(self, market: Market, signal: Dict) -> bool:
         """Execute BUY order."""
         try:
@@ -430,6 +792,7 @@ Respond ONLY with JSON:
             )
 
             signed_order = self.clob.create_order(order)
+            self.clob_limiter.acquire()
             result = self.clob.post_order(signed_order, OrderType.GTC)
 
             logger.info("   ✅ ORDER POSTED")
@@ -469,31 +832,73 @@ Respond ONLY with JSON:
             logger.info(f"🔄 SCAN #{self.scans_completed + 1} (SPORTS ONLY)")
             logger.info("=" * 70)
 
+            self.quotes.reset_stats()
+            self.quotes.prune()
+            self.context_cache.reset_stats()
+            self.decisions.reset_stats()
+            self.decisions.prune()
+            self.gated = 0
+            llm_waited, clob_waited = self.llm_limiter.waited, self.clob_limiter.waited
+            start = time.time()
             markets = self.find_markets()
             if not markets:
                 logger.info("No tradeable sports markets found")
                 return
 
-            for market in markets:
-                # Cooldown: don’t re-buy same token within 1 hour
-                if market.token_id in self.recent_purchases:
-                    delta = (datetime.now() - self.recent_purchases[market.token_id]).total_seconds()
-                    if delta < 3600:
-                        continue
+            # Cooldown: don’t re-buy same token within the hour
+            markets = [m for m in markets if not self.on_cooldown(m.token_id)]
+            # Best expected edge first, so the LLM budget goes to those
+            markets.sort(key=self.priority, reverse=True)
+            self.budget.reset_stats()
+            deferred: List[Market] = []
 
+            def context_stage(market):
                 logger.info(f"\n📊 Analyzing: {market.question[:80]}...")
                 logger.info(f"   Price: {market.price:.0%}, Spread: {market.spread_pct:.1f}%, Liq: ${market.liquidity:,.0f}")
-
-                signal = self.analyze_market(market)
-                if signal:
-                    ok = self.execute_trade(market, signal)
-                    if ok:
-                        self.recent_purchases[market.token_id] = datetime.now()
-                        time.sleep(10)
-                else:
+                # Defensive: SPORTS ONLY
+                if detect_market_category(market.question, market.market_id) != "SPORTS":
+                    return None
+                if not self.relevant(market):
+                    return None
+                held = self.decisions.reusable(market.token_id, market.price, market.event_time)
+                if held is not None:
+                    logger.info(f"   ♻️  Still HOLD: decided {(time.time() - held.decided_at) / 60:.0f}m ago "
+                                f"at {held.market_price:.0%} (fair {held.fair_value:.0%}, "
+                                f"conf {held.confidence:.0%})")
+                    return None
+                if not self.reserve_budget(market):
+                    logger.info(f"   ⏳ Deferred: hourly LLM budget spent (priority {self.priority(market):.2f})")
+                    deferred.append(market)
+                    return None
+                try:
+                    return (market, *self.fetch_context(market))
+                except Exception:
+                    self.budget.release(market.token_id)
+                    raise
+
+            signals = 0
+
+            def execute(item):
+                # Decisions are logged and checked here, on the writer, so each market's lines stay together
+                nonlocal signals
+                market, quote, data, context_expires_at = item
+                logger.info(f"\n🧠 {market.question[:80]}")
+                signal = self.evaluate(market, quote, data, context_expires_at)
+                if not signal:
                     logger.info("   💤 No BUY signal")
-
-                time.sleep(2.5)
+                    return
+                signals += 1
+                if self.on_cooldown(market.token_id) or not self.reprice(market, signal):
+                    return
+                if self.execute_trade(market, signal):
+                    self.recent_purchases[market.token_id] = datetime.now()
+
+            pipeline = Pipeline([
+                Stage("context", context_stage, CONTEXT_WORKERS),
+                Stage("decision", self.request_decisions, DECISION_WORKERS,
+                      batch_size=DECISION_BATCH_SIZE, linger=DECISION_BATCH_LINGER_SECONDS),
+            ], logger, queue_depth=PIPELINE_QUEUE_DEPTH)
+            pipeline.run(markets, execute)
 
             self.scans_completed += 1
 
@@ -504,6 +909,32 @@ Respond ONLY with JSON:
             logger.info(f"Scans: {self.scans_completed}")
             logger.info(f"Trades: {self.trades_executed}")
             logger.info(f"Deployed: ${self.total_deployed:.2f}")
+            logger.info(f"Scan: {len(markets)} markets -> {signals} BUY signals in {time.time() - start:.1f}s "
+                        f"(rate-limit waits: LLM {self.llm_limiter.waited - llm_waited:.1f}s, "
+                        f"CLOB {self.clob_limiter.waited - clob_waited:.1f}s)")
+            for stage in pipeline.stages:
+                logger.info(f"   {stage.name}: {pipeline.dropped[stage.name]} dropped, "
+                            f"{pipeline.failed[stage.name]} failed")
+            logger.info(f"Quotes: {self.quotes.hits} cached, {self.quotes.misses} fetched "
+                        f"in {self.quotes.requests} requests")
+            stale = ", ".join(f"{n} {reason}" for reason, n in self.decisions.stale.items() if n)
+            logger.info(f"Decisions: {self.decisions.reused} HOLDs reused, "
+                        f"{sum(self.decisions.stale.values())} needed analysis ({stale or 'none'})")
+            if self.relevance is not None:
+                logger.info(f"Relevance gate: {self.gated} markets skipped the LLM")
+            calls, tokens = self.budget.used()
+            logger.info(f"LLM budget: {self.budget.scan_calls} calls, {self.budget.scan_tokens:,} tokens this scan; "
+                        f"{calls}/{self.budget.calls_per_hour} calls, {tokens:,}/{self.budget.tokens_per_hour:,} tokens in the last hour")
+            if deferred:
+                logger.info(f"Deferred to a later scan (no budget): {len(deferred)} markets")
+                for market in sorted(deferred, key=self.priority, reverse=True)[:5]:
+                    logger.info(f"   ⏳ {self.priority(market):.2f}  {market.question[:70]}")
+            cache = self.context_cache
+            if cache.hit_rate is not None:
+                entries, size = cache.stats()
+                logger.info(f"Context cache: {cache.hits}/{cache.hits + cache.misses} hits ({cache.hit_rate:.0%}), "
+                            f"saved {cache.saved_seconds:.1f}s and {cache.saved_tokens:,} tokens "
+                            f"({entries} entries, {size / 1e6:.1f} MB)")
             logger.info("=" * 70)
 
         except Exception as e:
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Vectorized backtest of the profit-taking bot's TP / SL thresholds
+Replays price histories for our positions through the bot's sell rules
+(take profit when price >= TP, stop loss when P&L% <= SL, TP first) for a
+whole grid of thresholds at once, and reports P&L, hit rates and realized
+drawdown for every (TP, SL) pair.
+
+The first time each position crosses each threshold comes from a running
+max / min of its prices and one searchsorted over all positions and
+thresholds, so a grid costs O(T*N + (K_tp + K_sl)*N*log T + K_tp*K_sl*N).
+
+    python backtest.py --days 30                      # our ledger positions, CLOB price history
+    python backtest.py --benchmark                    # synthetic 300 tokens x 30 days of minute bars
+"""
+
+import argparse
+import gzip
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
+
+from ledger import Ledger
+
+PRICES_HISTORY_URL = "https://clob.polymarket.com/prices-history"
+HISTORY_CHUNK_SECONDS = 7 * 24 * 3600  # Span of one prices-history request
+HISTORY_CACHE_DIR = "price_history"    # Fetched histories, one gzip JSON per token
+FETCH_WORKERS = 8
+BAR_SECONDS = 60
+
+LEDGER_DB = "profit_taking_ledger.db"
+SALES_ARCHIVE_DIR = "sales_archive"  # The bot's archived sales, one gzip segment per closed day
+
+
+# ============================================================================
+# ENGINE
+# ============================================================================
+
+@dataclass
+class BacktestResult:
+    tp_grid: np.ndarray
+    sl_grid: np.ndarray
+    pnl: np.ndarray           # (K_tp, K_sl) total P&L, open positions marked at their last price
+    realized_pnl: np.ndarray  # (K_tp, K_sl) P&L of triggered exits only
+    tp_rate: np.ndarray       # (K_tp, K_sl) share of priced positions exited by take profit
+    sl_rate: np.ndarray       # (K_tp, K_sl) share of priced positions exited by stop loss
+    max_drawdown: np.ndarray  # (K_tp, K_sl) largest peak-to-trough fall of cumulative P&L, in exit order
+
+    def best(self, n=10):
+        """Top n (tp, sl) pairs by total P&L"""
+        order = np.argsort(self.pnl, axis=None)[::-1][:n]
+        return [np.unravel_index(i, self.pnl.shape) for i in order]
+
+    def table(self, n=10):
+        lines = [f"{'TP':>6} {'SL%':>7} {'P&L':>10} {'realized':>10} {'TP hit':>7} {'SL hit':>7} {'max DD':>9}"]
+        for i, j in self.best(n):
+            lines.append(f"{self.tp_grid[i]:>6.3f} {self.sl_grid[j]:>7.1f} {self.pnl[i, j]:>+10.2f} "
+                         f"{self.realized_pnl[i, j]:>+10.2f} {self.tp_rate[i, j]:>7.1%} "
+                         f"{self.sl_rate[i, j]:>7.1%} {self.max_drawdown[i, j]:>9.2f}")
+        return "\n".join(lines)
+
+
+def _first_crossings(running, queries):
+    """First row where each column of a non-decreasing (T, N) array reaches each query.
+
+    running: (T, N) non-decreasing down each column, finite
+    queries: (K, N) thresholds per column
+    Returns (K, N) row indices, T where the column never reaches the threshold.
+
+    Columns are laid end to end with an offset larger than their value range, which
+    keeps the flattened array sorted, so one searchsorted answers every query.
+    """
+    T, N = running.shape
+    lo = min(running.min(), queries.min())
+    span = max(running.max(), queries.max()) - lo + 1.0
+    offsets = np.arange(N) * span
+    flat = (running - lo + offsets[None, :]).T.ravel()
+    idx = np.searchsorted(flat, (queries - lo + offsets[None, :]).ravel(), side="left")
+    idx = idx.reshape(queries.shape) - (np.arange(N) * T)[None, :]
+    return np.minimum(idx, T)
+
+
+def backtest_grid(prices, entry_prices, entry_index, shares, tp_grid, sl_grid):
+    """Every (TP, SL) pair over every position in one pass.
+
+    prices:       (T, N) price per bar per position, NaN where there's no price
+    entry_prices: (N,) buy price per position
+    entry_index:  (N,) first bar each position is held
+    shares:       (N,)
+    tp_grid:      (K_tp,) take-profit prices
+    sl_grid:      (K_sl,) stop-loss P&L percentages (negative)
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    entry_prices = np.asarray(entry_prices, dtype=np.float64)
+    shares = np.asarray(shares, dtype=np.float64)
+    tp_grid = np.asarray(tp_grid, dtype=np.float64)
+    sl_grid = np.asarray(sl_grid, dtype=np.float64)
+    T, N = prices.shape
+    cols = np.arange(N)
+
+    held = np.where(np.arange(T)[:, None] >= np.asarray(entry_index)[None, :], prices, np.nan)
+    # Positions with no price while held (e.g. resolved markets) can't exit - keep them out of the rates
+    priced = ~np.isnan(held).all(axis=0)
+
+    # Running extremes since entry; bars before the first price can't trigger anything
+    running_max = np.fmax.accumulate(held, axis=0)
+    running_min = np.fmin.accumulate(held, axis=0)
+    running_max = np.nan_to_num(running_max, nan=-1.0)
+    running_min = np.nan_to_num(running_min, nan=2.0)
+    del held
+
+    # Take profit: price >= tp.  Stop loss: (price - entry) / entry * 100 <= sl,
+    # i.e. price <= entry * (1 + sl / 100) - searched on the negated running min
+    t_tp = _first_crossings(running_max, np.broadcast_to(tp_grid[:, None], (len(tp_grid), N)))
+    stop_prices = entry_prices[None, :] * (1 + sl_grid[:, None] / 100.0)
+    t_sl = _first_crossings(-running_min, -stop_prices)
+    del running_max, running_min
+
+    # Exit prices at the trigger bar; untriggered positions are marked at their last price
+    padded = np.vstack([prices, np.full((1, N), np.nan)])
+    px_tp = padded[t_tp, cols[None, :]]
+    px_sl = padded[t_sl, cols[None, :]]
+    last_valid = np.where(~np.isnan(prices), np.arange(T)[:, None], -1).max(axis=0)
+    last_price = np.where(last_valid >= 0, prices[np.maximum(last_valid, 0), cols], entry_prices)
+
+    # (K_tp, K_sl, N): which rule fires first - TP wins ties, as in evaluate_portfolio()
+    tp_first = (t_tp[:, None, :] <= t_sl[None, :, :]) & (t_tp[:, None, :] < T)
+    sl_first = ~tp_first & (t_sl[None, :, :] < T)
+    exit_price = np.where(tp_first, px_tp[:, None, :],
+                          np.where(sl_first, px_sl[None, :, :], last_price[None, None, :]))
+    pnl = (exit_price - entry_prices) * shares
+    triggered = tp_first | sl_first
+
+    # Realized drawdown: cumulative P&L of triggered exits in the order they happen
+    exit_time = np.where(tp_first, t_tp[:, None, :], np.where(sl_first, t_sl[None, :, :], T))
+    order = np.argsort(exit_time, axis=2, kind="stable")
+    realized_steps = np.take_along_axis(np.where(triggered, pnl, 0.0), order, axis=2)
+    equity = np.cumsum(realized_steps, axis=2)
+    peak = np.maximum(np.maximum.accumulate(equity, axis=2), 0.0)
+    max_drawdown = (peak - equity).max(axis=2)
+
+    return BacktestResult(
+        tp_grid=tp_grid,
+        sl_grid=sl_grid,
+        pnl=pnl.sum(axis=2),
+        realized_pnl=equity[:, :, -1],
+        tp_rate=tp_first.sum(axis=2) / max(priced.sum(), 1),
+        sl_rate=sl_first.sum(axis=2) / max(priced.sum(), 1),
+        max_drawdown=max_drawdown
+    )
+
+
+# ============================================================================
+# DATA
+# ============================================================================
+
+def _parse_ts(value):
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def load_positions(ledger_path=LEDGER_DB, archive_dir=SALES_ARCHIVE_DIR, since=None):
+    """Our positions from the ledger, one per token: open purchases plus the shares sold since
+    `since` (ISO time; live table and archived segments), at their share-weighted entry price.
+    Positions without an open purchase don't keep their entry time, so they replay from the window start."""
+    ledger = Ledger(ledger_path, archive_dir=archive_dir)
+    positions = {}  # token_id: {token_id, cost, shares, opened_at}
+    for token_id, purchase in ledger.load_purchases().items():
+        positions[token_id] = {"token_id": token_id, "cost": purchase["buy_price"] * purchase["shares"],
+                               "shares": purchase["shares"], "opened_at": _parse_ts(purchase["timestamp"])}
+    for sale in ledger.history(since=since):
+        if sale["buy_price"] <= 0:
+            continue
+        position = positions.setdefault(sale["token_id"], {"token_id": sale["token_id"], "cost": 0.0,
+                                                           "shares": 0.0, "opened_at": None})
+        position["cost"] += sale["buy_price"] * sale["shares"]
+        position["shares"] += sale["shares"]
+    return [
+        {"token_id": p["token_id"], "buy_price": p["cost"] / p["shares"], "shares": p["shares"],
+         "opened_at": p["opened_at"]}
+        for p in positions.values() if p["shares"] > 0
+    ]
+
+
+def fetch_price_history(token_id, start_ts, end_ts, session=None, fidelity=1):
+    """[(ts, price)] for a token from the CLOB prices-history endpoint, cached on disk"""
+    os.makedirs(HISTORY_CACHE_DIR, exist_ok=True)
+    path = os.path.join(HISTORY_CACHE_DIR, f"{token_id}-{int(start_ts)}-{int(end_ts)}-{fidelity}.json.gz")
+    if os.path.exists(path):
+        with gzip.open(path, "rt") as f:
+            return [tuple(point) for point in json.load(f)]
+
+    if session is None:
+        import requests
+        session = requests.Session()
+
+    points = []
+    for chunk_start in range(int(start_ts), int(end_ts), HISTORY_CHUNK_SECONDS):
+        r = session.get(PRICES_HISTORY_URL, params={
+            "market": token_id,
+            "startTs": chunk_start,
+            "endTs": min(chunk_start + HISTORY_CHUNK_SECONDS, int(end_ts)),
+            "fidelity": fidelity
+        }, timeout=15)
+        r.raise_for_status()
+        points += [(int(p["t"]), float(p["p"])) for p in r.json().get("history", [])]
+    points = sorted(set(points))
+
+    tmp = f"{path}.tmp"
+    with gzip.open(tmp, "wt") as f:
+        json.dump(points, f)
+    os.replace(tmp, path)
+    return points
+
+
+def build_price_matrix(histories, start_ts, end_ts, bar_seconds=BAR_SECONDS):
+    """Align histories onto one bar grid (last price at or before each bar). Returns (bar times, (T, N))."""
+    bars = np.arange(int(start_ts), int(end_ts), bar_seconds)
+    prices = np.full((len(bars), len(histories)), np.nan)
+    for n, points in enumerate(histories):
+        if not points:
+            continue
+        ts = np.fromiter((t for t, _ in points), dtype=np.int64, count=len(points))
+        px = np.fromiter((p for _, p in points), dtype=np.float64, count=len(points))
+        idx = np.searchsorted(ts, bars, side="right") - 1
+        prices[:, n] = np.where(idx >= 0, px[np.maximum(idx, 0)], np.nan)
+    return bars, prices
+
+
+def load_backtest_inputs(days, ledger_path=LEDGER_DB, bar_seconds=BAR_SECONDS, archive_dir=SALES_ARCHIVE_DIR):
+    end_ts = int(time.time())
+    start_ts = end_ts - days * 86400
+    positions = load_positions(ledger_path, archive_dir, since=datetime.fromtimestamp(start_ts).isoformat())
+    tokens = sorted({p["token_id"] for p in positions})
+    print(f"Fetching {days}d of price history for {len(tokens)} tokens...")
+
+    def fetch(token_id):
+        try:
+            return fetch_price_history(token_id, start_ts, end_ts)
+        except Exception as e:
+            print(f"   ⚠️  No history for {token_id[:20]}...: {e}")
+            return []
+
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+        histories = dict(zip(tokens, pool.map(fetch, tokens)))
+
+    bars, token_prices = build_price_matrix([histories[t] for t in tokens], start_ts, end_ts, bar_seconds)
+    column = {t: i for i, t in enumerate(tokens)}
+    prices = token_prices[:, [column[p["token_id"]] for p in positions]]
+    entry_index = np.array([
+        np.searchsorted(bars, p["opened_at"]) if p["opened_at"] else 0 for p in positions
+    ])
+    entry_prices = np.array([p["buy_price"] for p in positions])
+    shares = np.array([p["shares"] for p in positions])
+    return prices, entry_prices, entry_index, shares
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+def _grid(spec):
+    """'start:stop:count' -> evenly spaced values"""
+    start, stop, count = spec.split(":")
+    return np.linspace(float(start), float(stop), int(count))
+
+
+def benchmark(n_tokens=300, days=30, grid=100):
+    """Synthetic random-walk minute bars through a grid x grid sweep"""
+    rng = np.random.default_rng(7)
+    T = days * 24 * 60
+    steps = rng.normal(0, 0.002, (T, n_tokens))
+    prices = np.clip(rng.uniform(0.2, 0.8, n_tokens)[None, :] + np.cumsum(steps, axis=0), 0.001, 0.999)
+    entry_index = rng.integers(0, T // 2, n_tokens)
+    entry_prices = prices[entry_index, np.arange(n_tokens)]
+    shares = rng.uniform(5, 200, n_tokens)
+
+    start = time.perf_counter()
+    result = backtest_grid(prices, entry_prices, entry_index, shares,
+                           np.linspace(0.5, 0.99, grid), np.linspace(-90, -1, grid))
+    elapsed = time.perf_counter() - start
+    print(f"{n_tokens} tokens x {T:,} bars x {grid}x{grid} grid: {elapsed:.2f}s")
+    print(result.table(5))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest profit-taking TP / SL thresholds")
+    parser.add_argument("--days", type=int, default=30, help="history window")
+    parser.add_argument("--tp", default="0.60:0.99:40", help="take-profit prices, start:stop:count")
+    parser.add_argument("--sl", default="-80:-5:16", help="stop-loss percentages, start:stop:count")
+    parser.add_argument("--ledger", default=LEDGER_DB)
+    parser.add_argument("--archive", default=SALES_ARCHIVE_DIR, help="archived sales directory")
+    parser.add_argument("--top", type=int, default=15, help="pairs to print")
+    parser.add_argument("--benchmark", action="store_true", help="run the synthetic benchmark instead")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark()
+        return
+
+    prices, entry_prices, entry_index, shares = load_backtest_inputs(args.days, args.ledger, archive_dir=args.archive)
+    if not len(shares):
+        print("No positions in the ledger")
+        return
+    start = time.perf_counter()
+    result = backtest_grid(prices, entry_prices, entry_index, shares, _grid(args.tp), _grid(args.sl))
+    print(f"{len(shares)} positions x {prices.shape[0]:,} bars x "
+          f"{len(result.tp_grid)}x{len(result.sl_grid)} grid in {time.perf_counter() - start:.2f}s")
+    print(result.table(args.top))
+
+
+if __name__ == "__main__":
+    main()
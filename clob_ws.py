@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Polymarket CLOB websocket channels
+Reconnecting subscriptions to the CLOB websocket feeds, each run on a daemon
+thread and delivering decoded events to a callback.
+"""
+
+import json
+import logging
+import threading
+import time
+
+import websocket
+
+CLOB_WS_URL = "wss://ws-subscriptions-clob.polymarket.com/ws"
+PING_INTERVAL = 10      # Server drops idle connections - send PING this often
+RECONNECT_MAX_WAIT = 60  # Cap for exponential reconnect backoff (seconds)
+
+logger = logging.getLogger(__name__)
+
+
+class ClobChannel:
+    """Base class: one reconnecting websocket subscription on a daemon thread"""
+
+    channel = ""
+
+    def __init__(self, on_event, url=CLOB_WS_URL):
+        self.on_event = on_event
+        self.url = f"{url}/{self.channel}"
+        self._ws = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.connected = threading.Event()
+        self.on_connect = None  # called after every (re)subscribe, e.g. to resync missed state
+
+    def subscription(self):
+        """Subscribe message sent after every (re)connect"""
+        raise NotImplementedError
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"clob-ws-{self.channel}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.reconnect()
+
+    def reconnect(self):
+        """Drop the current connection - the run loop reconnects with a fresh subscription"""
+        ws = self._ws
+        if ws is not None:
+            try:
+                ws.close()
+            except Exception:
+                pass
+
+    def _run(self):
+        wait = 1
+        while not self._stop.is_set():
+            subscription = self.subscription()
+            if subscription is None:
+                # Nothing to subscribe to yet
+                time.sleep(1)
+                continue
+            try:
+                self._ws = websocket.create_connection(self.url, timeout=PING_INTERVAL)
+                self._ws.send(json.dumps(subscription))
+                self.connected.set()
+                wait = 1
+                logger.info(f"   🔌 CLOB {self.channel} channel connected")
+                if self.on_connect:
+                    self.on_connect()
+                self._recv_loop()
+            except Exception as e:
+                if not self._stop.is_set():
+                    logger.warning(f"   ⚠️  CLOB {self.channel} channel dropped: {e} - reconnecting in {wait}s")
+            finally:
+                self.connected.clear()
+                self._ws = None
+            if self._stop.wait(wait):
+                break
+            wait = min(wait * 2, RECONNECT_MAX_WAIT)
+
+    def _recv_loop(self):
+        last_ping = time.time()
+        while not self._stop.is_set():
+            try:
+                message = self._ws.recv()
+            except websocket.WebSocketTimeoutException:
+                message = None
+            if time.time() - last_ping >= PING_INTERVAL:
+                self._ws.send("PING")
+                last_ping = time.time()
+            if not message or message == "PONG":
+                continue
+            try:
+                payload = json.loads(message)
+            except json.JSONDecodeError:
+                logger.debug(f"   Non-JSON {self.channel} message: {message[:100]}")
+                continue
+            for event in payload if isinstance(payload, list) else [payload]:
+                try:
+                    self.on_event(event)
+                except Exception as e:
+                    logger.error(f"   ❌ {self.channel} event handler failed: {e}")
+
+
+class MarketChannel(ClobChannel):
+    """Public market channel: order book snapshots, price changes and trades for a set of tokens"""
+
+    channel = "market"
+
+    def __init__(self, on_event, url=CLOB_WS_URL):
+        super().__init__(on_event, url)
+        self._assets = frozenset()
+        self._assets_lock = threading.Lock()
+
+    def set_assets(self, asset_ids):
+        """Replace the subscribed token set, resubscribing only if it changed"""
+        asset_ids = frozenset(str(a) for a in asset_ids)
+        with self._assets_lock:
+            if asset_ids == self._assets:
+                return
+            self._assets = asset_ids
+        self.reconnect()
+
+    def subscription(self):
+        with self._assets_lock:
+            if not self._assets:
+                return None
+            return {"type": "market", "assets_ids": sorted(self._assets)}
+
+
+def best_bids(event):
+    """Yield (asset_id, best_bid) pairs carried by a market channel event"""
+    event_type = event.get("event_type")
+    if event_type == "book":
+        bids = [float(level["price"]) for level in event.get("bids", []) if float(level.get("size", 0)) > 0]
+        if bids:
+            yield str(event["asset_id"]), max(bids)
+    elif event_type == "price_change":
+        for change in event.get("price_changes", []):
+            best_bid = change.get("best_bid")
+            if best_bid not in (None, ""):
+                yield str(change["asset_id"]), float(best_bid)
+    elif event_type == "best_bid_ask":
+        if event.get("best_bid") not in (None, ""):
+            yield str(event["asset_id"]), float(event["best_bid"])
+
+
+class UserChannel(ClobChannel):
+    """Authenticated user channel: our order placements, updates, cancels and trades"""
+
+    channel = "user"
+
+    def __init__(self, on_event, creds, url=CLOB_WS_URL):
+        super().__init__(on_event, url)
+        self.creds = creds
+
+    def subscription(self):
+        return {
+            "type": "user",
+            "auth": {
+                "apiKey": self.creds.api_key,
+                "secret": self.creds.api_secret,
+                "passphrase": self.creds.api_passphrase
+            }
+        }
+
+
+class LocalUserChannel:
+    """In-process stand-in for UserChannel: same interface, events are pushed with emit()"""
+
+    def __init__(self, on_event):
+        self.on_event = on_event
+        self.connected = threading.Event()
+        self.on_connect = None
+
+    def start(self):
+        self.connected.set()
+        if self.on_connect:
+            self.on_connect()
+
+    def stop(self):
+        self.connected.clear()
+
+    def reconnect(self):
+        pass
+
+    def emit(self, *events):
+        for event in events:
+            self.on_event(event)
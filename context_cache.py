@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Disk-backed cache for real-time market context
+The search-model research behind each trade decision is cached by normalised
+question and date. Entries live shorter the closer the event is (a game
+starting in an hour changes faster than one next week), and the cache is
+bounded by size, evicting least recently used entries first. Hits record the
+latency and tokens the original fetch cost, so each scan can report what
+the cache saved.
+"""
+
+import logging
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS context (
+    key        TEXT PRIMARY KEY,
+    context    TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    last_used  REAL NOT NULL,
+    size       INTEGER NOT NULL,
+    latency    REAL NOT NULL,    -- seconds the original fetch took
+    tokens     INTEGER NOT NULL  -- tokens the original fetch used
+);
+CREATE INDEX IF NOT EXISTS idx_context_last_used ON context (last_used);
+"""
+
+# (hours until the event, TTL seconds) - first bucket the event falls in wins
+PROXIMITY_TTLS = (
+    (3, 10 * 60),        # starting soon or live: lineups, in-game news
+    (24, 60 * 60),
+    (7 * 24, 6 * 3600),
+)
+DEFAULT_TTL = 12 * 3600  # far-off or unknown event time
+
+
+def normalise_question(question: str) -> str:
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", question.lower()).split())
+
+
+def hours_until_event(event_time: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """Hours from now until event_time (ISO 8601; negative once started), or None if unknown"""
+    if not event_time:
+        return None
+    try:
+        when = datetime.fromisoformat(event_time.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return (when.timestamp() - (now or time.time())) / 3600
+
+
+def ttl_for_event(event_time: Optional[str], now: Optional[float] = None) -> int:
+    """TTL for context about an event at event_time (ISO 8601), by how close it is"""
+    hours = hours_until_event(event_time, now)
+    if hours is None:
+        return DEFAULT_TTL
+    for horizon, ttl in PROXIMITY_TTLS:
+        if hours <= horizon:
+            return ttl
+    return DEFAULT_TTL
+
+
+class ContextCache:
+    def __init__(self, path: str, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.saved_tokens = 0
+
+    @staticmethod
+    def key(question: str, day: Optional[str] = None) -> str:
+        return f"{day or datetime.now().strftime('%Y-%m-%d')}|{normalise_question(question)}"
+
+    def get(self, question: str) -> Optional[Tuple[str, float]]:
+        """(context, expires_at) if a fresh entry is cached"""
+        key = self.key(question)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT context, latency, tokens, expires_at FROM context WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE context SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            self.saved_seconds += row[1]
+            self.saved_tokens += row[2]
+            return row[0], row[3]
+
+    def has(self, question: str) -> bool:
+        """Whether get() would hit, without touching the entry or the stats"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM context WHERE key = ? AND expires_at > ?", (self.key(question), time.time())
+            ).fetchone() is not None
+
+    def put(self, question: str, context: str, ttl: int, latency: float, tokens: int) -> float:
+        """Cache context for ttl seconds; returns when it expires"""
+        now = time.time()
+        size = len(context.encode())
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO context (key, context, created_at, expires_at, last_used, size, latency, tokens) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.key(question), context, now, now + ttl, now, size, latency, tokens)
+            )
+            self._evict(now)
+        return now + ttl
+
+    def _evict(self, now):
+        """Drop expired entries, then least recently used ones until under max_bytes"""
+        self._conn.execute("DELETE FROM context WHERE expires_at <= ?", (now,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM context").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in self._conn.execute("SELECT key, size FROM context ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM context WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        logger.debug(f"Context cache evicted {evicted} entries")
+
+    def stats(self) -> Tuple[int, int]:
+        """(entries, bytes) currently cached"""
+        with self._lock:
+            return tuple(self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM context").fetchone())
+
+    @property
+    def hit_rate(self) -> Optional[float]:
+        total = self.hits + self.misses
+        return self.hits / total if total else None
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Per-token memo of the last trade decision
+A market that was held a scan ago is not worth another LLM call while
+nothing material has changed. Each entry keeps the decision, fair value,
+confidence and the mid price it was made at. The entry goes stale when
+the price moves past a tolerance, when the context behind it expires,
+or once the event is close enough that every scan should look again.
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from context_cache import hours_until_event
+
+
+@dataclass(frozen=True)
+class Decision:
+    action: str  # BUY or HOLD - what the bot did with the analysis, after guardrails
+    fair_value: float
+    confidence: float
+    market_price: float  # mid price the decision was made at
+    decided_at: float
+    expires_at: float  # when the context behind it expires
+
+
+class DecisionCache:
+    def __init__(self, price_tolerance: float, refresh_hours: float):
+        """price_tolerance: absolute mid-price move that invalidates a decision.
+        refresh_hours: events starting within this many hours are always re-analysed."""
+        self.price_tolerance = price_tolerance
+        self.refresh_hours = refresh_hours
+        self._lock = threading.Lock()
+        self._decisions: Dict[str, Decision] = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.reused = 0
+        self.stale = {"new": 0, "price": 0, "expired": 0, "event close": 0, "buy": 0}
+
+    def record(self, token_id: str, action: str, fair_value: float, confidence: float,
+               market_price: float, expires_at: float):
+        """expires_at: when the context the decision was made on expires"""
+        with self._lock:
+            self._decisions[str(token_id)] = Decision(action, fair_value, confidence, market_price,
+                                                      time.time(), expires_at)
+
+    def reusable(self, token_id: str, market_price: float, event_time: Optional[str] = None) -> Optional[Decision]:
+        """The last HOLD for token_id if it still stands at market_price, else None (analyse again)"""
+        with self._lock:
+            decision = self._decisions.get(str(token_id))
+            reason = self._stale_reason(decision, market_price, event_time)
+            if reason is not None:
+                self.stale[reason] += 1
+                return None
+            self.reused += 1
+            return decision
+
+    def _stale_reason(self, decision, market_price, event_time) -> Optional[str]:
+        if decision is None:
+            return "new"
+        if decision.action == "BUY":
+            return "buy"  # a BUY that wasn't filled (or was) is always re-checked
+        if time.time() >= decision.expires_at:
+            return "expired"
+        if abs(market_price - decision.market_price) > self.price_tolerance:
+            return "price"
+        hours = hours_until_event(event_time)
+        if hours is not None and hours <= self.refresh_hours:
+            return "event close"
+        return None
+
+    def prune(self):
+        """Drop decisions whose context has expired"""
+        now = time.time()
+        with self._lock:
+            for token in [t for t, d in self._decisions.items() if d.expires_at <= now]:
+                del self._decisions[token]
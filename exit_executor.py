@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Batched exit executor shared by the profit-taking and redeem bots
+Collects every sell decision from a scan, signs the orders concurrently and
+submits them through the CLOB multi-order endpoint in chunks, so a burst of
+exits costs about one round trip instead of one per position.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from py_clob_client.clob_types import OrderArgs, OrderType, PostOrdersArgs
+from py_clob_client.order_builder.constants import SELL
+
+MAX_ORDERS_PER_BATCH = 15  # CLOB limit for POST /orders
+SIGN_WORKERS = 8
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ExitOrder:
+    token_id: str
+    shares: float
+    price: float
+    meta: Dict = field(default_factory=dict)  # caller context, carried through to the ledger
+    order_id: Optional[str] = None
+    status: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.order_id is not None and self.error is None
+
+
+class ExitExecutor:
+    """Queue sells during a scan with add(), then submit them all with flush()"""
+
+    def __init__(self, client, order_type=OrderType.GTC, batch_size=MAX_ORDERS_PER_BATCH):
+        self.client = client
+        self.order_type = order_type
+        self.batch_size = batch_size
+        self._pending: List[ExitOrder] = []
+
+    def __len__(self):
+        return len(self._pending)
+
+    def pending(self) -> List[ExitOrder]:
+        return list(self._pending)
+
+    def add(self, token_id: str, shares: float, price: float, **meta) -> ExitOrder:
+        order = ExitOrder(token_id=str(token_id), shares=shares, price=price, meta=meta)
+        self._pending.append(order)
+        return order
+
+    def _sign(self, order: ExitOrder):
+        try:
+            return self.client.create_order(OrderArgs(
+                token_id=order.token_id,
+                price=order.price,
+                size=order.shares,
+                side=SELL,
+                fee_rate_bps=0,
+                nonce=0
+            ))
+        except Exception as e:
+            order.error = f"sign failed: {e}"
+            return None
+
+    def flush(self) -> List[ExitOrder]:
+        """Sign and post every queued order. Returns them in queue order with results filled in."""
+        orders, self._pending = self._pending, []
+        if not orders:
+            return []
+
+        # Signing may need tick-size / neg-risk lookups per token - do it in parallel
+        with ThreadPoolExecutor(max_workers=min(SIGN_WORKERS, len(orders))) as pool:
+            signed = list(pool.map(self._sign, orders))
+
+        ready = [(order, s) for order, s in zip(orders, signed) if s is not None]
+        for start in range(0, len(ready), self.batch_size):
+            chunk = ready[start:start + self.batch_size]
+            try:
+                results = self.client.post_orders([
+                    PostOrdersArgs(order=s, orderType=self.order_type) for _, s in chunk
+                ])
+            except Exception as e:
+                for order, _ in chunk:
+                    order.error = f"post failed: {e}"
+                continue
+
+            if not isinstance(results, list) or len(results) != len(chunk):
+                for order, _ in chunk:
+                    order.error = f"unexpected batch response: {str(results)[:200]}"
+                continue
+
+            # Responses come back in submission order
+            for (order, _), result in zip(chunk, results):
+                if result.get("success", True) and result.get("orderID") and not result.get("errorMsg"):
+                    order.order_id = result["orderID"]
+                    order.status = result.get("status")
+                else:
+                    order.error = result.get("errorMsg") or "rejected"
+
+        logger.info(f"   📤 Exit batch: {sum(o.ok for o in orders)}/{len(orders)} orders accepted "
+                    f"in {-(-len(ready) // self.batch_size)} request(s)")
+        return orders
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Compiled keyword classifier
+Keyword lists are compiled once into a single trie-shaped regex, and a
+question is classified in one pass over its text. The result matches
+`any(k in text.lower() for k in keywords)` evaluated list by list, in
+priority order, but the keyword lists aren't walked once per question.
+Keywords are case-insensitive. Results can be memoised per market id,
+so a market is classified only once no matter how many scans see it.
+"""
+
+import argparse
+import random
+import re
+import time
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """Regex matching any of words, factored by common prefix so each position costs one branch per character"""
+    root: Dict[str, dict] = {}
+    for word in words:
+        node = root
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}  # end of a word
+
+    def emit(node):
+        branches = [re.escape(char) + emit(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return emit(root)
+
+
+class KeywordMatcher:
+    def __init__(self, categories: Sequence[Tuple[str, Iterable[str]]], default: str = "OTHER"):
+        """categories: (name, keywords) in priority order - a text with hits in several
+        categories gets the first one"""
+        self.default = default
+        self._rank: Dict[str, int] = {}  # keyword: index of the first category listing it
+        self._names = [name for name, _ in categories]
+        for rank, (_, keywords) in enumerate(categories):
+            for keyword in keywords:
+                self._rank.setdefault(keyword.lower(), rank)
+
+        # The regex reports the longest keyword starting at each position; a keyword that is
+        # a prefix of it (e.g. "god" in "godzilla") may outrank it, so fold those ranks in
+        for keyword in sorted(self._rank, key=len):
+            for end in range(1, len(keyword)):
+                prefix_rank = self._rank.get(keyword[:end])
+                if prefix_rank is not None and prefix_rank < self._rank[keyword]:
+                    self._rank[keyword] = prefix_rank
+
+        # Zero-width lookahead so overlapping keywords are all seen, not consumed by an earlier hit
+        self._pattern = re.compile(f"(?=({_trie_pattern(self._rank)}))") if self._rank else None
+        self._memo: Dict[str, Tuple[str, str]] = {}  # market id: (text, category)
+
+    def classify(self, text: str) -> str:
+        if self._pattern is None:
+            return self.default
+        best = len(self._names)
+        for match in self._pattern.finditer(text.lower()):
+            rank = self._rank[match.group(1)]
+            if rank < best:
+                best = rank
+                if best == 0:
+                    break
+        return self._names[best] if best < len(self._names) else self.default
+
+    def classify_cached(self, key: Optional[str], text: str) -> str:
+        """classify(text), memoised under key (e.g. a market id) for as long as the text is unchanged"""
+        if not key:
+            return self.classify(text)
+        cached = self._memo.get(key)
+        if cached is not None and cached[0] == text:
+            return cached[1]
+        category = self.classify(text)
+        self._memo[key] = (text, category)
+        return category
+
+    def retain(self, keys: Iterable[str]):
+        """Forget memoised results for keys not in keys (markets that have closed)"""
+        keys = set(keys)
+        for key in [k for k in self._memo if k not in keys]:
+            del self._memo[key]
+
+
+# ============================================================================
+# BENCHMARK
+# ============================================================================
+
+def _naive(categories, default):
+    """The list-by-list substring scan KeywordMatcher replaces"""
+    lowered = [(name, [k.lower() for k in keywords]) for name, keywords in categories]
+
+    def classify(text):
+        q = text.lower()
+        for name, keywords in lowered:
+            if any(k in q for k in keywords):
+                return name
+        return default
+    return classify
+
+
+def benchmark(n_questions=10000, seed=7):
+    """Synthetic questions through a naive scan, the compiled matcher and the memo"""
+    rng = random.Random(seed)
+    syllables = ["ba", "ce", "di", "fo", "gu", "ha", "je", "ki", "lo", "mu", "na", "pe", "ri", "so", "tu", "vy"]
+    vocab = sorted({"".join(rng.choice(syllables) for _ in range(rng.randint(2, 5))) for _ in range(5000)})
+    keywords = rng.sample([w for w in vocab if len(w) >= 6], 110)
+    categories = [("ABSURD", keywords[:30]), ("SPORTS", keywords[30:] + ["vs", " v ", "o/u"])]
+    vocab += ["will", "the", "by", "end", "of", "vs", "over", "under", "2026", "price", "reach"] * 50
+    questions = [" ".join(rng.choice(vocab) for _ in range(rng.randint(6, 16))) + "?"
+                 for _ in range(n_questions)]
+
+    naive = _naive(categories, "OTHER")
+    start = time.perf_counter()
+    expected = [naive(q) for q in questions]
+    naive_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matcher = KeywordMatcher(categories)
+    compile_time = time.perf_counter() - start
+    start = time.perf_counter()
+    got = [matcher.classify(q) for q in questions]
+    compiled_time = time.perf_counter() - start
+
+    for i, q in enumerate(questions):
+        matcher.classify_cached(str(i), q)
+    start = time.perf_counter()
+    for i, q in enumerate(questions):
+        matcher.classify_cached(str(i), q)
+    memo_time = time.perf_counter() - start
+
+    mismatches = sum(a != b for a, b in zip(expected, got))
+    counts = {name: got.count(name) for name in dict.fromkeys(got)}
+    print(f"{n_questions:,} questions, {sum(len(k) for _, k in categories)} keywords: {counts}")
+    print(f"   naive scan:  {naive_time * 1e3:7.1f} ms")
+    print(f"   compiled:    {compiled_time * 1e3:7.1f} ms  (+{compile_time * 1e3:.1f} ms to compile)")
+    print(f"   memoised:    {memo_time * 1e3:7.1f} ms  (repeat scan)")
+    print(f"   mismatches:  {mismatches}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the compiled keyword matcher")
+    parser.add_argument("--questions", type=int, default=10000)
+    args = parser.parse_args()
+    benchmark(args.questions)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+Embedded trade ledger for the profit-taking bot
+SQLite in WAL mode with indexed purchases / sales tables. Each write is a
+single-row statement, and writes inside ledger.batch() share one transaction,
+so the cost of a write no longer grows with the size of the history. Every
+thread gets its own connection, so a batch only ever holds its own thread's
+writes - a fill recorded elsewhere commits on its own.
+
+Every sale also updates running rollups (overall, per day, per market) in
+O(1). Sales from closed days are moved out of the database into gzip JSONL
+segments, one per day, which historical queries read lazily.
+"""
+
+import glob
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+
+logger = logging.getLogger(__name__)
+
+BUSY_TIMEOUT = 30  # Seconds a write waits on another thread's open batch
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS purchases (
+    token_id  TEXT PRIMARY KEY,
+    buy_price REAL NOT NULL,
+    shares    REAL NOT NULL,
+    timestamp TEXT NOT NULL,
+    source    TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_purchases_timestamp ON purchases (timestamp);
+
+CREATE TABLE IF NOT EXISTS sales (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    token_id   TEXT NOT NULL,
+    buy_price  REAL NOT NULL,
+    sell_price REAL NOT NULL,
+    shares     REAL NOT NULL,
+    pnl        REAL NOT NULL,
+    pnl_pct    REAL NOT NULL,
+    timestamp  TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sales_token_id ON sales (token_id);
+CREATE INDEX IF NOT EXISTS idx_sales_timestamp ON sales (timestamp);
+
+CREATE TABLE IF NOT EXISTS asset_basis (
+    asset    TEXT PRIMARY KEY,
+    bought   REAL NOT NULL,
+    cost     REAL NOT NULL,
+    sold     REAL NOT NULL,
+    proceeds REAL NOT NULL
+);
+
+-- Running aggregates; scope is 'all', 'day' (key = YYYY-MM-DD) or 'market' (key = token_id)
+CREATE TABLE IF NOT EXISTS rollups (
+    scope        TEXT NOT NULL,
+    key          TEXT NOT NULL,
+    pnl          REAL NOT NULL,
+    sales        INTEGER NOT NULL,
+    wins         INTEGER NOT NULL,
+    losses       INTEGER NOT NULL,
+    hold_seconds REAL NOT NULL,
+    held_sales   INTEGER NOT NULL,  -- sales with a known open time (denominator for avg hold)
+    PRIMARY KEY (scope, key)
+);
+
+-- Negative cache: tokens the scan skips until expires_at (unix time)
+CREATE TABLE IF NOT EXISTS skip_tokens (
+    token_id   TEXT PRIMARY KEY,
+    reason     TEXT NOT NULL,
+    added_at   REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_skip_tokens_expires_at ON skip_tokens (expires_at);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+PURCHASE_FIELDS = ("buy_price", "shares", "timestamp", "source")
+SALE_FIELDS = ("token_id", "buy_price", "sell_price", "shares", "pnl", "pnl_pct", "timestamp")
+BASIS_FIELDS = ("bought", "cost", "sold", "proceeds")
+ROLLUP_FIELDS = ("pnl", "sales", "wins", "losses", "hold_seconds", "held_sales")
+
+ROLLUP_UPSERT = """
+INSERT INTO rollups (scope, key, pnl, sales, wins, losses, hold_seconds, held_sales)
+VALUES (?, ?, ?, 1, ?, ?, ?, ?)
+ON CONFLICT (scope, key) DO UPDATE SET
+    pnl = pnl + excluded.pnl,
+    sales = sales + 1,
+    wins = wins + excluded.wins,
+    losses = losses + excluded.losses,
+    hold_seconds = hold_seconds + excluded.hold_seconds,
+    held_sales = held_sales + excluded.held_sales
+"""
+
+
+def _hold_seconds(opened_at, closed_at):
+    try:
+        return max((datetime.fromisoformat(closed_at) - datetime.fromisoformat(opened_at)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class Ledger:
+    def __init__(self, path, archive_dir=None):
+        self.path = path
+        self.archive_dir = archive_dir
+        self._local = threading.local()  # per thread: conn, batch_depth
+        conn = self._conn
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        if not self.get_meta("rollups_built"):
+            self.rebuild_rollups()
+
+    @property
+    def _conn(self):
+        """This thread's connection, opened on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode - transactions are opened explicitly by batch(). A writer
+            # waits up to BUSY_TIMEOUT for another thread's batch to commit.
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.batch_depth = 0
+        return conn
+
+    @contextmanager
+    def batch(self):
+        """Group this thread's writes inside the block into one transaction. Nested batches
+        are savepoints, so a failing inner block rolls back only its own writes.
+        Keep batches short - other threads' writes wait for them."""
+        conn = self._conn
+        depth = self._local.batch_depth
+        conn.execute("BEGIN IMMEDIATE" if depth == 0 else f"SAVEPOINT batch_{depth}")
+        self._local.batch_depth = depth + 1
+        try:
+            yield self
+        except BaseException:
+            conn.execute("ROLLBACK" if depth == 0 else f"ROLLBACK TO batch_{depth}")
+            if depth:
+                conn.execute(f"RELEASE batch_{depth}")
+            raise
+        else:
+            conn.execute("COMMIT" if depth == 0 else f"RELEASE batch_{depth}")
+        finally:
+            self._local.batch_depth = depth
+
+    def _execute(self, sql, params=()):
+        return self._conn.execute(sql, params)
+
+    def _executemany(self, sql, rows):
+        return self._conn.executemany(sql, rows)
+
+    # -- purchases ---------------------------------------------------------
+
+    def load_purchases(self):
+        rows = self._execute("SELECT * FROM purchases").fetchall()
+        purchases = {}
+        for row in rows:
+            purchase = {k: row[k] for k in PURCHASE_FIELDS}
+            if purchase["source"] is None:
+                del purchase["source"]
+            purchases[row["token_id"]] = purchase
+        return purchases
+
+    def upsert_purchase(self, token_id, purchase):
+        self._execute(
+            "INSERT OR REPLACE INTO purchases (token_id, buy_price, shares, timestamp, source) VALUES (?, ?, ?, ?, ?)",
+            (str(token_id), purchase["buy_price"], purchase["shares"], purchase["timestamp"], purchase.get("source"))
+        )
+
+    def delete_purchase(self, token_id):
+        self._execute("DELETE FROM purchases WHERE token_id = ?", (str(token_id),))
+
+    # -- sales -------------------------------------------------------------
+
+    def add_sale(self, sale, opened_at=None):
+        """Insert a sale and fold it into the rollups. opened_at: ISO time the position was opened."""
+        with self.batch():
+            self._execute(
+                f"INSERT INTO sales ({', '.join(SALE_FIELDS)}) VALUES ({', '.join('?' * len(SALE_FIELDS))})",
+                tuple(sale[k] for k in SALE_FIELDS)
+            )
+            self._update_rollups(sale, _hold_seconds(opened_at, sale["timestamp"]))
+
+    def _update_rollups(self, sale, hold_seconds):
+        pnl = float(sale["pnl"])
+        values = (pnl, int(pnl > 0), int(pnl < 0), hold_seconds or 0.0, int(hold_seconds is not None))
+        self._executemany(ROLLUP_UPSERT, [
+            ("all", "", *values),
+            ("day", str(sale["timestamp"])[:10], *values),
+            ("market", str(sale["token_id"]), *values),
+        ])
+
+    def sales(self, token_id=None, since=None, until=None):
+        """Sales, oldest first, optionally filtered by token and ISO timestamp range"""
+        clauses, params = [], []
+        if token_id is not None:
+            clauses.append("token_id = ?")
+            params.append(str(token_id))
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._execute(f"SELECT * FROM sales {where} ORDER BY timestamp, id", params).fetchall()
+        return [{k: row[k] for k in SALE_FIELDS} for row in rows]
+
+    # -- rollups -----------------------------------------------------------
+
+    def rollups(self, scope, key=None):
+        """Rollup rows for a scope as {key: {pnl, sales, wins, losses, hold_seconds, held_sales}}"""
+        if key is None:
+            rows = self._execute("SELECT * FROM rollups WHERE scope = ? ORDER BY key", (scope,)).fetchall()
+        else:
+            rows = self._execute("SELECT * FROM rollups WHERE scope = ? AND key = ?", (scope, str(key))).fetchall()
+        return {row["key"]: {k: row[k] for k in ROLLUP_FIELDS} for row in rows}
+
+    def stats(self):
+        """All-time totals: P&L, sale count, win rate and average hold time"""
+        totals = self.rollups("all").get("", dict.fromkeys(ROLLUP_FIELDS, 0))
+        decided = totals["wins"] + totals["losses"]
+        return {
+            "pnl": totals["pnl"],
+            "sales": totals["sales"],
+            "win_rate": totals["wins"] / decided if decided else None,
+            "avg_hold_seconds": totals["hold_seconds"] / totals["held_sales"] if totals["held_sales"] else None,
+        }
+
+    def rebuild_rollups(self):
+        """Recompute rollups from scratch (live sales plus archived segments). Hold times are not
+        recoverable for historical sales, so they only count towards P&L and win rate."""
+        with self.batch():
+            self._execute("DELETE FROM rollups")
+            for sale in self.history():
+                self._update_rollups(sale, None)
+            self.set_meta("rollups_built", True)
+
+    # -- archive -----------------------------------------------------------
+
+    def _segment_path(self, day):
+        return os.path.join(self.archive_dir, f"sales-{day}.jsonl.gz")
+
+    def archive_sales(self, before=None):
+        """Move sales from days before `before` (default: today) into per-day gzip segments.
+        Returns the number of sales archived."""
+        if not self.archive_dir:
+            return 0
+        os.makedirs(self.archive_dir, exist_ok=True)
+        cutoff = (before or date.today()).isoformat()
+
+        rows = self._execute(
+            f"SELECT id, {', '.join(SALE_FIELDS)} FROM sales WHERE timestamp < ? ORDER BY timestamp, id", (cutoff,)
+        ).fetchall()
+        by_day = {}
+        for row in rows:
+            by_day.setdefault(row["timestamp"][:10], []).append({k: row[k] for k in ("id",) + SALE_FIELDS})
+
+        for day, sales in by_day.items():
+            path = self._segment_path(day)
+            # Rewrite the whole day atomically; ids make a retried archive idempotent
+            existing = list(self._read_segment(path)) if os.path.exists(path) else []
+            seen = {sale["id"] for sale in existing}
+            merged = existing + [sale for sale in sales if sale["id"] not in seen]
+            tmp = f"{path}.tmp"
+            with gzip.open(tmp, "wt") as f:
+                for sale in merged:
+                    f.write(json.dumps(sale) + "\n")
+            os.replace(tmp, path)
+
+            with self.batch():
+                self._executemany("DELETE FROM sales WHERE id = ?", [(sale["id"],) for sale in sales])
+
+        if rows:
+            logger.info(f"🗄️  Archived {len(rows)} sales into {len(by_day)} daily segment(s)")
+        return len(rows)
+
+    @staticmethod
+    def _read_segment(path):
+        with gzip.open(path, "rt") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def archived_sales(self, since=None, until=None):
+        """Lazily yield archived sales, oldest first. since/until are YYYY-MM-DD (until exclusive);
+        only segments inside the range are opened."""
+        if not self.archive_dir:
+            return
+        for path in sorted(glob.glob(os.path.join(self.archive_dir, "sales-*.jsonl.gz"))):
+            day = os.path.basename(path)[len("sales-"):-len(".jsonl.gz")]
+            if (since and day < since[:10]) or (until and day > until[:10]):
+                continue
+            for sale in self._read_segment(path):
+                if (since and sale["timestamp"] < since) or (until and sale["timestamp"] >= until):
+                    continue
+                sale.pop("id", None)
+                yield sale
+
+    def history(self, since=None, until=None):
+        """Every sale in range - archived segments first, then the live table"""
+        yield from self.archived_sales(since, until)
+        yield from self.sales(since=since, until=until)
+
+    # -- per-asset cost basis (trade history sync) -------------------------
+
+    def load_basis(self):
+        rows = self._execute("SELECT * FROM asset_basis").fetchall()
+        return {row["asset"]: {k: row[k] for k in BASIS_FIELDS} for row in rows}
+
+    def upsert_basis(self, assets):
+        """assets: {asset_id: {bought, cost, sold, proceeds}}"""
+        self._executemany(
+            "INSERT OR REPLACE INTO asset_basis (asset, bought, cost, sold, proceeds) VALUES (?, ?, ?, ?, ?)",
+            [(asset,) + tuple(basis[k] for k in BASIS_FIELDS) for asset, basis in assets.items()]
+        )
+
+    # -- negative cache ----------------------------------------------------
+
+    def load_skips(self, now):
+        """Unexpired skip entries: {token_id: {reason, added_at, expires_at}}"""
+        rows = self._execute("SELECT * FROM skip_tokens WHERE expires_at > ?", (now,)).fetchall()
+        return {row["token_id"]: {k: row[k] for k in ("reason", "added_at", "expires_at")} for row in rows}
+
+    def upsert_skip(self, token_id, reason, added_at, expires_at):
+        self._execute(
+            "INSERT OR REPLACE INTO skip_tokens (token_id, reason, added_at, expires_at) VALUES (?, ?, ?, ?)",
+            (str(token_id), reason, added_at, expires_at)
+        )
+
+    def delete_skips(self, token_ids):
+        self._executemany("DELETE FROM skip_tokens WHERE token_id = ?", [(str(t),) for t in token_ids])
+
+    def purge_expired_skips(self, now):
+        return self._execute("DELETE FROM skip_tokens WHERE expires_at <= ?", (now,)).rowcount
+
+    # -- meta --------------------------------------------------------------
+
+    def get_meta(self, key, default=None):
+        row = self._execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row["value"]) if row else default
+
+    def set_meta(self, key, value):
+        self._execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    # -- migration ---------------------------------------------------------
+
+    def import_json(self, json_path):
+        """One-time import of a legacy profit_taking_trades.json. Returns True if anything was imported."""
+        if self.get_meta("json_imported") or not os.path.exists(json_path):
+            return False
+
+        with open(json_path) as f:
+            legacy = json.load(f)
+
+        with self.batch():
+            for token_id, purchase in legacy.get("purchases", {}).items():
+                self.upsert_purchase(token_id, purchase)
+            for sale in legacy.get("sales", []):
+                self.add_sale({k: sale.get(k, 0) for k in SALE_FIELDS})
+            self.set_meta("total_profit", legacy.get("total_profit", 0.0))
+
+            sync = legacy.get("entry_sync")
+            if sync:
+                self.upsert_basis(sync.get("assets", {}))
+                self.set_meta("entry_sync", {k: v for k, v in sync.items() if k != "assets"})
+
+            self.set_meta("json_imported", json_path)
+
+        logger.info(f"📦 Imported {len(legacy.get('purchases', {}))} purchases and "
+                    f"{len(legacy.get('sales', []))} sales from {json_path}")
+        return True
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Hourly LLM budget
+Caps the LLM calls and tokens spent in any rolling hour. Every completion
+is recorded as it happens. Before a market is analysed, its estimated
+cost is reserved against what the last hour has left, and the
+reservation is released once its calls are done and recorded. A market
+that doesn't fit is deferred to a later scan. Candidates are ranked by
+expected edge, so the budget goes to the most promising markets first.
+"""
+
+import math
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+WINDOW_SECONDS = 3600
+
+
+def edge_priority(liquidity: float, spread_pct: float, mid: float, hours_to_event: Optional[float],
+                  max_spread_pct: float) -> float:
+    """0-4 score for how likely analysing a market is to pay off: deep books, tight spreads, prices
+    near 0.5 (most room for a mispricing both ways) and events soon enough for news to matter"""
+    depth = min(max(math.log10(max(liquidity, 1.0)) - 4, 0.0) / 2, 1.0)  # $10k -> 0, $1M+ -> 1
+    tightness = max(1.0 - spread_pct / max_spread_pct, 0.0)
+    uncertainty = max(1.0 - 2 * abs(mid - 0.5), 0.0)
+    if hours_to_event is None:
+        timing = 0.3
+    elif hours_to_event < 0:
+        timing = 0.5  # in play
+    else:
+        timing = 1.0 / (1.0 + hours_to_event / 48)  # today ~0.7-1, next week ~0.2
+    return depth + tightness + uncertainty + timing
+
+
+class LLMBudget:
+    def __init__(self, calls_per_hour: int, tokens_per_hour: int):
+        self.calls_per_hour = calls_per_hour
+        self.tokens_per_hour = tokens_per_hour
+        self._lock = threading.Lock()
+        self._events = deque()  # (timestamp, tokens) per completed call
+        self._tokens = 0  # sum of tokens in _events
+        self._reserved: Dict[str, Tuple[float, float]] = {}  # key: (calls, tokens) estimated
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.scan_calls = 0
+        self.scan_tokens = 0
+
+    def _prune(self, now):
+        while self._events and self._events[0][0] <= now - WINDOW_SECONDS:
+            self._tokens -= self._events.popleft()[1]
+
+    def record(self, tokens: int):
+        """One LLM call made, using tokens"""
+        now = time.time()
+        with self._lock:
+            self._prune(now)
+            self._events.append((now, tokens))
+            self._tokens += tokens
+            self.scan_calls += 1
+            self.scan_tokens += tokens
+
+    def used(self) -> Tuple[int, int]:
+        """(calls, tokens) spent in the last hour"""
+        with self._lock:
+            self._prune(time.time())
+            return len(self._events), self._tokens
+
+    def reserve(self, key: str, calls: float, tokens: float) -> bool:
+        """Hold an estimated (calls, tokens) for key if the hour has room for it on top of what
+        is spent and already reserved; False means defer"""
+        with self._lock:
+            self._prune(time.time())
+            reserved_calls = sum(c for c, _ in self._reserved.values())
+            reserved_tokens = sum(t for _, t in self._reserved.values())
+            if (len(self._events) + reserved_calls + calls > self.calls_per_hour
+                    or self._tokens + reserved_tokens + tokens > self.tokens_per_hour):
+                return False
+            self._reserved[key] = (calls, tokens)
+            return True
+
+    def release(self, key: str):
+        """Drop key's reservation - its real usage has been recorded by now"""
+        with self._lock:
+            self._reserved.pop(key, None)
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+LLM trade-decision prompts
+Builds the single-market prompt and a packed prompt that asks for decisions
+on several markets in one request. The packed request's reply is held to
+a strict JSON schema, an array with one object per market id. Markets
+whose item is missing or malformed are reported back, so the caller can
+re-ask for them one at a time.
+
+Running this file benchmarks packed against one-by-one decisions. A local
+stand-in model server mimics per-request latency and token usage.
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence, Tuple
+
+ACTIONS = ("BUY", "HOLD")
+
+INTRO = """You are an expert SPORTS prediction market trader with access to real-time context.
+Today's date: {today}
+"""
+
+RULES = """Estimate TRUE probability for YES based on the context.
+BUY only if:
+- fair_value >= market_price + 0.05 (>=5% absolute edge)
+- confidence >= 0.72
+- evidence is concrete (scores, injuries, odds), not vibes
+"""
+
+MARKET_BLOCK = """MARKET: {question}
+YOU ARE EVALUATING: Buying YES outcome tokens.
+
+CURRENT MARKET DATA:
+- Implied YES probability (mid): {mid:.1%}
+- Buy (ask): ${ask:.4f}
+- Sell (bid): ${bid:.4f}
+- Spread: {spread_pct:.1f}%
+- Liquidity: ${liquidity:,.0f}
+- Quote age: {quote_age:.0f}s (prices may have moved since)
+
+REAL-TIME CONTEXT:
+{context}
+"""
+
+SINGLE_FORMAT = """Respond ONLY with JSON:
+{{
+  "action": "BUY or HOLD",
+  "confidence": 0.0-1.0,
+  "fair_value": 0.0-1.0,
+  "market_price": {mid:.4f},
+  "edge": "fair_value - market_price (absolute)",
+  "key_evidence": "top 2-3 concrete data points",
+  "main_risk": "biggest risk",
+  "reasoning": "brief, specific"
+}}
+"""
+
+BATCH_FORMAT = """Judge each market independently, on its own data and context only.
+Respond ONLY with JSON: {{"decisions": [...]}} holding exactly one object per market,
+for ids {ids}, each with: id, action ("BUY" or "HOLD"), confidence (0.0-1.0),
+fair_value (0.0-1.0), key_evidence (top 2-3 concrete data points), main_risk, reasoning (brief).
+"""
+
+_DECISION_ITEM = {
+    "type": "object",
+    "properties": {
+        "id": {"type": "string"},
+        "action": {"type": "string", "enum": list(ACTIONS)},
+        "confidence": {"type": "number"},
+        "fair_value": {"type": "number"},
+        "key_evidence": {"type": "string"},
+        "main_risk": {"type": "string"},
+        "reasoning": {"type": "string"},
+    },
+    "required": ["id", "action", "confidence", "fair_value", "key_evidence", "main_risk", "reasoning"],
+    "additionalProperties": False,
+}
+
+# response_format for packed requests - strict structured output
+BATCH_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "market_decisions",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {"decisions": {"type": "array", "items": _DECISION_ITEM}},
+            "required": ["decisions"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+
+def market_block(question: str, bid: float, ask: float, spread_pct: float, liquidity: float,
+                 quote_age: float, context: str) -> str:
+    return MARKET_BLOCK.format(question=question, mid=(bid + ask) / 2.0, ask=ask, bid=bid,
+                               spread_pct=spread_pct, liquidity=liquidity, quote_age=quote_age,
+                               context=context)
+
+
+def single_prompt(today: str, block: str, mid: float) -> str:
+    return f"{INTRO.format(today=today)}\n{block}\nTASK:\n{RULES}\n{SINGLE_FORMAT.format(mid=mid)}"
+
+
+def batch_prompt(today: str, blocks: Sequence[Tuple[str, str]]) -> str:
+    """blocks: (id, market_block) per market"""
+    markets = "\n".join(f"[{market_id}]\n{block}" for market_id, block in blocks)
+    ids = ", ".join(market_id for market_id, _ in blocks)
+    return (f"{INTRO.format(today=today)}\n{len(blocks)} MARKETS:\n\n{markets}\n"
+            f"TASK (for every market):\n{RULES}\n{BATCH_FORMAT.format(ids=ids)}")
+
+
+def parse_decision(item) -> Optional[Dict]:
+    """A validated decision dict (action upper-cased, numbers as floats in [0, 1]), or None"""
+    if not isinstance(item, dict) or not all(k in item for k in ("action", "confidence", "fair_value")):
+        return None
+    try:
+        action = str(item["action"]).upper()
+        confidence = float(item["confidence"])
+        fair_value = float(item["fair_value"])
+    except (TypeError, ValueError):
+        return None
+    if action not in ACTIONS or not 0 <= confidence <= 1 or not 0 <= fair_value <= 1:
+        return None
+    return {**item, "action": action, "confidence": confidence, "fair_value": fair_value}
+
+
+def parse_batch(content: str, ids: Sequence[str]) -> Dict[str, Dict]:
+    """{id: decision} for every id in ids with exactly one valid item; the rest need a retry"""
+    try:
+        items = json.loads(content).get("decisions")
+    except (ValueError, AttributeError):
+        return {}
+    if not isinstance(items, list):
+        return {}
+    found: Dict[str, List[Dict]] = {}
+    for item in items:
+        decision = parse_decision(item)
+        if decision is not None and str(decision.get("id")) in ids:
+            found.setdefault(str(decision["id"]), []).append(decision)
+    return {market_id: decisions[0] for market_id, decisions in found.items() if len(decisions) == 1}
+
+
+# ============================================================================
+# STAND-IN MODEL SERVER
+# ============================================================================
+
+class StandInModel:
+    """OpenAI-compatible /v1/chat/completions that answers with well-formed random decisions.
+    Each request costs overhead seconds plus a prefill and a decode time per token."""
+
+    def __init__(self, overhead=0.6, prefill_per_token=0.00002, decode_per_token=0.012, malformed_rate=0.0):
+        self.overhead = overhead
+        self.prefill_per_token = prefill_per_token
+        self.decode_per_token = decode_per_token
+        self.malformed_rate = malformed_rate
+        self._rng = random.Random(11)
+        self._rng_lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.base_url = f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _decision(self, market_id=None):
+        with self._rng_lock:
+            decision = {"action": self._rng.choice(ACTIONS), "confidence": round(self._rng.random(), 2),
+                        "fair_value": round(self._rng.random(), 2),
+                        "key_evidence": "Home side unbeaten in 9; away striker ruled out",
+                        "main_risk": "Late lineup change", "reasoning": "Form and availability favour YES"}
+            if market_id is not None:
+                decision["id"] = market_id
+                if self._rng.random() < self.malformed_rate:
+                    decision["fair_value"] = "high"
+        return decision
+
+    def complete(self, body: Dict) -> Dict:
+        prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+        ids = re.findall(r"^\[(\S+)\]$", prompt, re.MULTILINE)
+        if ids:
+            reply = {"decisions": [self._decision(market_id) for market_id in ids]}
+        else:
+            reply = self._decision()
+        content = json.dumps(reply)
+        prompt_tokens, completion_tokens = len(prompt) // 4, len(content) // 4 + 40 * max(1, len(ids))
+        time.sleep(self.overhead + prompt_tokens * self.prefill_per_token + completion_tokens * self.decode_per_token)
+        return {
+            "id": "chatcmpl-stand-in", "object": "chat.completion", "created": int(time.time()),
+            "model": body.get("model", "stand-in"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    def _handler(self):
+        model = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                payload = json.dumps(model.complete(body)).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+# ============================================================================
+# BENCHMARK
+# ============================================================================
+
+# gpt-4o list prices, USD per million tokens
+INPUT_PRICE = 2.50
+OUTPUT_PRICE = 10.00
+
+
+def benchmark(n_markets=24, batch_size=4, concurrency=4, malformed_rate=0.05):
+    """One-by-one vs packed decisions for n_markets against the stand-in server"""
+    from concurrent.futures import ThreadPoolExecutor
+    from openai import OpenAI
+
+    rng = random.Random(5)
+    today = time.strftime("%B %d, %Y")
+    context = ("Recent form: W W D L W (scores 2-1, 3-0, 1-1, 0-2, 2-0). Key injuries: starting keeper "
+               "questionable. Bookmaker odds 1.85 / 3.60 / 4.20 (implied 54% / 28% / 24%). ") * 8
+    markets = []
+    for n in range(n_markets):
+        bid = round(rng.uniform(0.25, 0.75), 2)
+        markets.append((f"m{n + 1}", market_block(f"Will Team {n} win on Saturday?", bid, bid + 0.01,
+                                                  1.5, 80000, 4, context), bid + 0.005))
+
+    def run(label, groups, model):
+        client = OpenAI(base_url=model.base_url, api_key="stand-in")
+        usage = {"requests": 0, "prompt": 0, "completion": 0, "retries": 0}
+        lock = threading.Lock()
+
+        def call(prompt, response_format):
+            resp = client.chat.completions.create(model="gpt-4o", messages=[{"role": "user", "content": prompt}],
+                                                  response_format=response_format, temperature=0.2)
+            with lock:
+                usage["requests"] += 1
+                usage["prompt"] += resp.usage.prompt_tokens
+                usage["completion"] += resp.usage.completion_tokens
+            return resp.choices[0].message.content
+
+        def decide(group):
+            if len(group) == 1:
+                _, block, mid = group[0]
+                return [parse_decision(json.loads(call(single_prompt(today, block, mid), {"type": "json_object"})))]
+            ids = [market_id for market_id, _, _ in group]
+            found = parse_batch(call(batch_prompt(today, [(i, b) for i, b, _ in group]), BATCH_RESPONSE_FORMAT), ids)
+            missing = [market for market in group if market[0] not in found]
+            with lock:
+                usage["retries"] += len(missing)
+            return list(found.values()) + [decision for market in missing for decision in decide([market])]
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            decisions = [d for result in pool.map(decide, groups) for d in result]
+        elapsed = time.perf_counter() - start
+        cost = (usage["prompt"] * INPUT_PRICE + usage["completion"] * OUTPUT_PRICE) / 1e6
+        print(f"   {label:<12} {len(decisions):3d} decisions  {usage['requests']:3d} requests  "
+              f"{elapsed:6.2f}s  {len(decisions) / elapsed:5.2f} decisions/s  "
+              f"{(usage['prompt'] + usage['completion']) / len(decisions):6.0f} tokens/decision  "
+              f"${cost / len(decisions) * 1000:.2f} per 1k decisions  ({usage['retries']} retried singly)")
+
+    print(f"{n_markets} markets, {concurrency} concurrent requests, packs of {batch_size}, "
+          f"{malformed_rate:.0%} malformed items")
+    with StandInModel(malformed_rate=malformed_rate) as model:
+        run("one-by-one", [[m] for m in markets], model)
+        run("packed", [markets[i:i + batch_size] for i in range(0, len(markets), batch_size)], model)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark packed vs one-by-one LLM decisions on a stand-in model")
+    parser.add_argument("--markets", type=int, default=24)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--malformed-rate", type=float, default=0.05, help="share of packed items made invalid")
+    args = parser.parse_args()
+    benchmark(args.markets, args.batch_size, args.concurrency, args.malformed_rate)
+
+
+if __name__ == "__main__":
+    main()
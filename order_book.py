@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Local L2 order-book mirror
+Keeps a full bid/ask ladder per token from a snapshot (REST or the market
+channel's "book" event) plus incremental price_change updates, and prices an
+exit against real depth: the executable VWAP, fillable size and the limit
+price needed to take it, in one walk over the levels it touches.
+"""
+
+import bisect
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+from py_clob_client.clob_types import BookParams
+
+SNAPSHOT_BATCH_SIZE = 50  # Tokens per POST /books request
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ExitQuote:
+    shares: float       # size we asked to sell
+    filled: float       # size the visible bids can absorb
+    vwap: float         # average price over the filled size
+    limit_price: float  # worst bid level touched - a SELL limit here takes all of `filled`
+    best_bid: float
+    levels: int         # number of bid levels consumed
+
+    @property
+    def complete(self) -> bool:
+        return self.filled >= self.shares - 1e-9
+
+
+class OrderBook:
+    """One token's ladder. Prices are kept sorted so the walk from the top is O(levels touched)."""
+
+    def __init__(self, asset_id: str, source: str):
+        self.asset_id = asset_id
+        self.source = source            # "ws" (kept current by the stream) or "rest" (point-in-time)
+        self.updated_at = time.time()
+        self._sizes = {"BUY": {}, "SELL": {}}   # side: {price: size}
+        self._prices = {"BUY": [], "SELL": []}  # side: sorted ascending prices
+
+    def load(self, bids, asks):
+        for side, levels in (("BUY", bids), ("SELL", asks)):
+            sizes = {}
+            for level in levels or []:
+                price, size = _level(level)
+                if size > 0:
+                    sizes[price] = size
+            self._sizes[side] = sizes
+            self._prices[side] = sorted(sizes)
+        self.updated_at = time.time()
+
+    def set_level(self, side: str, price: float, size: float):
+        """Absolute size at a level (0 removes it), as carried by price_change events"""
+        sizes, prices = self._sizes[side], self._prices[side]
+        if size > 0:
+            if price not in sizes:
+                bisect.insort(prices, price)
+            sizes[price] = size
+        elif price in sizes:
+            del sizes[price]
+            del prices[bisect.bisect_left(prices, price)]
+        self.updated_at = time.time()
+
+    def best_bid(self) -> Optional[float]:
+        prices = self._prices["BUY"]
+        return prices[-1] if prices else None
+
+    def best_ask(self) -> Optional[float]:
+        prices = self._prices["SELL"]
+        return prices[0] if prices else None
+
+    def sell_quote(self, shares: float) -> Optional[ExitQuote]:
+        """Walk the bids from the top until `shares` are absorbed. None if there are no bids."""
+        prices, sizes = self._prices["BUY"], self._sizes["BUY"]
+        if not prices:
+            return None
+        remaining = shares
+        notional = 0.0
+        levels = 0
+        limit_price = prices[-1]
+        for price in reversed(prices):
+            if remaining <= 1e-9:
+                break
+            take = min(sizes[price], remaining)
+            notional += take * price
+            remaining -= take
+            limit_price = price
+            levels += 1
+        filled = shares - max(remaining, 0.0)
+        return ExitQuote(
+            shares=shares,
+            filled=filled,
+            vwap=notional / filled if filled > 0 else 0.0,
+            limit_price=limit_price,
+            best_bid=prices[-1],
+            levels=levels
+        )
+
+
+def _level(level):
+    """(price, size) from a dict level or an OrderSummary"""
+    if isinstance(level, dict):
+        return float(level["price"]), float(level["size"])
+    return float(level.price), float(level.size)
+
+
+class BookMirror:
+    """Order books for every held token, shared by the scan and the live trigger engine"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._books: Dict[str, OrderBook] = {}
+
+    def streamed(self, asset_id: str) -> bool:
+        """True if the book is being kept current by the market channel"""
+        with self._lock:
+            book = self._books.get(str(asset_id))
+            return book is not None and book.source == "ws"
+
+    def retain(self, asset_ids: Iterable[str]):
+        """Drop books for tokens no longer held"""
+        keep = {str(a) for a in asset_ids}
+        with self._lock:
+            for asset_id in list(self._books):
+                if asset_id not in keep:
+                    del self._books[asset_id]
+
+    def quote(self, asset_id: str, shares: float) -> Optional[ExitQuote]:
+        with self._lock:
+            book = self._books.get(str(asset_id))
+            return book.sell_quote(shares) if book else None
+
+    def best_bid(self, asset_id: str) -> Optional[float]:
+        with self._lock:
+            book = self._books.get(str(asset_id))
+            return book.best_bid() if book else None
+
+    # -- feeds -------------------------------------------------------------
+
+    def handle(self, event: Dict):
+        """Market channel callback: apply book snapshots and price_change updates"""
+        event_type = event.get("event_type")
+        if event_type == "book":
+            book = OrderBook(str(event["asset_id"]), source="ws")
+            book.load(event.get("bids", event.get("buys")), event.get("asks", event.get("sells")))
+            with self._lock:
+                self._books[book.asset_id] = book
+        elif event_type == "price_change":
+            changes = event.get("price_changes")
+            if changes is None:
+                # Older message shape: one asset per event with a "changes" list
+                changes = [dict(c, asset_id=event.get("asset_id")) for c in event.get("changes", [])]
+            with self._lock:
+                for change in changes:
+                    book = self._books.get(str(change.get("asset_id")))
+                    if book is None:
+                        continue  # no snapshot yet - the next "book" event brings the full ladder
+                    book.set_level(str(change["side"]).upper(), float(change["price"]), float(change["size"]))
+
+    def load_snapshots(self, client, asset_ids: List[str]):
+        """Fetch REST snapshots for the given tokens, batched. Tokens without a book are skipped."""
+        asset_ids = [str(a) for a in asset_ids]
+        loaded = 0
+        for start in range(0, len(asset_ids), SNAPSHOT_BATCH_SIZE):
+            chunk = asset_ids[start:start + SNAPSHOT_BATCH_SIZE]
+            try:
+                summaries = client.get_order_books([BookParams(token_id=a) for a in chunk])
+            except Exception as e:
+                # One resolved market can fail the whole batch - fall back to one request per token
+                logger.debug(f"   Batch book fetch failed ({e}), fetching {len(chunk)} books individually")
+                summaries = []
+                for asset_id in chunk:
+                    try:
+                        summaries.append(client.get_order_book(asset_id))
+                    except Exception:
+                        pass
+
+            for summary in summaries:
+                book = OrderBook(str(summary.asset_id), source="rest")
+                book.load(summary.bids, summary.asks)
+                with self._lock:
+                    self._books[book.asset_id] = book
+                loaded += 1
+        return loaded
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Live order and balance tracker fed by the CLOB user channel
+Keeps our open orders, the shares they lock and the shares available per
+token up to date from order placement / update / cancellation events, and
+reports every fill (including partial fills) as it happens.
+"""
+
+import logging
+import threading
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class OrderTracker:
+    def __init__(self, owner: str, on_fill: Optional[Callable] = None):
+        """owner: our CLOB API key - user channel events carry it as 'owner'.
+        on_fill(order, filled_shares, price) is called for every fill increment."""
+        self.owner = owner
+        self.on_fill = on_fill
+        self._lock = threading.RLock()
+        self._orders: Dict[str, Dict] = {}    # order_id: {asset_id, side, price, original_size, size_matched}
+        self._locked: Dict[str, float] = {}   # asset_id: shares locked in open SELL orders
+        self._balances: Dict[str, float] = {}  # asset_id: shares held
+
+    # -- state -------------------------------------------------------------
+
+    def seed(self, open_orders, lookup: Optional[Callable] = None):
+        """Replace tracked open orders with a REST snapshot (on connect / reconnect). Fills that
+        happened since the last event are reported: matched size that grew in the snapshot, and
+        for tracked orders the snapshot no longer lists, the final state from lookup(order_id)."""
+        fills = []
+        with self._lock:
+            previous = self._orders
+            snapshot = {order.get("id"): order for order in open_orders if order.get("id")}
+            self._orders = {}
+            self._locked.clear()
+            for order_id, order in snapshot.items():
+                known = previous.get(order_id)
+                # Re-track at the size we had seen matched, then apply whatever matched since
+                self._track(dict(order, size_matched=known["size_matched"]) if known else order)
+                if known:
+                    fills.append(self._match(order_id, order.get("size_matched")))
+            gone = {order_id: order for order_id, order in previous.items() if order_id not in snapshot}
+
+        # Orders that left the book while we weren't listening: filled, or cancelled
+        for order_id, order in gone.items():
+            final = None
+            if lookup is not None:
+                try:
+                    final = lookup(order_id)
+                except Exception as e:
+                    logger.warning(f"   ⚠️  Couldn't look up order {order_id[:16]}...: {e}")
+            if not final:
+                continue
+            with self._lock:
+                self._track(dict(order, id=order_id))
+                fills.append(self._match(order_id, final.get("size_matched")))
+                self._untrack(order_id)
+
+        fills = [fill for fill in fills if fill]
+        logger.info(f"   📒 Order tracker seeded with {len(open_orders)} open orders"
+                    f"{f', {len(fills)} missed fills' if fills else ''}")
+        if self.on_fill:
+            for fill in fills:
+                self.on_fill(*fill)
+
+    def set_balance(self, asset_id: str, shares: float):
+        """Authoritative balance from the chain; fills adjust it incrementally afterwards"""
+        with self._lock:
+            self._balances[str(asset_id)] = shares
+
+    def locked(self, asset_id: str) -> float:
+        with self._lock:
+            return self._locked.get(str(asset_id), 0.0)
+
+    def available(self, asset_id: str) -> Optional[float]:
+        """Held minus locked shares, or None if the balance has never been set"""
+        with self._lock:
+            balance = self._balances.get(str(asset_id))
+            if balance is None:
+                return None
+            return max(balance - self._locked.get(str(asset_id), 0.0), 0.0)
+
+    def open_orders(self, asset_id: Optional[str] = None):
+        with self._lock:
+            return [dict(order, id=order_id) for order_id, order in self._orders.items()
+                    if asset_id is None or order["asset_id"] == str(asset_id)]
+
+    def placed(self, order_id: str, asset_id: str, side: str, price: float, size: float):
+        """Track an order we just posted without waiting for its PLACEMENT event"""
+        with self._lock:
+            if order_id not in self._orders:
+                self._track({"id": order_id, "asset_id": asset_id, "side": side,
+                             "price": price, "original_size": size, "size_matched": 0})
+
+    def cancelled(self, order_ids):
+        """Release orders we just cancelled without waiting for their CANCELLATION events"""
+        with self._lock:
+            for order_id in order_ids:
+                self._untrack(order_id)
+
+    # -- events ------------------------------------------------------------
+
+    def _track(self, order):
+        order_id = order.get("id")
+        if not order_id:
+            return
+        tracked = {
+            "asset_id": str(order.get("asset_id")),
+            "side": str(order.get("side", "")).upper(),
+            "price": float(order.get("price", 0) or 0),
+            "original_size": float(order.get("original_size", 0) or 0),
+            "size_matched": float(order.get("size_matched", 0) or 0),
+        }
+        self._orders[order_id] = tracked
+        if tracked["side"] == "SELL":
+            remaining = tracked["original_size"] - tracked["size_matched"]
+            self._locked[tracked["asset_id"]] = self._locked.get(tracked["asset_id"], 0.0) + remaining
+
+    def _untrack(self, order_id):
+        order = self._orders.pop(order_id, None)
+        if order and order["side"] == "SELL":
+            remaining = order["original_size"] - order["size_matched"]
+            asset = order["asset_id"]
+            self._locked[asset] = max(self._locked.get(asset, 0.0) - remaining, 0.0)
+
+    def _match(self, order_id, size_matched):
+        """Advance a tracked order to size_matched; the (order, filled, price) fill, or None"""
+        order = self._orders[order_id]
+        matched = float(size_matched or 0)
+        delta = matched - order["size_matched"]
+        if delta <= 0:
+            return None
+        order["size_matched"] = matched
+        asset = order["asset_id"]
+        if order["side"] == "SELL":
+            self._locked[asset] = max(self._locked.get(asset, 0.0) - delta, 0.0)
+            if asset in self._balances:
+                self._balances[asset] = max(self._balances[asset] - delta, 0.0)
+        elif asset in self._balances:
+            self._balances[asset] += delta
+        return dict(order, id=order_id), delta, order["price"]
+
+    def handle(self, event: Dict):
+        """User channel callback"""
+        if event.get("event_type") != "order":
+            return
+        if event.get("owner") and self.owner and event["owner"] != self.owner:
+            return
+
+        order_id = event.get("id")
+        kind = str(event.get("type", "")).upper()
+        fill = None
+        with self._lock:
+            if kind == "PLACEMENT":
+                if order_id not in self._orders:
+                    self._track(event)
+            elif kind == "UPDATE":
+                if order_id not in self._orders:
+                    self._track(dict(event, size_matched=0))
+                fill = self._match(order_id, event.get("size_matched"))
+                order = self._orders[order_id]
+                if order["size_matched"] >= order["original_size"] - 1e-9:
+                    self._untrack(order_id)
+            elif kind == "CANCELLATION":
+                self._untrack(order_id)
+
+        if fill and self.on_fill:
+            self.on_fill(*fill)
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Staged producer/consumer pipeline
+Items flow through stages, each a fixed-size worker pool, joined by bounded
+queues, so a slow stage backs pressure up to the producer instead of letting
+work pile up. Results reach a single writer in input order, so side effects
+like placing orders stay serial and deterministic. Log output from an item's
+stages is buffered and emitted with its result, so it never interleaves.
+"""
+
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, List, Optional
+
+_DONE = object()  # end-of-stream marker passed down the stage queues
+
+# ============================================================================
+# LOG BUFFERING
+# ============================================================================
+
+_log_buffer = threading.local()
+
+
+class _BufferingFilter(logging.Filter):
+    """Divert records from threads with an active buffer instead of emitting them"""
+
+    def filter(self, record):
+        records = getattr(_log_buffer, "records", None)
+        if records is None:
+            return True
+        records.append(record)
+        return False
+
+
+def install_log_buffering(logger: logging.Logger):
+    """Let capture_logs() buffer this logger's records (idempotent)"""
+    if not any(isinstance(f, _BufferingFilter) for f in logger.filters):
+        logger.addFilter(_BufferingFilter())
+
+
+@contextmanager
+def capture_logs(records: List[logging.LogRecord]):
+    """Collect this thread's records into records instead of emitting them, for the block"""
+    _log_buffer.records = records
+    try:
+        yield records
+    finally:
+        _log_buffer.records = None
+
+
+def flush_log_records(logger: logging.Logger, records: Iterable[logging.LogRecord]):
+    """Emit buffered records through the logger's normal handlers"""
+    for record in records:
+        logger.handle(record)
+
+
+class RateLimiter:
+    """Token bucket shared by every thread calling one API"""
+
+    def __init__(self, per_minute: float, burst: Optional[int] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = float(burst if burst is not None else max(1, int(per_minute // 10)))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited = 0.0  # total seconds callers spent blocked
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self.rate
+            self.waited += delay
+            time.sleep(delay)
+
+
+@dataclass
+class Stage:
+    name: str
+    fn: Callable[[Any], Any]  # returns the item for the next stage, or None to drop it
+    workers: int
+    # With batch_size set, fn takes a list of up to batch_size items and returns a list of
+    # results, one per item. A worker waits up to linger seconds for a batch to fill.
+    batch_size: Optional[int] = None
+    linger: float = 0.0
+
+
+@dataclass
+class _Item:
+    index: int
+    value: Any
+    records: List[logging.LogRecord] = field(default_factory=list)
+
+
+class Pipeline:
+    def __init__(self, stages: List[Stage], logger: logging.Logger, queue_depth: int = 8):
+        self.stages = stages
+        self.logger = logger
+        self.queue_depth = queue_depth
+        self.dropped = {stage.name: 0 for stage in stages}
+        self.failed = {stage.name: 0 for stage in stages}
+        self._stats_lock = threading.Lock()
+        install_log_buffering(logger)
+
+    def run(self, items: Iterable[Any], sink: Callable[[Any], None]) -> int:
+        """Push items through every stage; sink(value) runs on this thread, in input order,
+        for each item that made it through. Returns the number of items sunk."""
+        queues = [queue.Queue(maxsize=self.queue_depth) for _ in self.stages]
+        results = queue.Queue()
+        count = {"produced": None}
+
+        def produce():
+            n = 0
+            for n, value in enumerate(items, 1):
+                queues[0].put(_Item(n - 1, value))  # blocks while stage 1 is saturated
+            count["produced"] = n
+            queues[0].put(_DONE)
+
+        def collect(inbox, stage):
+            """Next batch of items, and whether the end of the stream was reached"""
+            item = inbox.get()
+            if item is _DONE:
+                return [], True
+            batch = [item]
+            deadline = time.monotonic() + stage.linger
+            while len(batch) < (stage.batch_size or 1):
+                try:
+                    item = inbox.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _DONE:
+                    return batch, True
+                batch.append(item)
+            return batch, False
+
+        def work(i, stage, remaining):
+            inbox = queues[i]
+            outbox = queues[i + 1] if i + 1 < len(queues) else None
+            while True:
+                batch, done = collect(inbox, stage)
+                if batch:
+                    # A batch's log output goes with its first item
+                    with capture_logs(batch[0].records):
+                        try:
+                            if stage.batch_size is not None:
+                                values = stage.fn([item.value for item in batch])
+                            else:
+                                values = [stage.fn(batch[0].value)]
+                            dropped = sum(value is None for value in values)
+                            if dropped:
+                                with self._stats_lock:
+                                    self.dropped[stage.name] += dropped
+                        except Exception as e:
+                            self.logger.error(f"   ❌ {stage.name} failed: {e}")
+                            with self._stats_lock:
+                                self.failed[stage.name] += len(batch)
+                            values = [None] * len(batch)
+
+                    for item, value in zip(batch, values):
+                        item.value = value
+                        if item.value is None or outbox is None:
+                            results.put(item)  # finished (or dropped) - straight to the writer
+                        else:
+                            outbox.put(item)
+
+                if done:
+                    inbox.put(_DONE)  # let sibling workers see it too
+                    with remaining["lock"]:
+                        remaining["n"] -= 1
+                        last = remaining["n"] == 0
+                    if last and outbox is not None:
+                        outbox.put(_DONE)
+                    return
+
+        threads = [threading.Thread(target=produce, name="pipeline-producer", daemon=True)]
+        for i, stage in enumerate(self.stages):
+            remaining = {"n": stage.workers, "lock": threading.Lock()}
+            threads += [threading.Thread(target=work, args=(i, stage, remaining),
+                                         name=f"pipeline-{stage.name}-{w}", daemon=True)
+                        for w in range(stage.workers)]
+        for thread in threads:
+            thread.start()
+
+        # Single writer: release results in input order
+        pending = {}
+        next_index = 0
+        sunk = 0
+        while count["produced"] is None or next_index < count["produced"]:
+            try:
+                item = results.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            pending[item.index] = item
+            while next_index in pending:
+                item = pending.pop(next_index)
+                next_index += 1
+                flush_log_records(self.logger, item.records)
+                if item.value is not None:
+                    sink(item.value)
+                    sunk += 1
+        return sunk
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Vectorized portfolio P&L evaluation
+Holds entry prices, shares and current prices for every position in aligned
+numpy arrays and evaluates P&L, P&L% and any number of sell rules in one pass.
+
+Benchmark:  python portfolio_eval.py
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+# Values a rule can test, and the comparisons it can make
+RULE_FIELDS = ("price", "pnl", "pnl_pct")
+RULE_OPS = (">=", "<=")
+
+
+@dataclass(frozen=True)
+class SellRule:
+    name: str
+    field: str       # one of RULE_FIELDS
+    op: str          # one of RULE_OPS
+    threshold: float
+
+    def __post_init__(self):
+        if self.field not in RULE_FIELDS:
+            raise ValueError(f"Unknown rule field: {self.field}")
+        if self.op not in RULE_OPS:
+            raise ValueError(f"Unknown rule op: {self.op}")
+
+
+def default_rules(take_profit_price: float, stop_loss_pct: float) -> List[SellRule]:
+    """The profit-taking bot's rules, in priority order"""
+    return [
+        SellRule("TAKE PROFIT", "price", ">=", take_profit_price),
+        SellRule("STOP LOSS", "pnl_pct", "<=", stop_loss_pct),
+    ]
+
+
+@dataclass
+class Portfolio:
+    token_ids: List[str]
+    entry_prices: np.ndarray
+    shares: np.ndarray
+    current_prices: np.ndarray
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Dict]) -> "Portfolio":
+        """Build from dicts with token_id, buy_price, shares and current_price"""
+        return cls(
+            token_ids=[r["token_id"] for r in rows],
+            entry_prices=np.fromiter((r["buy_price"] for r in rows), dtype=np.float64, count=len(rows)),
+            shares=np.fromiter((r["shares"] for r in rows), dtype=np.float64, count=len(rows)),
+            current_prices=np.fromiter((r["current_price"] for r in rows), dtype=np.float64, count=len(rows)),
+        )
+
+    def __len__(self):
+        return len(self.token_ids)
+
+
+@dataclass
+class PortfolioEvaluation:
+    pnl: np.ndarray
+    pnl_pct: np.ndarray
+    rule_masks: np.ndarray   # (rules, positions) bool
+    rules: List[SellRule]
+
+    @property
+    def sell_mask(self) -> np.ndarray:
+        return self.rule_masks.any(axis=0)
+
+    def exempt(self, rule_name: str, positions: np.ndarray):
+        """Switch rule_name off for the positions selected by a bool mask"""
+        for n, rule in enumerate(self.rules):
+            if rule.name == rule_name:
+                self.rule_masks[n] &= ~positions
+
+    def reason(self, i: int):
+        """Name of the first rule that fires for position i, or None"""
+        hits = np.flatnonzero(self.rule_masks[:, i])
+        return self.rules[hits[0]].name if hits.size else None
+
+
+def evaluate_portfolio(portfolio: Portfolio, rules: Sequence[SellRule]) -> PortfolioEvaluation:
+    """P&L, P&L% and one sell mask per rule for every position, in a single vectorized pass"""
+    entry = portfolio.entry_prices
+    price = portfolio.current_prices
+
+    pnl = (price - entry) * portfolio.shares
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pnl_pct = np.where(entry > 0, (price - entry) / entry * 100.0, 0.0)
+
+    values = {"price": price, "pnl": pnl, "pnl_pct": pnl_pct}
+    masks = np.zeros((len(rules), len(portfolio)), dtype=bool)
+
+    # One broadcast comparison per (field, op) group, however many rules share it
+    for field in RULE_FIELDS:
+        for op in RULE_OPS:
+            idx = [i for i, r in enumerate(rules) if r.field == field and r.op == op]
+            if not idx:
+                continue
+            thresholds = np.array([rules[i].threshold for i in idx], dtype=np.float64)[:, None]
+            if op == ">=":
+                masks[idx] = values[field][None, :] >= thresholds
+            else:
+                masks[idx] = values[field][None, :] <= thresholds
+
+    return PortfolioEvaluation(pnl=pnl, pnl_pct=pnl_pct, rule_masks=masks, rules=list(rules))
+
+
+# ============================================================================
+# BENCHMARK
+# ============================================================================
+
+def _scalar_evaluate(rows, take_profit_price, stop_loss_pct):
+    """The per-position scalar path the bot used before evaluate_portfolio, for comparison"""
+    out = []
+    for r in rows:
+        pnl = (r["current_price"] - r["buy_price"]) * r["shares"]
+        pnl_pct = ((r["current_price"] - r["buy_price"]) / r["buy_price"]) * 100
+        out.append((r["current_price"] >= take_profit_price or pnl_pct <= stop_loss_pct, pnl, pnl_pct))
+    return out
+
+
+def _synthetic_rows(n, rng):
+    entry = rng.uniform(0.05, 0.95, n)
+    current = np.clip(entry + rng.normal(0, 0.1, n), 0.01, 0.99)
+    shares = rng.uniform(1, 500, n)
+    return [
+        {"token_id": str(i), "buy_price": float(e), "shares": float(s), "current_price": float(c)}
+        for i, (e, s, c) in enumerate(zip(entry, shares, current))
+    ]
+
+
+def _best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark(sizes=(10, 1_000, 100_000), n_rules=2):
+    rng = np.random.default_rng(7)
+    rules = default_rules(0.99, -20.0)
+    # Extra rules model additional strategies layered on the same positions
+    for k in range(n_rules - len(rules)):
+        rules.append(SellRule(f"TRAIL {k}", "pnl_pct", "<=", -5.0 - k))
+
+    print(f"{'positions':>10} {'rules':>6} {'scalar':>12} {'build':>12} {'vectorized':>12} {'speedup':>8}")
+    for n in sizes:
+        rows = _synthetic_rows(n, rng)
+        repeat = 20 if n <= 1_000 else 3
+        scalar = _best_of(lambda: _scalar_evaluate(rows, 0.99, -20.0), repeat)
+        build = _best_of(lambda: Portfolio.from_rows(rows), repeat)
+        portfolio = Portfolio.from_rows(rows)
+        vectorized = _best_of(lambda: evaluate_portfolio(portfolio, rules), repeat)
+
+        # Same decisions as the scalar path for the default rules
+        ev = evaluate_portfolio(portfolio, rules[:2])
+        assert [d[0] for d in _scalar_evaluate(rows, 0.99, -20.0)] == ev.sell_mask.tolist()
+
+        print(f"{n:>10,} {len(rules):>6} {scalar * 1e3:>10.3f}ms {build * 1e3:>10.3f}ms "
+              f"{vectorized * 1e3:>10.3f}ms {scalar / vectorized:>7.1f}x")
+
+
+if __name__ == "__main__":
+    benchmark(n_rules=2)
+    print()
+    benchmark(n_rules=16)
@@ -4,12 +4,17 @@ Autonomous Profit-Taking Bot for Polymarket
 Monitors positions and sells based on profit/loss thresholds
 """
 from py_clob_client.client import ClobClient
-from py_clob_client.clob_types import OrderArgs, OrderType
-from py_clob_client.order_builder.constants import SELL
 from web3 import Web3
 from eth_account import Account
+from pipeline import capture_logs, flush_log_records, install_log_buffering
+from portfolio_eval import Portfolio, default_rules, evaluate_portfolio
+import numpy as np
+import math
 import time
 import json
+import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait as wait_futures, TimeoutError as FuturesTimeout
 from datetime import datetime
 import logging
 
@@ -27,15 +32,64 @@ if not PRIVATE_KEY:
 TAKE_PROFIT_PRICE = 0.99  # Sell if current price reaches $0.95 per share
 STOP_LOSS_PCT = -20.0  # Sell if position is down 10% or more
 
+# Sell rules evaluated for every position each scan (first match wins)
+SELL_RULES = default_rules(TAKE_PROFIT_PRICE, STOP_LOSS_PCT)
+
 # Scan Settings
 SCAN_INTERVAL_SECONDS = 120  # 10 minutes (600 seconds)
+SCAN_BUDGET_SECONDS = 100    # Hard time budget per scan - keep below SCAN_INTERVAL_SECONDS
+PRICING_RESERVE_SECONDS = 20  # Part of the budget balance checks leave for pricing and selling
+SELL_RESERVE_SECONDS = 5      # Part of the budget pricing leaves for evaluating and selling
+
+# Live triggers: TP/SL fire from the CLOB market websocket as soon as the bid crosses;
+# the periodic scan becomes a slower reconciliation pass
+LIVE_TRIGGERS_ENABLED = True
+
+# Order stream: fills, partial fills and cancels arrive on the authenticated CLOB user
+# channel and are recorded as they happen; while it is down sells are assumed filled
+USER_STREAM_ENABLED = True
+
+# Resting take-profit: keep a limit SELL at TAKE_PROFIT_PRICE on the exchange for every held
+# position so take profit fills at exchange speed; for positions with a live resting order, scans
+# and live triggers then only enforce stop-loss. Fills are recorded from the order stream.
+RESTING_TAKE_PROFIT = False
+RESTING_TP_MIN_SHARES = 5.0  # CLOB minimum order size - smaller positions stay on polled TP
 
 # Trading Settings
 MIN_POSITION_VALUE = 0.10  # Only sell positions worth at least $0.50
 
+# Entry-price sync (Data API trade history)
+TRADES_API_URL = "https://data-api.polymarket.com/trades"
+TRADES_PAGE_SIZE = 500  # Trades per page when paging through wallet history
+MIN_SYNC_SHARES = 0.01  # Ignore assets whose net synced position is below this
+
+# Concurrency
+PRICE_WORKERS = 16  # Max positions priced/evaluated in parallel per scan
+DISCOVERY_DEADLINE_SECONDS = 12  # Overall budget for all position discovery sources together
+
+# Adaptive discovery scheduling: sources that stop contributing tokens nobody else finds
+# back off (run every 2, 4, ... scans); a full sweep of every source runs periodically
+SOURCE_EWMA_ALPHA = 0.3     # Weight of the latest scan in a source's running yield/latency
+SOURCE_MIN_SCORE = 0.05     # Below this score a source backs off
+SOURCE_MAX_INTERVAL = 16    # Longest backoff, in scans
+FULL_SWEEP_EVERY = 20       # Run every source regardless of score every N scans
+
+# Negative cache: tokens not worth re-checking every scan, and for how long (seconds).
+# Discovery and balance checks skip them until they expire or trade again.
+SKIP_TTL = {
+    "resolved": 7 * 24 * 3600,      # market resolved - price endpoint 404s
+    "no_orderbook": 24 * 3600,      # no orderbook for the token
+    "empty": 24 * 3600,             # zero on-chain balance
+    "dust": 3600,                   # worth less than MIN_POSITION_VALUE
+}
+
+POLYGONSCAN_API_KEY = os.environ.get("POLYGONSCAN_API_KEY", "").strip()
+
 # Logging
 LOG_FILE = "profit_taking_bot.log"
-TRADES_LOG = "profit_taking_trades.json"
+LEDGER_DB = "profit_taking_ledger.db"
+SALES_ARCHIVE_DIR = "sales_archive"  # Closed days' sales, one gzip segment per day
+TRADES_LOG = "profit_taking_trades.json"  # Legacy JSON log - imported into the ledger on first run
 
 # ============================================================================
 # SETUP
@@ -53,6 +107,10 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Worker threads evaluating positions buffer their log records and the scan loop
+# flushes them in position order, so output never interleaves
+install_log_buffering(logger)
+
 # Get wallet address
 account = Account.from_key(PRIVATE_KEY)
 WALLET_ADDRESS = account.address
@@ -103,6 +161,13 @@ import requests as _requests
 _proxied_session = _requests.Session()
 _proxied_session.proxies = {"http": PROXY_URL, "https": PROXY_URL}
 
+from clob_ws import MarketChannel, UserChannel, best_bids
+from exit_executor import ExitExecutor
+from ledger import Ledger
+from order_book import BookMirror
+from order_tracker import OrderTracker
+from resting_orders import RestingTakeProfits
+
 # Initialize Polymarket client
 client = ClobClient(
     "https://clob.polymarket.com",
@@ -127,22 +192,34 @@ CTF_ABI = [{
 
 ctf_contract = w3.eth.contract(address=CTF_ADDRESS, abi=CTF_ABI)
 
-# Load or initialize trades log
-try:
-    with open(TRADES_LOG, 'r') as f:
-        trades_log = json.load(f)
-except FileNotFoundError:
-    trades_log = {
-        "purchases": {},  # token_id: {price, shares, timestamp}
-        "sales": [],
-        "total_profit": 0.0
+# Guards trades_log - positions are evaluated on worker threads
+trades_lock = threading.RLock()
+
+# Persistent ledger; trades_log is the in-memory view of open positions and sync state.
+# Sales are written straight to the ledger and never held in memory.
+ledger = Ledger(LEDGER_DB, archive_dir=SALES_ARCHIVE_DIR)
+ledger.import_json(TRADES_LOG)
+
+trades_log = {
+    "purchases": ledger.load_purchases(),  # token_id: {buy_price, shares, timestamp, source}
+    "total_profit": ledger.get_meta("total_profit", 0.0),
+    # Incremental trade-history sync state (see sync_entry_prices)
+    "entry_sync": {
+        "last_ts": 0,       # newest trade timestamp already folded into "assets"
+        "last_keys": [],    # keys of trades at last_ts (timestamps are only 1s resolution)
+        "resume": None,     # checkpoint of an unfinished sync
+        **ledger.get_meta("entry_sync", {}),
+        "assets": ledger.load_basis()  # asset_id: {bought, cost, sold, proceeds}
     }
+}
 
 
-def save_trades_log():
-    """Save trades log to file"""
-    with open(TRADES_LOG, 'w') as f:
-        json.dump(trades_log, f, indent=2)
+def save_sync_state(assets):
+    """Persist sync progress and the given assets' running totals"""
+    sync = trades_log["entry_sync"]
+    with ledger.batch():
+        ledger.upsert_basis({asset: sync["assets"][asset] for asset in assets})
+        ledger.set_meta("entry_sync", {k: sync[k] for k in ("last_ts", "last_keys", "resume")})
 
 
 def purge_bad_entry_prices():
@@ -156,228 +233,556 @@ def purge_bad_entry_prices():
             to_delete.append(token_id)
             purged += 1
 
-    for token_id in to_delete:
-        del trades_log["purchases"][token_id]
+    with ledger.batch():
+        for token_id in to_delete:
+            del trades_log["purchases"][token_id]
+            ledger.delete_purchase(token_id)
 
     if purged > 0:
         logger.info(f"   🧹 Purged {purged} assumed entry prices — will re-fetch from API")
-        save_trades_log()
 
 
 def record_purchase(token_id, price, shares):
-    """Record a purchase for profit/loss tracking"""
-    trades_log["purchases"][token_id] = {
-        "buy_price": price,
-        "shares": shares,
-        "timestamp": datetime.now().isoformat()
-    }
-    save_trades_log()
+    """Record a purchase for profit/loss tracking. The skip cache is left alone - tokens with
+    real new fills are cleared from it by the trade history sync."""
+    with trades_lock:
+        trades_log["purchases"][token_id] = {
+            "buy_price": price,
+            "shares": shares,
+            "timestamp": datetime.now().isoformat()
+        }
+        ledger.upsert_purchase(token_id, trades_log["purchases"][token_id])
 
 
 def record_sale(token_id, sell_price, shares, pnl, pnl_pct):
-    """Record a sale"""
-    purchase = trades_log["purchases"].get(token_id, {})
-
-    trades_log["sales"].append({
-        "token_id": token_id,
-        "buy_price": purchase.get("buy_price", 0),
-        "sell_price": sell_price,
-        "shares": shares,
-        "pnl": pnl,
-        "pnl_pct": pnl_pct,
-        "timestamp": datetime.now().isoformat()
-    })
+    """Record a sale (or a partial fill) - the purchase is kept until its shares are all sold"""
+    with trades_lock:
+        purchase = trades_log["purchases"].get(token_id, {})
+        trades_log["total_profit"] += pnl
+
+        with ledger.batch():
+            ledger.add_sale({
+                "token_id": token_id,
+                "buy_price": purchase.get("buy_price", 0),
+                "sell_price": sell_price,
+                "shares": shares,
+                "pnl": pnl,
+                "pnl_pct": pnl_pct,
+                "timestamp": datetime.now().isoformat()
+            }, opened_at=purchase.get("timestamp"))
+            ledger.set_meta("total_profit", trades_log["total_profit"])
+
+            # Reduce the open purchase; remove it once nothing meaningful is left
+            if token_id in trades_log["purchases"]:
+                remaining = purchase.get("shares", 0) - shares
+                if remaining > MIN_SYNC_SHARES:
+                    purchase["shares"] = remaining
+                    ledger.upsert_purchase(token_id, purchase)
+                else:
+                    del trades_log["purchases"][token_id]
+                    ledger.delete_purchase(token_id)
 
-    trades_log["total_profit"] += pnl
 
-    # Remove from active purchases
-    if token_id in trades_log["purchases"]:
-        del trades_log["purchases"][token_id]
+# ============================================================================
+# ORDER STREAM
+# ============================================================================
 
-    save_trades_log()
+def _on_fill(order, filled, price):
+    """Order tracker callback: record every SELL fill increment as a sale"""
+    if order["side"] != "SELL":
+        return
+    token_id = order["asset_id"]
+    with trades_lock:
+        purchase = trades_log["purchases"].get(token_id)
+        buy_price = purchase["buy_price"] if purchase else None
+    if buy_price is None:
+        synced = get_synced_entry(token_id)
+        buy_price = synced["vwap"] if synced else 0.0
+    pnl = (price - buy_price) * filled
+    pnl_pct = ((price - buy_price) / buy_price) * 100 if buy_price else 0.0
+
+    partial = order["size_matched"] < order["original_size"] - 1e-9
+    logger.info(f"   💸 {'Partial fill' if partial else 'Filled'}: {filled:.6f} shares of {token_id[:20]}... "
+                f"@ ${price:.4f} ({order['size_matched']:.6f}/{order['original_size']:.6f}) "
+                f"P&L ${pnl:+.2f} ({pnl_pct:+.1f}%)")
+    record_sale(token_id, price, filled, pnl, pnl_pct)
+
+
+def _seed_order_tracker():
+    """Resync open orders after every user channel (re)connect - fills missed while down are recorded"""
+    try:
+        order_tracker.seed(client.get_orders(), lookup=client.get_order)
+    except Exception as e:
+        logger.warning(f"   ⚠️  Couldn't seed open orders: {e}")
 
 
-def get_all_positions():
-    """Scan wallet for all Polymarket positions - auto-discover tokens"""
-    logger.info("🔍 Scanning wallet for positions...")
+order_tracker = OrderTracker(owner=client.creds.api_key, on_fill=_on_fill)
+user_channel = UserChannel(order_tracker.handle, client.creds)
+user_channel.on_connect = _seed_order_tracker
 
-    token_ids = set()
+# Our resting take-profit orders, {token_id: order_id} persisted in the ledger
+resting_tp = RestingTakeProfits(client, order_tracker, TAKE_PROFIT_PRICE, RESTING_TP_MIN_SHARES,
+                                on_change=lambda orders: ledger.set_meta("resting_tp", orders))
+resting_tp.load(ledger.get_meta("resting_tp", {}))
 
-    # Method 1: Check our own trades log for known purchases
-    for token_id in trades_log["purchases"].keys():
-        token_ids.add(token_id)
 
-    logger.info(f"   Found {len(token_ids)} tokens from profit-taking purchase history")
+def order_stream_live():
+    return USER_STREAM_ENABLED and user_channel.connected.is_set()
 
-    # Method 2: Check autonomous_bot's trade log if it exists
-    try:
-        with open('trades_log.json', 'r') as f:
-            lines = f.readlines()
 
-            # Track most recent purchase per token only
-            token_purchases = {}  # token_id: {price, shares, timestamp}
+# ============================================================================
+# NEGATIVE CACHE
+# ============================================================================
 
-            for line in lines:
-                try:
-                    trade = json.loads(line.strip())
-                    token_id = trade.get('token_id')
-                    timestamp = trade.get('timestamp', '')
-
-                    if token_id:
-                        # Keep only the most recent purchase for each token
-                        if token_id not in token_purchases or timestamp > token_purchases[token_id].get('timestamp',
-                                                                                                        ''):
-                            token_purchases[token_id] = {
-                                'price': trade.get('price', 0),
-                                'shares': trade.get('shares', 0),
-                                'timestamp': timestamp
-                            }
-
-                except json.JSONDecodeError:
-                    continue
+class NegativeCache:
+    """Tokens the scan skips until their entry expires: resolved markets, tokens with
+    no orderbook, empty balances and dust. Each entry has a reason and an expiry, and
+    lives in the ledger so it survives restarts."""
+
+    def __init__(self, ledger):
+        self._ledger = ledger
+        self._lock = threading.Lock()
+        self._entries = ledger.load_skips(time.time())  # token_id: {reason, added_at, expires_at}
+
+    def add(self, token_id, reason):
+        now = time.time()
+        entry = {"reason": reason, "added_at": now, "expires_at": now + SKIP_TTL[reason]}
+        with self._lock:
+            self._entries[str(token_id)] = entry
+        self._ledger.upsert_skip(token_id, reason, entry["added_at"], entry["expires_at"])
+
+    def discard(self, token_ids):
+        """Forget tokens that became live again (e.g. new trades)"""
+        with self._lock:
+            gone = [t for t in map(str, token_ids) if self._entries.pop(t, None)]
+        if gone:
+            self._ledger.delete_skips(gone)
+
+    def active(self):
+        """{token_id: reason} for unexpired entries; expired ones are dropped"""
+        now = time.time()
+        with self._lock:
+            expired = [t for t, e in self._entries.items() if e["expires_at"] <= now]
+            for token_id in expired:
+                del self._entries[token_id]
+            active = {t: e["reason"] for t, e in self._entries.items()}
+        if expired:
+            self._ledger.purge_expired_skips(now)
+        return active
+
+    def filter(self, token_ids):
+        """Split token_ids into (to check, {reason: skipped count})"""
+        active = self.active()
+        keep = set()
+        skipped = {}
+        for token_id in token_ids:
+            reason = active.get(str(token_id))
+            if reason is None:
+                keep.add(token_id)
+            else:
+                skipped[reason] = skipped.get(reason, 0) + 1
+        return keep, skipped
 
-            # Now add tokens and record purchases
-            for token_id, purchase_info in token_purchases.items():
-                token_ids.add(str(token_id))
-                # Record most recent purchase for P&L tracking
-                if str(token_id) not in trades_log["purchases"]:
-                    record_purchase(str(token_id), purchase_info['price'], purchase_info['shares'])
 
-            if token_ids:
-                logger.info(f"   ✅ Found {len(token_ids)} tokens from buy bot log (most recent only)")
+skip_cache = NegativeCache(ledger)
+
+
+# ============================================================================
+# POSITION DISCOVERY
+# ============================================================================
+
+def _discover_local_log():
+    """Tokens from our own purchase history"""
+    with trades_lock:
+        return set(trades_log["purchases"])
+
+
+def _discover_buy_bot_log():
+    """Tokens from autonomous_bot's trade log (most recent purchase per token is recorded)"""
+    token_ids = set()
+    try:
+        with open('trades_log.json', 'r') as f:
+            lines = f.readlines()
     except FileNotFoundError:
         logger.debug("   No buy bot trade log found yet")
-    except Exception as e:
-        logger.debug(f"   Error reading buy bot log: {e}")
+        return token_ids
 
-    # Method 3: Query Polygonscan API for all ERC1155 transfers
-    try:
-        logger.info("   Querying Polygonscan for token transfers...")
-
-        params = {
-            "module": "account",
-            "action": "token1155tx",
-            "contractaddress": CTF_ADDRESS,
-            "address": WALLET_ADDRESS,
-            "page": 1,
-            "offset": 100,
-            "sort": "desc",
-            "apikey": "YourApiKeyToken"
-        }
+    # Track most recent purchase per token only
+    token_purchases = {}  # token_id: {price, shares, timestamp}
 
-        response = _proxied_session.get(
-            "https://api.polygonscan.com/api",
-            params=params,
-            timeout=10
-        )
+    for line in lines:
+        try:
+            trade = json.loads(line.strip())
+        except json.JSONDecodeError:
+            continue
+        token_id = trade.get('token_id')
+        timestamp = trade.get('timestamp', '')
+
+        if token_id:
+            # Keep only the most recent purchase for each token
+            if token_id not in token_purchases or timestamp > token_purchases[token_id].get('timestamp', ''):
+                token_purchases[token_id] = {
+                    'price': trade.get('price', 0),
+                    'shares': trade.get('shares', 0),
+                    'timestamp': timestamp
+                }
+
+    # Now add tokens and record purchases - the new ones in one short ledger transaction.
+    # Tokens the synced trade history shows closed, or that are skip-cached, aren't re-recorded.
+    skip = skip_cache.active()
+    with trades_lock, ledger.batch():
+        for token_id, purchase_info in token_purchases.items():
+            token_id = str(token_id)
+            token_ids.add(token_id)
+            if token_id in trades_log["purchases"] or token_id in skip:
+                continue
+            synced = get_synced_entry(token_id)
+            if synced and synced["shares"] < MIN_SYNC_SHARES:
+                continue
+            # Record most recent purchase for P&L tracking
+            record_purchase(token_id, purchase_info['price'], purchase_info['shares'])
+
+    return token_ids
+
+
+def _discover_polygonscan():
+    """Tokens received by the wallet according to Polygonscan ERC1155 transfers"""
+    params = {
+        "module": "account",
+        "action": "token1155tx",
+        "contractaddress": CTF_ADDRESS,
+        "address": WALLET_ADDRESS,
+        "page": 1,
+        "offset": 100,
+        "sort": "desc",
+        "apikey": POLYGONSCAN_API_KEY
+    }
 
-        if response.status_code == 200:
-            data = response.json()
+    response = _proxied_session.get("https://api.polygonscan.com/api", params=params, timeout=10)
+    response.raise_for_status()
+    data = response.json()
 
-            if data.get('status') == '1' and data.get('result'):
-                transfers = data['result']
+    token_ids = set()
+    if data.get('status') == '1' and data.get('result'):
+        for transfer in data['result']:
+            if transfer.get('to', '').lower() == WALLET_ADDRESS.lower():
+                token_id = transfer.get('tokenID')
+                if token_id:
+                    token_ids.add(str(token_id))
+    return token_ids
 
-                for transfer in transfers:
-                    if transfer.get('to', '').lower() == WALLET_ADDRESS.lower():
-                        token_id = transfer.get('tokenID')
-                        if token_id:
-                            token_ids.add(str(token_id))
 
-                logger.info(f"   ✅ Polygonscan added more tokens - total: {len(token_ids)}")
-            else:
-                logger.info(f"   Polygonscan: no new tokens (using existing {len(token_ids)})")
-        else:
-            logger.info(f"   Polygonscan unavailable (using {len(token_ids)} known tokens)")
+def _discover_data_api():
+    """Tokens from the Polymarket Data API positions endpoint - most reliable direct source"""
+    r = _proxied_session.get(
+        "https://data-api.polymarket.com/positions",
+        params={"user": WALLET_ADDRESS, "limit": 500},
+        timeout=10
+    )
+    r.raise_for_status()
+    data = r.json()
+    positions_list = data if isinstance(data, list) else data.get('positions', data.get('data', []))
 
-    except Exception as e:
-        logger.debug(f"   Polygonscan skipped: {e}")
+    token_ids = set()
+    for pos in positions_list:
+        tid = (pos.get('asset') or pos.get('asset_id') or
+               pos.get('token_id') or pos.get('tokenId') or
+               pos.get('conditionId') or pos.get('id'))
+        size = float(pos.get('size', pos.get('amount', pos.get('shares', pos.get('currentValue', 0)))) or 0)
+        if tid and size > 0.001:
+            token_ids.add(str(tid))
+    if positions_list and not token_ids:
+        logger.info(f"   🔍 Data API sample fields: {list(positions_list[0].keys())}")
+    return token_ids
+
+
+def _discover_chain_logs():
+    """Tokens received in recent TransferSingle events (very small block range)"""
+    latest_block = w3.eth.block_number
+    from_block = max(0, latest_block - 500)  # Very small: 500 blocks
+
+    transfer_topic = w3.keccak(text="TransferSingle(address,address,address,uint256,uint256)").hex()
+
+    logs = w3.eth.get_logs({
+        'fromBlock': from_block,
+        'toBlock': 'latest',
+        'address': CTF_ADDRESS,
+        'topics': [transfer_topic]
+    })
 
-    # Method 3b: Polymarket Data API - most reliable direct source
-    try:
-        r = _proxied_session.get(
-            "https://data-api.polymarket.com/positions",
-            params={"user": WALLET_ADDRESS, "limit": 500},
-            timeout=10
-        )
-        if r.status_code == 200:
-            data = r.json()
-            positions_list = data if isinstance(data, list) else data.get('positions', data.get('data', []))
-            before = len(token_ids)
-            for pos in positions_list:
-                tid = (pos.get('asset') or pos.get('asset_id') or
-                       pos.get('token_id') or pos.get('tokenId') or
-                       pos.get('conditionId') or pos.get('id'))
-                size = float(pos.get('size', pos.get('amount', pos.get('shares', pos.get('currentValue', 0)))) or 0)
-                if tid and size > 0.001:
-                    token_ids.add(str(tid))
-            added = len(token_ids) - before
-            logger.info(f"   ✅ Data API: {len(positions_list)} positions, {added} new tokens (total: {len(token_ids)})")
-            if len(positions_list) > 0 and added == 0:
-                logger.info(f"   🔍 Data API sample fields: {list(positions_list[0].keys())}")
-        else:
-            logger.warning(f"   ⚠️  Data API HTTP {r.status_code}")
-    except Exception as e:
-        logger.warning(f"   ⚠️  Data API failed: {e}")
+    token_ids = set()
+    for log in logs:
+        if len(log['topics']) >= 4:
+            to_address = '0x' + log['topics'][3].hex()[-40:]
+            if to_address.lower() == WALLET_ADDRESS.lower():
+                data = log['data'].hex()[2:]
+                token_ids.add(str(int(data[:64], 16)))
+    return token_ids
 
-    # Method 4: Try direct blockchain scanning with small range
-    try:
-        latest_block = w3.eth.block_number
-        from_block = max(0, latest_block - 500)  # Very small: 500 blocks
-
-        transfer_topic = w3.keccak(text="TransferSingle(address,address,address,uint256,uint256)").hex()
-
-        logs = w3.eth.get_logs({
-            'fromBlock': from_block,
-            'toBlock': 'latest',
-            'address': CTF_ADDRESS,
-            'topics': [transfer_topic]
-        })
-
-        for log in logs:
-            if len(log['topics']) >= 4:
-                to_address = '0x' + log['topics'][3].hex()[-40:]
-                if to_address.lower() == WALLET_ADDRESS.lower():
-                    data = log['data'].hex()[2:]
-                    token_id = int(data[:64], 16)
-                    token_ids.add(str(token_id))
 
-        logger.info(f"   Blockchain scan complete - total tokens: {len(token_ids)}")
+def _discover_bot_log_fallback():
+    """Last resort: token ids mentioned in the last 1000 lines of autonomous_bot.log"""
+    token_ids = set()
+    with open('autonomous_bot.log', 'r') as f:
+        lines = f.readlines()[-1000:]
+    for line in lines:
+        # Look for "token_id=" in log lines
+        if 'token_id=' in line:
+            parts = line.split('token_id=')
+            if len(parts) > 1:
+                # Extract token ID (next word/number)
+                token_str = parts[1].split()[0].strip(',;&')
+                if token_str.isdigit():
+                    token_ids.add(token_str)
+    return token_ids
+
+
+class SourceSchedule:
+    """Running yield / cost statistics and backoff schedule for one discovery source.
+
+    Yield is the number of tokens only this source found in a scan; a source that
+    keeps finding nothing the others don't is low value however many tokens it
+    returns. score = yield / (1 + latency + cost), where cost is a fixed weight
+    for the source's rate-limit / API spend.
+    """
 
-    except Exception as e:
-        logger.debug(f"   Blockchain scan skipped: {e}")
+    def __init__(self, name, source, cost, always=False):
+        self.name = name
+        self.source = source
+        self.cost = cost
+        self.always = always      # cheap enough to run every scan regardless of score
+        self.interval = 1         # run every N scans
+        self.next_scan = 0
+        self.unique = None        # EWMA of tokens only this source found
+        self.latency = None       # EWMA of latency (seconds)
+
+    @property
+    def score(self):
+        if self.unique is None:
+            return float("inf")   # never observed - keep running until we know
+        return self.unique / (1.0 + self.latency + self.cost)
+
+    def due(self, scan_no, full_sweep):
+        return self.always or full_sweep or scan_no >= self.next_scan
+
+    def observe(self, scan_no, unique, latency):
+        a = SOURCE_EWMA_ALPHA
+        self.unique = unique if self.unique is None else a * unique + (1 - a) * self.unique
+        self.latency = latency if self.latency is None else a * latency + (1 - a) * self.latency
+        if self.score >= SOURCE_MIN_SCORE:
+            self.interval = 1
+        else:
+            self.interval = min(self.interval * 2, SOURCE_MAX_INTERVAL)
+        self.next_scan = scan_no + self.interval
+
+    def to_dict(self):
+        return {"interval": self.interval, "next_scan": self.next_scan,
+                "unique": self.unique, "latency": self.latency}
+
+    def load(self, state):
+        for key in ("interval", "next_scan", "unique", "latency"):
+            if key in state:
+                setattr(self, key, state[key])
+
+
+# Discovery sources with their relative rate-limit / API cost, run concurrently
+# under DISCOVERY_DEADLINE_SECONDS
+DISCOVERY_SOURCES = [
+    SourceSchedule("local log", _discover_local_log, cost=0.0, always=True),
+    SourceSchedule("buy bot log", _discover_buy_bot_log, cost=0.0, always=True),
+    SourceSchedule("Polygonscan", _discover_polygonscan, cost=1.0),
+    SourceSchedule("Data API", _discover_data_api, cost=0.5),
+    SourceSchedule("chain logs", _discover_chain_logs, cost=2.0),
+]
+if not POLYGONSCAN_API_KEY:
+    # Without a key every call is rejected - don't spend requests on it
+    DISCOVERY_SOURCES = [source for source in DISCOVERY_SOURCES if source.name != "Polygonscan"]
+
+_discovery_state = {"scan": ledger.get_meta("discovery_scan", 0)}
+for _schedule in DISCOVERY_SOURCES:
+    _schedule.load(ledger.get_meta("discovery_sources", {}).get(_schedule.name, {}))
+
+
+def _timed(source):
+    start = time.time()
+    found = source()
+    return found, time.time() - start
+
+
+def discover_token_ids():
+    """Run the discovery sources due this scan concurrently and merge results as they arrive.
+    Sources that miss the deadline are dropped (their threads finish in the background
+    and the results are discarded), so discovery never takes longer than the deadline."""
+    scan_no = _discovery_state["scan"]
+    _discovery_state["scan"] += 1
+    full_sweep = scan_no % FULL_SWEEP_EVERY == 0
+    due = [schedule for schedule in DISCOVERY_SOURCES if schedule.due(scan_no, full_sweep)]
+    skipped = [schedule.name for schedule in DISCOVERY_SOURCES if schedule not in due]
+    if full_sweep:
+        logger.info("   🔁 Full discovery sweep - running every source")
+    elif skipped:
+        logger.info(f"   ⏭️  Backed-off sources skipped this scan: {', '.join(skipped)}")
+
+    skip = skip_cache.active()
+    token_ids = set()
+    results = {}  # schedule: (token set, latency)
+    pool = ThreadPoolExecutor(max_workers=len(due), thread_name_prefix="discovery")
+    futures = {pool.submit(_timed, schedule.source): schedule for schedule in due}
+    start = time.time()
 
-    # Method 5: If still nothing, check if buy bot is writing to autonomous_bot.log
-    if len(token_ids) == 0:
+    try:
+        for future in as_completed(futures, timeout=DISCOVERY_DEADLINE_SECONDS):
+            schedule = futures[future]
+            try:
+                found, latency = future.result()
+            except Exception as e:
+                logger.info(f"   ⚠️  {schedule.name}: failed after {time.time() - start:.2f}s ({e})")
+                results[schedule] = (set(), time.time() - start)
+                continue
+            # Cached dead tokens count for nothing - a source that only finds those backs off
+            found = {t for t in found if str(t) not in skip}
+            results[schedule] = (found, latency)
+            new = found - token_ids
+            token_ids |= found
+            logger.info(f"   ✅ {schedule.name}: {len(found)} tokens, {len(new)} new in {latency:.2f}s "
+                        f"(total: {len(token_ids)})")
+    except FuturesTimeout:
+        for future, schedule in futures.items():
+            if not future.done():
+                future.cancel()
+                results[schedule] = (set(), float(DISCOVERY_DEADLINE_SECONDS))
+                logger.warning(f"   ⏱️  {schedule.name}: missed the {DISCOVERY_DEADLINE_SECONDS}s deadline - dropped")
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    # Score each source by the tokens only it found, then update its schedule
+    for schedule, (found, latency) in results.items():
+        others = set().union(*(f for other, (f, _) in results.items() if other is not schedule))
+        unique = len(found - others)
+        schedule.observe(scan_no, unique, latency)
+        logger.debug(f"   {schedule.name}: unique={unique} score={schedule.score:.3f} interval={schedule.interval}")
+    ledger.set_meta("discovery_scan", _discovery_state["scan"])
+    ledger.set_meta("discovery_sources", {schedule.name: schedule.to_dict() for schedule in DISCOVERY_SOURCES})
+
+    # If still nothing, check if buy bot is writing token ids to autonomous_bot.log
+    if not token_ids:
         try:
-            logger.info("   Checking autonomous_bot.log for recent trades...")
-            with open('autonomous_bot.log', 'r') as f:
-                # Read last 1000 lines
-                lines = f.readlines()[-1000:]
-                for line in lines:
-                    # Look for "token_id=" in log lines
-                    if 'token_id=' in line:
-                        parts = line.split('token_id=')
-                        if len(parts) > 1:
-                            # Extract token ID (next word/number)
-                            token_str = parts[1].split()[0].strip(',;&')
-                            if token_str.isdigit():
-                                token_ids.add(token_str)
-
+            token_ids = _discover_bot_log_fallback()
             if token_ids:
                 logger.info(f"   ✅ Found {len(token_ids)} tokens from buy bot logs")
-        except:
+        except Exception:
             pass
 
+    logger.info(f"   Discovery finished in {time.time() - start:.2f}s - {len(token_ids)} tokens")
+    return token_ids
+
+
+# ============================================================================
+# SCAN BUDGET
+# ============================================================================
+
+class ScanBudget:
+    """Wall-clock budget for one scan"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.start = time.time()
+        self.deadline = self.start + seconds
+
+    def remaining(self, reserve=0.0):
+        return self.deadline - reserve - time.time()
+
+    def exhausted(self, reserve=0.0):
+        return self.remaining(reserve) <= 0
+
+    def elapsed(self):
+        return time.time() - self.start
+
+
+# token_id: {distance, value, deferred} from the last time the token was priced.
+# distance is how far the price is from its nearest TP/SL trigger.
+_position_priority = {}
+
+
+def prioritize(token_ids):
+    """Order tokens for a scan: never-priced tokens first, then closest to a trigger,
+    then largest value. Tokens deferred by earlier scans age toward the front."""
+    def key(token_id):
+        p = _position_priority.get(token_id)
+        if p is None:
+            return (0, 0.0, 0.0)
+        return (1, p["distance"] / (1 + p["deferred"]), -p["value"])
+    return sorted(token_ids, key=key)
+
+
+def note_priced(row):
+    """Remember a priced position's trigger distance and value for the next scan's ordering"""
+    price = row['current_price']
+    distance = TAKE_PROFIT_PRICE - price
+    if row['buy_price']:
+        distance = min(distance, price - row['buy_price'] * (1 + STOP_LOSS_PCT / 100.0))
+    _position_priority[row['token_id']] = {
+        "distance": max(distance, 0.0),
+        "value": row['shares'] * price,
+        "deferred": 0
+    }
+
+
+def note_deferred(token_ids):
+    for token_id in token_ids:
+        p = _position_priority.get(token_id)
+        if p is not None:
+            p["deferred"] += 1
+
+
+def log_deferred_report(deferred, budget):
+    """Which positions this scan didn't reach, and at which stage"""
+    total = sum(len(tokens) for tokens in deferred.values())
+    if not total:
+        return
+    stages = ", ".join(f"{stage}: {len(tokens)}" for stage, tokens in deferred.items() if tokens)
+    logger.info(f"⏳ Deferred {total} positions to next scan ({stages}) - "
+                f"budget {budget.seconds}s, used {budget.elapsed():.1f}s")
+    for stage, tokens in deferred.items():
+        for token_id in tokens[:5]:
+            p = _position_priority.get(token_id)
+            detail = (f"trigger distance ${p['distance']:.4f}, value ${p['value']:.2f}, deferred {p['deferred']}x"
+                      if p else "never priced")
+            logger.info(f"   ⏳ {stage}: {token_id[:20]}... ({detail})")
+        if len(tokens) > 5:
+            logger.info(f"   ⏳ {stage}: ... and {len(tokens) - 5} more")
+
+
+def get_all_positions(budget):
+    """Scan wallet for all Polymarket positions - auto-discover tokens.
+    Balance checks run in priority order until the budget runs out.
+    Returns (positions, deferred token ids)."""
+    logger.info("🔍 Scanning wallet for positions...")
+
+    token_ids, skipped = skip_cache.filter(discover_token_ids())
+    if skipped:
+        logger.info(f"   ⏭️  Skipping {sum(skipped.values())} cached dead tokens "
+                    f"({', '.join(f'{reason}: {n}' for reason, n in sorted(skipped.items()))})")
+
     if len(token_ids) == 0:
         logger.warning("   ⚠️  No tokens discovered. Wallet may be empty or buy bot hasn't traded yet.")
-        return []
+        return [], []
 
     # Check balances
     positions = []
 
     logger.info(f"   Checking balances for {len(token_ids)} tokens...")
 
-    for token_id in token_ids:
+    # Locked balances come from the order stream; without it, one REST snapshot per scan
+    if not order_stream_live():
+        _seed_order_tracker()
+
+    deferred = []
+    ordered = prioritize(token_ids)
+    for n, token_id in enumerate(ordered):
+        if budget.exhausted(PRICING_RESERVE_SECONDS):
+            deferred.extend(ordered[n:])
+            break
         try:
             # First check blockchain balance - retry on rate limit
             balance = None
@@ -388,10 +793,16 @@ def get_all_positions():
                 except Exception as re:
                     if 'rate limit' in str(re).lower() or '-32090' in str(re):
                         wait = 3 + attempt * 3
+                        if budget.remaining(PRICING_RESERVE_SECONDS) < wait:
+                            break
                         logger.debug(f"   Rate limit on {token_id[:20]}..., retry {attempt+1}/5 in {wait}s")
                         time.sleep(wait)
                     else:
                         raise re
+            if balance is None and budget.remaining(PRICING_RESERVE_SECONDS) < 3:
+                # Rate limited with no budget left to wait it out
+                deferred.append(token_id)
+                continue
             if balance is None:
                 # Rate limit failed — assume non-zero if it was in our trades log
                 if token_id in [str(t.get("token_id","")) for t in []]:
@@ -422,52 +833,53 @@ def get_all_positions():
             balance_decimal = balance / 1e6
             time.sleep(1.5)  # 1.5s between calls - conservative to avoid rate limits
 
-            if balance_decimal > 0.0001:
-                # Now check if we have open orders that lock these tokens
-                try:
-                    open_orders = client.get_orders(asset_id=token_id)
-
-                    # Calculate locked balance in open orders
-                    locked_balance = 0.0
-                    for order in open_orders:
-                        if order.get('owner', '').lower() == WALLET_ADDRESS.lower():
-                            locked_balance += float(order.get('size_matched', 0))
-
-                    # Available balance = blockchain balance - locked in orders
-                    available_balance = balance_decimal - locked_balance
-
-                    if available_balance > 0.0001:
-                        positions.append({
-                            'token_id': token_id,
-                            'shares': available_balance
-                        })
-                        logger.info(
-                            f"   ✅ Found {available_balance:.6f} shares in token {token_id[:20]}... ({locked_balance:.6f} locked in orders)")
-                    elif locked_balance > 0:
-                        logger.info(f"   ⏭️  Skipping token {token_id[:20]}... - all shares locked in open orders")
-
-                except Exception as e:
-                    # If we can't check orders, use blockchain balance
-                    logger.debug(f"   Couldn't check orders for {token_id[:20]}..., using blockchain balance")
+            order_tracker.set_balance(token_id, balance_decimal)
+
+            if balance_decimal <= 0.0001:
+                skip_cache.add(token_id, "empty")
+            else:
+                # Shares locked in our open SELL orders can't be sold again - except those behind
+                # our own resting take-profit, which stop-loss cancels before selling
+                locked_balance = order_tracker.locked(token_id) - resting_tp.locked(token_id)
+                available_balance = balance_decimal - locked_balance
+
+                if available_balance > 0.0001:
                     positions.append({
                         'token_id': token_id,
-                        'shares': balance_decimal
+                        'shares': available_balance
                     })
-                    logger.info(f"   ✅ Found {balance_decimal:.6f} shares in token {token_id[:20]}...")
+                    logger.info(
+                        f"   ✅ Found {available_balance:.6f} shares in token {token_id[:20]}... ({locked_balance:.6f} locked in orders)")
+                elif locked_balance > 0:
+                    logger.info(f"   ⏭️  Skipping token {token_id[:20]}... - all shares locked in open orders")
 
         except Exception as e:
             logger.warning(f"   ⚠️  Error checking {token_id[:20]}...: {e}")
             continue
 
     logger.info(f"   ✅ Found {len(positions)} active positions")
-    return positions
+    return positions, deferred
+
+
+# Order books for held tokens: streamed by the market channel when it is up,
+# otherwise refreshed from one batched REST snapshot per scan
+book_mirror = BookMirror()
+
+
+def refresh_books(token_ids):
+    """Make sure every token has a current book before it is priced"""
+    live = LIVE_TRIGGERS_ENABLED and market_channel.connected.is_set()
+    stale = [t for t in token_ids if not (live and book_mirror.streamed(t))]
+    if stale:
+        loaded = book_mirror.load_snapshots(client, stale)
+        logger.info(f"   📚 Loaded {loaded}/{len(stale)} order book snapshots")
 
 
 def get_market_price(token_id, retries=3):
     """Get current market BID price for a token
     Returns: (price, is_resolved)
     - (float, False) if price found
-    - (None, True) if market is resolved (404)
+    - (None, reason) if market is resolved (404) - reason is "resolved" or "no_orderbook"
     - (None, False) if network error
     """
     for attempt in range(retries):
@@ -478,7 +890,7 @@ def get_market_price(token_id, retries=3):
             error_msg = str(e)
             if '404' in error_msg or 'No orderbook' in error_msg:
                 # Market resolved - signal to blacklist
-                return None, True
+                return None, "no_orderbook" if 'No orderbook' in error_msg else "resolved"
             elif 'Request exception' in error_msg or 'timeout' in error_msg.lower():
                 # Network/proxy error - retry
                 if attempt < retries - 1:
@@ -494,130 +906,450 @@ def get_market_price(token_id, retries=3):
     return None, False
 
 
-def fetch_entry_price_from_api(token_id):
-    """Fetch avg entry price for a SPECIFIC token from Polymarket trade history API"""
-    try:
-        # Try Gamma API first - most accurate per-token history
-        r = _proxied_session.get(
-            "https://data-api.polymarket.com/trades",
-            params={
-                "user": WALLET_ADDRESS,
-                "asset_id": token_id,   # filter by specific token
-                "limit": 500,
-                "side": "BUY"
-            },
-            timeout=10
-        )
-        if r.status_code == 200:
-            trades = r.json()
-            if isinstance(trades, dict):
-                trades = trades.get("data", trades.get("trades", []))
-
-            # Filter strictly to this token only
-            token_buys = [
-                t for t in trades
-                if str(t.get("asset_id", t.get("asset", t.get("tokenId", "")))) == str(token_id)
-                and t.get("side", "").upper() in ("BUY", "LONG", "")
-            ]
-
-            if token_buys:
-                total_cost = sum(
-                    float(t.get("price", 0)) * float(t.get("shares", t.get("size", t.get("amount", 0))))
-                    for t in token_buys
-                )
-                total_shares = sum(
-                    float(t.get("shares", t.get("size", t.get("amount", 0))))
-                    for t in token_buys
-                )
-                if total_shares > 0:
-                    avg_price = total_cost / total_shares
-                    logger.info(f"   📡 API entry price: ${avg_price:.4f} ({len(token_buys)} buys for this token)")
-                    return avg_price
-            else:
-                logger.debug(f"   No matching trades for token {token_id[:20]}... in API response ({len(trades)} total trades)")
+def _trade_key(trade):
+    """Stable identity for a Data API trade row"""
+    return ":".join(str(trade.get(k, "")) for k in ("transactionHash", "asset", "side", "size", "price"))
 
-    except Exception as e:
-        logger.debug(f"   Could not fetch entry price from API: {e}")
-    return None
 
+def _fetch_trades_page(offset):
+    """Fetch one page of the wallet's trade history, newest first"""
+    r = _proxied_session.get(
+        TRADES_API_URL,
+        params={
+            "user": WALLET_ADDRESS,
+            "limit": TRADES_PAGE_SIZE,
+            "offset": offset,
+            "takerOnly": "false"
+        },
+        timeout=10
+    )
+    r.raise_for_status()
+    trades = r.json()
+    if isinstance(trades, dict):
+        trades = trades.get("data", trades.get("trades", []))
+    return trades
+
+
+def _apply_trade(assets, trade):
+    """Fold one trade into the per-asset running totals. Returns the asset id it touched."""
+    asset = str(trade.get("asset") or trade.get("asset_id") or trade.get("tokenId") or "")
+    size = float(trade.get("size", trade.get("shares", 0)) or 0)
+    price = float(trade.get("price", 0) or 0)
+    side = str(trade.get("side", "")).upper()
+    if not asset or size <= 0 or side not in ("BUY", "SELL"):
+        return None
+
+    basis = assets.setdefault(asset, {"bought": 0.0, "cost": 0.0, "sold": 0.0, "proceeds": 0.0})
+    if side == "BUY":
+        basis["bought"] += size
+        basis["cost"] += size * price
+    else:
+        basis["sold"] += size
+        basis["proceeds"] += size * price
+    return asset
 
-def should_sell(token_id, current_price, shares):
-    """Determine if position should be sold based on profit/loss"""
 
-    # Check if we have purchase data locally
-    if token_id not in trades_log["purchases"]:
-        # Try fetching from Polymarket API first
-        api_price = fetch_entry_price_from_api(token_id)
-        if api_price and api_price > 0:
-            logger.info(f"   ✅ Entry price fetched from API: ${api_price:.4f}")
-            trades_log["purchases"][token_id] = {
-                "buy_price": api_price,
-                "shares": shares,
+def get_synced_entry(token_id):
+    """VWAP entry price, net shares and cost basis for a token from the synced trade history.
+    Returns None if the token has no buys in the synced history."""
+    basis = trades_log["entry_sync"]["assets"].get(str(token_id))
+    if not basis or basis["bought"] <= 0:
+        return None
+    vwap = basis["cost"] / basis["bought"]
+    shares = max(basis["bought"] - basis["sold"], 0.0)
+    return {"vwap": vwap, "shares": shares, "cost_basis": vwap * shares}
+
+
+def sync_entry_prices():
+    """Incrementally sync entry prices for every position from the wallet's trade history.
+
+    Pages newest-first through the Data API trades endpoint and stops at the first
+    trade already applied by a previous sync, so after the initial backfill a sync
+    costs a single request. Progress is checkpointed after every page, so an
+    interrupted backfill resumes where it stopped instead of starting over.
+    """
+    sync = trades_log["entry_sync"]
+    assets = sync["assets"]
+    last_ts = sync["last_ts"]
+    last_keys = set(sync["last_keys"])
+
+    resume = sync.get("resume") or {
+        "offset": 0,
+        "high_ts": None,      # newest trade applied by this sync
+        "high_keys": [],
+        "cursor_ts": None,    # oldest trade applied by this sync
+        "cursor_keys": [],
+        "touched": []
+    }
+    if sync.get("resume"):
+        logger.info(f"   ↩️  Resuming trade history sync at offset {resume['offset']}")
+
+    touched = set(resume["touched"])
+    cursor_keys = set(resume["cursor_keys"])
+    applied = 0
+
+    while True:
+        page_touched = set()
+        try:
+            page = _fetch_trades_page(resume["offset"])
+        except Exception as e:
+            logger.warning(f"   ⚠️  Trade history sync paused at offset {resume['offset']}: {e}")
+            return False
+
+        reached_known = False
+        for trade in page:
+            ts = int(float(trade.get("timestamp", 0) or 0))
+            key = _trade_key(trade)
+
+            # Already folded in by a previous, completed sync
+            if ts < last_ts:
+                reached_known = True
+                break
+            if ts == last_ts and key in last_keys:
+                continue
+
+            # Already folded in earlier in this (resumed) sync - offsets shift as new trades arrive
+            if resume["cursor_ts"] is not None and resume["cursor_ts"] <= ts <= resume["high_ts"]:
+                if ts > resume["cursor_ts"] or key in cursor_keys:
+                    continue
+
+            asset = _apply_trade(assets, trade)
+            if asset is None:
+                continue
+            touched.add(asset)
+            page_touched.add(asset)
+            applied += 1
+
+            if resume["high_ts"] is None or ts > resume["high_ts"]:
+                resume["high_ts"], resume["high_keys"] = ts, [key]
+            elif ts == resume["high_ts"]:
+                resume["high_keys"].append(key)
+            if resume["cursor_ts"] is None or ts < resume["cursor_ts"]:
+                resume["cursor_ts"], cursor_keys = ts, {key}
+            elif ts == resume["cursor_ts"]:
+                cursor_keys.add(key)
+
+        resume["offset"] += len(page)
+        resume["cursor_keys"] = sorted(cursor_keys)
+        resume["touched"] = sorted(touched)
+
+        if reached_known or len(page) < TRADES_PAGE_SIZE:
+            break
+
+        # Checkpoint before fetching the next page
+        sync["resume"] = resume
+        save_sync_state(page_touched)
+
+    with trades_lock, ledger.batch():
+        # Sync complete - advance the high-water mark
+        if resume["high_ts"] is not None:
+            if resume["high_ts"] == last_ts:
+                sync["last_keys"] = sorted(last_keys | set(resume["high_keys"]))
+            else:
+                sync["last_ts"] = resume["high_ts"]
+                sync["last_keys"] = resume["high_keys"]
+        sync["resume"] = None
+
+        # Tokens with new trades are live again
+        skip_cache.discard(touched)
+
+        # Refresh entry prices of open purchases with new trades, and drop purchases the synced
+        # history shows closed. Positions without a purchase are backfilled by resolve_entry_price
+        # once discovery returns them, so assets we no longer hold (e.g. redeemed) aren't revived.
+        updated = closed = 0
+        for asset in list(trades_log["purchases"]):
+            if asset not in assets:
+                continue
+            entry = get_synced_entry(asset)
+            if not entry or entry["shares"] < MIN_SYNC_SHARES:
+                del trades_log["purchases"][asset]
+                ledger.delete_purchase(asset)
+                closed += 1
+                continue
+            if asset not in touched:
+                continue
+            trades_log["purchases"][asset] = {
+                "buy_price": entry["vwap"],
+                "shares": entry["shares"],
                 "timestamp": datetime.now().isoformat(),
                 "source": "api"
             }
-            save_trades_log()
-        else:
-            logger.info(f"   ℹ️  No entry price found - assuming bought at current price")
-            record_purchase(token_id, current_price, shares)
-            return False, 0.0, 0.0
+            ledger.upsert_purchase(asset, trades_log["purchases"][asset])
+            updated += 1
+
+        save_sync_state(page_touched)
+    if applied or updated or closed:
+        logger.info(f"   📡 Trade history sync: {applied} new trades, {updated} entry prices updated, "
+                    f"{closed} closed purchases removed")
+    return True
+
+
+def resolve_entry_price(token_id, current_price, shares):
+    """Entry price for a position, from the local log or the synced trade history.
+    Returns None (after recording the current price as the entry) if neither has one."""
+    with trades_lock:
+        # Check if we have purchase data locally
+        if token_id not in trades_log["purchases"]:
+            # Fall back to the synced trade history (no per-token API call)
+            entry = get_synced_entry(token_id)
+            if entry and entry["vwap"] > 0:
+                logger.info(f"   ✅ Entry price from trade history: ${entry['vwap']:.4f}")
+                trades_log["purchases"][token_id] = {
+                    "buy_price": entry["vwap"],
+                    "shares": shares,
+                    "timestamp": datetime.now().isoformat(),
+                    "source": "api"
+                }
+                ledger.upsert_purchase(token_id, trades_log["purchases"][token_id])
+            else:
+                logger.info(f"   ℹ️  No entry price found - assuming bought at current price")
+                record_purchase(token_id, current_price, shares)
+                return None
 
-    purchase = trades_log["purchases"][token_id]
-    buy_price = purchase["buy_price"]
+        return trades_log["purchases"][token_id]["buy_price"]
 
-    # Calculate P&L
-    current_value = current_price * shares
-    purchase_value = buy_price * shares
-    pnl = current_value - purchase_value
-    pnl_pct = ((current_price - buy_price) / buy_price) * 100
 
-    # Check thresholds
-    if current_price >= TAKE_PROFIT_PRICE:  # Price-based take profit
+def log_sell_decision(reason, current_price, pnl_pct):
+    """Log the outcome of the sell rules for one position"""
+    if reason == "TAKE PROFIT":
         logger.info(f"   🎯 TAKE PROFIT! Price ${current_price:.4f} reached target ${TAKE_PROFIT_PRICE:.2f}")
-        return True, pnl, pnl_pct
-    elif pnl_pct <= STOP_LOSS_PCT:
+    elif reason == "STOP LOSS":
         logger.info(f"   🛑 STOP LOSS! {pnl_pct:.1f}% loss (threshold: {STOP_LOSS_PCT}%)")
-        return True, pnl, pnl_pct
     else:
         logger.info(f"   📊 Hold: Price ${current_price:.4f} (TP: ${TAKE_PROFIT_PRICE:.2f}, SL: {STOP_LOSS_PCT}%)")
-        return False, pnl, pnl_pct
 
 
-def sell_position(token_id, shares, current_price, pnl, pnl_pct):
-    """Execute sell order"""
-    logger.info(f"   💰 Executing SELL order...")
+def queue_sell(executor, token_id, shares, current_price, pnl, pnl_pct):
+    """Queue a sell order on an ExitExecutor - submitted on the executor's next flush()"""
+    logger.info(f"   💰 Queueing SELL order...")
     logger.info(f"      Shares: {shares:.6f}")
     logger.info(f"      Price: ${current_price:.4f}")
     logger.info(f"      Value: ${shares * current_price:.2f}")
 
-    try:
-        # Round price to valid tick size (Polymarket requires 2 decimal places max)
-        current_price = round(current_price, 2)
-        order = OrderArgs(
-            token_id=token_id,
-            price=current_price,
-            size=shares,
-            side=SELL,
-            fee_rate_bps=0,
-            nonce=0
-        )
-
-        signed_order = client.create_order(order)
-        result = client.post_order(signed_order, OrderType.GTC)
-
-        logger.info(f"   ✅ SOLD!")
-        logger.info(f"      Order ID: {result.get('orderID', 'N/A')}")
-        logger.info(f"      Status: {result.get('status', 'N/A')}")
-        logger.info(f"      P&L: ${pnl:+.2f} ({pnl_pct:+.1f}%)")
-
-        # Record the sale
-        record_sale(token_id, current_price, shares, pnl, pnl_pct)
-
-        return True
+    # Round price down to a valid tick (Polymarket requires 2 decimal places max) -
+    # rounding a sell up could put it above the bid levels it needs to take
+    return executor.add(token_id, shares, math.floor(current_price * 100 + 1e-9) / 100,
+                        pnl=pnl, pnl_pct=pnl_pct)
 
-    except Exception as e:
-        logger.error(f"   ❌ Sell failed: {e}")
-        return False
+
+def record_exits(orders):
+    """Log submitted exit orders and track them. Fills are recorded by the order tracker: from the
+    order stream as they happen, or, while the stream is down, by resyncing right away."""
+    live = order_stream_live()
+    for order in orders:
+        if not order.ok:
+            logger.error(f"   ❌ Sell failed for {order.token_id[:20]}...: {order.error}")
+            continue
+
+        logger.info(f"   ✅ SELL placed {order.token_id[:20]}...")
+        logger.info(f"      Order ID: {order.order_id}")
+        logger.info(f"      Status: {order.status or 'N/A'}")
+        logger.info(f"      P&L: ${order.meta['pnl']:+.2f} ({order.meta['pnl_pct']:+.1f}%)")
+        order_tracker.placed(order.order_id, order.token_id, "SELL", order.price, order.shares)
+
+    if not live and any(order.ok for order in orders):
+        _seed_order_tracker()
+
+
+def sell_position(token_id, shares, current_price, pnl, pnl_pct):
+    """Execute a single sell order immediately"""
+    executor = ExitExecutor(client)
+    queue_sell(executor, token_id, shares, current_price, pnl, pnl_pct)
+    orders = executor.flush()
+    record_exits(orders)
+    return orders[0].ok
+
+
+def _price_position(pos):
+    """Price one position and resolve its entry. Returns None for skipped positions."""
+    token_id = pos['token_id']
+    shares = pos['shares']
+
+    # Price the whole position against the book's depth; top of book if there is no book
+    quote = book_mirror.quote(token_id, shares)
+    if quote is not None and quote.filled > 0:
+        current_price = quote.vwap
+    else:
+        quote = None
+        current_price, is_resolved = get_market_price(token_id)
+
+    if current_price is None:
+        # Resolved markets are cached; network errors retry next scan
+        if is_resolved:
+            skip_cache.add(token_id, is_resolved)
+        return None
+
+    current_value = shares * current_price
+
+    # Skip dust positions silently (before any logging)
+    if current_value < MIN_POSITION_VALUE:
+        skip_cache.add(token_id, "dust")
+        return None
+
+    # Only log positions we're actually tracking
+    logger.info(f"")
+    logger.info(f"--- Position {token_id[:20]}... ---")
+    logger.info(f"   Shares: {shares:.6f}")
+    logger.info(f"   Current Price: ${current_price:.4f}")
+    logger.info(f"   Current Value: ${current_value:.2f}")
+    if quote is not None:
+        logger.info(f"   Book: best bid ${quote.best_bid:.4f}, exit VWAP ${quote.vwap:.4f} over "
+                    f"{quote.levels} level(s), limit ${quote.limit_price:.4f}")
+        if not quote.complete:
+            logger.info(f"   ⚠️  Bids only absorb {quote.filled:.6f} of {shares:.6f} shares")
+
+    return {
+        'token_id': token_id,
+        'shares': shares,
+        'current_price': current_price,
+        'buy_price': resolve_entry_price(token_id, current_price, shares),
+        # What a sell would actually post: the fillable size at the worst level it needs
+        'exit_shares': quote.filled if quote else shares,
+        'exit_price': quote.limit_price if quote else current_price
+    }
+
+
+def price_position(pos):
+    """Worker-thread wrapper around _price_position.
+    Returns (row, log_records) with this position's log output buffered."""
+    with capture_logs([]) as records:
+        try:
+            row = _price_position(pos)
+        except Exception as e:
+            logger.warning(f"   ⚠️  Error pricing {pos['token_id'][:20]}...: {e}")
+            row = None
+    return row, records
+
+
+# ============================================================================
+# LIVE TRIGGER ENGINE
+# ============================================================================
+
+class TriggerBook:
+    """Absolute take-profit / stop-loss prices for every held token.
+
+    Each token has its own price stream, so triggers are indexed by token: a
+    price update is checked against that token's two levels in O(1). A fired
+    trigger is disarmed until the next scan re-arms it, and claim()/release()
+    make sure the live engine and the periodic scan never sell the same token
+    at the same time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._triggers = {}    # token_id: {stop_price, take_profit_price, buy_price, shares}
+        self._claimed = set()  # tokens with a sell in flight
+
+    def arm(self, token_id, buy_price, shares, resting=False):
+        """resting: a resting take-profit order is live for token_id, so only stop-loss is armed"""
+        stop_price = buy_price * (1 + STOP_LOSS_PCT / 100.0)
+        with self._lock:
+            if token_id in self._claimed:
+                return
+            self._triggers[token_id] = {
+                "stop_price": stop_price,
+                # With a resting take-profit order the exchange handles TP
+                "take_profit_price": float("inf") if resting else TAKE_PROFIT_PRICE,
+                "buy_price": buy_price,
+                "shares": shares
+            }
+
+    def retain(self, token_ids):
+        """Drop triggers for tokens no longer held"""
+        token_ids = set(token_ids)
+        with self._lock:
+            for token_id in list(self._triggers):
+                if token_id not in token_ids:
+                    del self._triggers[token_id]
+
+    def tokens(self):
+        with self._lock:
+            return list(self._triggers)
+
+    def check(self, token_id, bid):
+        """Return (reason, trigger) if bid crosses a level for token_id, claiming it; else None"""
+        with self._lock:
+            trigger = self._triggers.get(token_id)
+            if trigger is None:
+                return None
+            if bid >= trigger["take_profit_price"]:
+                reason = "TAKE PROFIT"
+            elif bid <= trigger["stop_price"]:
+                reason = "STOP LOSS"
+            else:
+                return None
+            del self._triggers[token_id]
+            self._claimed.add(token_id)
+            return reason, trigger
+
+    def claim(self, token_id):
+        """Claim token_id for a sell from the scan. False if a sell is already in flight."""
+        with self._lock:
+            if token_id in self._claimed:
+                return False
+            self._triggers.pop(token_id, None)
+            self._claimed.add(token_id)
+            return True
+
+    def release(self, token_id):
+        """Sell attempt finished - the next scan re-arms the token if it is still held"""
+        with self._lock:
+            self._claimed.discard(token_id)
+
+
+trigger_book = TriggerBook()
+_trigger_queue = queue.Queue()
+
+
+def _on_market_event(event):
+    """Market channel callback: update the book mirror, then check every bid update against the trigger book"""
+    book_mirror.handle(event)
+    for token_id, bid in best_bids(event):
+        fired = trigger_book.check(token_id, bid)
+        if fired:
+            _trigger_queue.put((token_id, bid) + fired)
+
+
+def _trigger_worker():
+    """Execute fired triggers one at a time, off the websocket thread"""
+    while True:
+        token_id, bid, reason, trigger = _trigger_queue.get()
+        shares = trigger["shares"]
+        resting_tp.cancel([token_id])  # frees the shares a resting take-profit holds
+        available = order_tracker.available(token_id)
+        if available is not None:
+            shares = min(shares, available)
+        buy_price = trigger["buy_price"]
+
+        # Sell what the book can absorb, priced at its depth rather than the top bid
+        price = exit_price = bid
+        quote = book_mirror.quote(token_id, shares)
+        if quote is not None and quote.filled > 0:
+            shares, price, exit_price = quote.filled, quote.vwap, quote.limit_price
+        pnl = (price - buy_price) * shares
+        pnl_pct = ((price - buy_price) / buy_price) * 100 if buy_price else 0.0
+
+        logger.info(f"⚡ LIVE {reason}: {token_id[:20]}... bid ${bid:.4f} "
+                    f"(TP ${trigger['take_profit_price']:.2f}, SL ${trigger['stop_price']:.4f})")
+        try:
+            if shares <= 0.0001:
+                logger.info(f"   ⏭️  All shares already locked in open orders")
+                continue
+            sell_position(token_id, shares, exit_price, pnl, pnl_pct)
+        except Exception as e:
+            logger.error(f"   ❌ Live trigger sell failed: {e}")
+        finally:
+            trigger_book.release(token_id)
+
+
+market_channel = MarketChannel(_on_market_event)
+
+
+def start_trigger_engine():
+    """Start the market price stream and the trigger executor"""
+    threading.Thread(target=_trigger_worker, name="trigger-worker", daemon=True).start()
+    market_channel.start()
+    logger.info("⚡ Live TP/SL trigger engine started")
 
 
 def scan_and_sell():
@@ -627,10 +1359,15 @@ def scan_and_sell():
     logger.info("📊 SCANNING POSITIONS")
     logger.info("=" * 70)
 
-    positions = get_all_positions()
+    budget = ScanBudget(SCAN_BUDGET_SECONDS)
+    sync_entry_prices()
+    positions, deferred_balance = get_all_positions(budget)
+    deferred = {"balance check": deferred_balance, "pricing": []}
 
     if not positions:
         logger.info("No positions found")
+        note_deferred(deferred_balance)
+        log_deferred_report(deferred, budget)
         return
 
     logger.info("")
@@ -639,51 +1376,93 @@ def scan_and_sell():
     held_count = 0
     total_pnl = 0.0
 
-    for i, pos in enumerate(positions, 1):
-        token_id = pos['token_id']
-        shares = pos['shares']
-
-        # Get current price first (before any logging)
-        current_price, is_resolved = get_market_price(token_id)
-
-        if current_price is None:
-            # Skip resolved or network errors - will retry next scan
+    refresh_books([pos['token_id'] for pos in positions])
+
+    # Price all positions concurrently (highest priority submitted first) within the budget,
+    # then evaluate them together in one vectorized pass
+    pool = ThreadPoolExecutor(max_workers=PRICE_WORKERS)
+    futures = [pool.submit(price_position, pos) for pos in positions]
+    wait_futures(futures, timeout=max(budget.remaining(SELL_RESERVE_SECONDS), 0))
+    pool.shutdown(wait=False, cancel_futures=True)
+    priced = []
+    for pos, future in zip(positions, futures):
+        if future.done() and not future.cancelled():
+            priced.append(future.result())
+        else:
+            deferred["pricing"].append(pos['token_id'])
+
+    rows = [row for row, _ in priced if row and row['buy_price'] is not None]
+    evaluation = evaluate_portfolio(Portfolio.from_rows(rows), SELL_RULES)
+    # Positions with a live resting take-profit leave TP to the exchange; the rest keep polled TP
+    resting = resting_tp.active() if RESTING_TAKE_PROFIT else set()
+    if resting:
+        evaluation.exempt("TAKE PROFIT", np.array([row['token_id'] in resting for row in rows], dtype=bool))
+    row_index = {id(row): i for i, row in enumerate(rows)}
+
+    # Log output stays in position order; sells are collected and submitted as one batch
+    exits = ExitExecutor(client)
+    resting_desired = {}  # token_id: shares for the resting take-profit orders
+    for row, records in priced:
+        flush_log_records(logger, records)
+        if row is None:
             continue
+        note_priced(row)
 
-        current_value = shares * current_price
-        
-        # Skip dust positions silently (before any logging)
-        if current_value < MIN_POSITION_VALUE:
+        if row['buy_price'] is None:
+            # Entry just recorded at the current price - nothing to evaluate yet
+            held_count += 1
+            resting_desired[row['token_id']] = row['shares']
+            logger.info("")
             continue
 
-        # Only log positions we're actually tracking
-        logger.info(f"")
-        logger.info(f"--- Position {held_count + 1} ---")
-        logger.info(f"   Token: {token_id[:20]}...")
-        logger.info(f"   Shares: {shares:.6f}")
-        logger.info(f"   Current Price: ${current_price:.4f}")
-        logger.info(f"   Current Value: ${current_value:.2f}")
-
-        time.sleep(0.5)  # Small delay to prevent interleaved logs
-
-        # Check if should sell
-        should_sell_flag, pnl, pnl_pct = should_sell(token_id, current_price, shares)
+        i = row_index[id(row)]
+        reason = evaluation.reason(i)
+        pnl, pnl_pct = float(evaluation.pnl[i]), float(evaluation.pnl_pct[i])
+        log_sell_decision(reason, row['current_price'], pnl_pct)
+        logger.info(f"   Entry Price:   ${row['buy_price']:.4f} | P&L: {pnl_pct:+.1f}% (${pnl:+.2f})")
 
-        # Log buy price for visibility
-        if token_id in trades_log["purchases"]:
-            buy_price = trades_log["purchases"][token_id]["buy_price"]
-            logger.info(f"   Entry Price:   ${buy_price:.4f} | P&L: {pnl_pct:+.1f}% (${pnl:+.2f})")
-
-        if should_sell_flag:
-            if sell_position(token_id, shares, current_price, pnl, pnl_pct):
-                sold_count += 1
-                total_pnl += pnl
+        if reason is not None:
+            if not trigger_book.claim(row['token_id']):
+                logger.info("   ⏭️  Live trigger already selling this position")
+            else:
+                # P&L scales with the part of the position the book can take now
+                fraction = row['exit_shares'] / row['shares']
+                queue_sell(exits, row['token_id'], row['exit_shares'], row['exit_price'],
+                           pnl * fraction, pnl_pct)
         else:
             held_count += 1
             total_pnl += pnl
+            trigger_book.arm(row['token_id'], row['buy_price'], row['shares'], resting=row['token_id'] in resting)
+            resting_desired[row['token_id']] = row['shares']
 
         logger.info("")
 
+    if len(exits):
+        if RESTING_TAKE_PROFIT:
+            # Stop-loss sells need the shares the resting take-profits hold
+            resting_tp.cancel(order.token_id for order in exits.pending())
+        logger.info(f"📤 Submitting {len(exits)} sell orders...")
+        orders = exits.flush()
+        record_exits(orders)
+        for order in orders:
+            trigger_book.release(order.token_id)
+            if order.ok:
+                sold_count += 1
+                total_pnl += order.meta['pnl']
+
+    # Reconcile live triggers and books with what we actually hold (deferred tokens keep theirs)
+    note_deferred(deferred["balance check"] + deferred["pricing"])
+    held = [pos['token_id'] for pos in positions] + deferred["balance check"]
+    trigger_book.retain(held)
+    book_mirror.retain(held)
+    if LIVE_TRIGGERS_ENABLED:
+        market_channel.set_assets(held)
+
+    if RESTING_TAKE_PROFIT:
+        resting_tp.reconcile(resting_desired, keep=deferred["balance check"] + deferred["pricing"])
+
+    log_deferred_report(deferred, budget)
+
     # Summary
     logger.info("=" * 70)
     logger.info("SCAN COMPLETE")
@@ -692,6 +1471,14 @@ def scan_and_sell():
     logger.info(f"Positions held: {held_count}")
     logger.info(f"Session P&L: ${total_pnl:+.2f}")
     logger.info(f"Total All-Time P&L: ${trades_log['total_profit']:+.2f}")
+    logger.info(f"Scan time: {budget.elapsed():.1f}s of {budget.seconds}s budget")
+    stats = ledger.stats()
+    if stats["sales"]:
+        today = ledger.rollups("day", datetime.now().date().isoformat()).get(datetime.now().date().isoformat())
+        win_rate = f"{stats['win_rate']:.0%}" if stats["win_rate"] is not None else "n/a"
+        avg_hold = f"{stats['avg_hold_seconds'] / 3600:.1f}h" if stats["avg_hold_seconds"] is not None else "n/a"
+        logger.info(f"Sales: {stats['sales']} | Win rate: {win_rate} | Avg hold: {avg_hold} | "
+                    f"Today: ${today['pnl'] if today else 0.0:+.2f}")
     logger.info("=" * 70)
 
 
@@ -703,11 +1490,19 @@ def main():
     logger.info("=" * 70)
     logger.info(f"Wallet: {WALLET_ADDRESS}")
     purge_bad_entry_prices()
+    sync_entry_prices()
     logger.info(f"Take Profit: ${TAKE_PROFIT_PRICE:.2f} per share")
     logger.info(f"Stop Loss: {STOP_LOSS_PCT}%")
     logger.info(f"Scan Interval: {SCAN_INTERVAL_SECONDS}s ({SCAN_INTERVAL_SECONDS // 60} minutes)")
+    logger.info(f"Live Triggers: {'ON' if LIVE_TRIGGERS_ENABLED else 'OFF'}")
+    logger.info(f"Order Stream: {'ON' if USER_STREAM_ENABLED else 'OFF'}")
+    logger.info(f"Resting Take-Profit: {'ON' if RESTING_TAKE_PROFIT else 'OFF'}")
     logger.info("=" * 70)
     logger.info("")
+    if USER_STREAM_ENABLED:
+        user_channel.start()
+    if LIVE_TRIGGERS_ENABLED:
+        start_trigger_engine()
     logger.info("Bot is running... Press Ctrl+C to stop")
     logger.info("")
 
@@ -720,6 +1515,7 @@ def main():
 
             try:
                 scan_and_sell()
+                ledger.archive_sales()
             except Exception as e:
                 logger.error(f"Error during scan: {e}")
                 import traceback
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Short-TTL CLOB quote cache
+Quotes are keyed by (token_id, side) and shared by every stage of a scan, so a
+price fetched while screening markets is reused when the market is analysed
+moments later. Misses are fetched in batches through POST /prices, and
+concurrent requests for the same quote wait for the one fetch already in
+flight instead of issuing their own.
+"""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+from py_clob_client.clob_types import BookParams
+
+SIDES = ("BUY", "SELL")  # BUY is the best bid, SELL the best ask (as get_price reports them)
+FETCH_WAIT_SECONDS = 15  # Longest a caller waits on another caller's in-flight fetch
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Quote:
+    price: float
+    fetched_at: float
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+
+class QuoteCache:
+    def __init__(self, clob, ttl: float, batch_size: int = 200, limiter=None):
+        """limiter: optional RateLimiter every POST /prices request waits on"""
+        self.clob = clob
+        self.ttl = ttl
+        self.batch_size = batch_size
+        self.limiter = limiter
+        self._lock = threading.Lock()
+        self._quotes: Dict[Tuple[str, str], Quote] = {}
+        self._inflight: Dict[Tuple[str, str], threading.Event] = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.requests = 0
+
+    def get(self, token_id: str, side: str, max_age: Optional[float] = None) -> Optional[Quote]:
+        return self.get_many([token_id], (side,), max_age).get((str(token_id), side))
+
+    def get_many(self, token_ids: Iterable[str], sides=SIDES,
+                 max_age: Optional[float] = None) -> Dict[Tuple[str, str], Quote]:
+        """{(token_id, side): Quote} no older than max_age (default: the TTL).
+        Quotes that can't be fetched are left out."""
+        max_age = self.ttl if max_age is None else max_age
+        keys = [(str(t), side) for t in token_ids for side in sides]
+        result = {}
+        fetch, wait = [], []
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                quote = self._quotes.get(key)
+                if quote is not None and quote.age <= max_age:
+                    result[key] = quote
+                    self.hits += 1
+                elif key in self._inflight:
+                    wait.append((key, self._inflight[key]))
+                else:
+                    self._inflight[key] = threading.Event()
+                    fetch.append(key)
+                    self.misses += 1
+
+        if fetch:
+            try:
+                self._fetch(fetch)
+            finally:
+                with self._lock:
+                    for key in fetch:
+                        self._inflight.pop(key).set()
+
+        for key, done in wait:
+            done.wait(FETCH_WAIT_SECONDS)
+        # A failed refetch leaves the old quote behind - it only counts if still within max_age
+        with self._lock:
+            for key, _ in wait:
+                quote = self._quotes.get(key)
+                if quote is not None and quote.age <= max_age:
+                    result[key] = quote
+                    self.hits += 1
+            for key in fetch:
+                quote = self._quotes.get(key)
+                if quote is not None and quote.age <= max_age:
+                    result[key] = quote
+        return result
+
+    def _fetch(self, keys):
+        for start in range(0, len(keys), self.batch_size):
+            chunk = keys[start:start + self.batch_size]
+            self.requests += 1
+            if self.limiter is not None:
+                self.limiter.acquire()
+            try:
+                prices = self.clob.get_prices([BookParams(token_id=t, side=side) for t, side in chunk])
+            except Exception as e:
+                logger.warning(f"   ⚠️  Price batch of {len(chunk)} quotes failed: {e}")
+                continue
+            now = time.time()
+            with self._lock:
+                for token_id, side in chunk:
+                    price = (prices.get(token_id) or {}).get(side)
+                    if price not in (None, ""):
+                        self._quotes[(token_id, side)] = Quote(float(price), now)
+
+    def bid_ask(self, token_ids: Iterable[str], max_age: Optional[float] = None) -> Dict[str, Tuple[Quote, Quote]]:
+        """{token_id: (bid quote, ask quote)} for tokens with both sides available"""
+        token_ids = [str(t) for t in token_ids]
+        quotes = self.get_many(token_ids, SIDES, max_age)
+        return {t: (quotes[(t, "BUY")], quotes[(t, "SELL")]) for t in token_ids
+                if (t, "BUY") in quotes and (t, "SELL") in quotes}
+
+    def prune(self):
+        """Drop quotes past the TTL"""
+        with self._lock:
+            for key in [k for k, q in self._quotes.items() if q.age > self.ttl]:
+                del self._quotes[key]
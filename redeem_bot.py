@@ -51,10 +51,9 @@ else:
 # CLOB + Web3 imports
 # ============================================================================
 from py_clob_client.client import ClobClient
-from py_clob_client.clob_types import OrderArgs, OrderType
-from py_clob_client.order_builder.constants import SELL
 from web3 import Web3
 from eth_account import Account
+from exit_executor import ExitExecutor
 
 # ============================================================================
 # CONFIG
@@ -209,44 +208,44 @@ def check_market_resolved(condition_id: str, token_id: str) -> tuple:
     return resolved, winning_price
 
 
-def sell_via_clob(token_id: str, shares: float, bid: float, title: str, outcome: str) -> bool:
-    """Sell position on CLOB at current bid price."""
+def sell_via_clob(executor, token_id: str, shares: float, bid: float, title: str, outcome: str):
+    """Queue a CLOB sell at the current bid - submitted with the rest of the scan's exits"""
     logger.info(f"💸 SELLING via CLOB: {title[:60]}")
     logger.info(f"   Outcome: {outcome} | Shares: {shares:.2f} | Bid: ${bid:.4f}")
     logger.info(f"   Proceeds: ${shares * bid:.2f}")
-    try:
-        order = OrderArgs(
-            token_id=token_id,
-            price=round(bid, 2),
-            size=round(shares, 2),
-            side=SELL,
-            fee_rate_bps=0,
-            nonce=0,
-        )
-        signed = client.create_order(order)
-        result = client.post_order(signed, OrderType.GTC)
-        order_id = result.get("orderID", "N/A")
-        status   = result.get("status", "N/A")
-        logger.info(f"   ✅ SOLD | Order: {order_id} | Status: {status}")
+    return executor.add(token_id, round(shares, 2), round(bid, 2), title=title, outcome=outcome, bid=bid,
+                        raw_shares=shares)
 
+
+def record_clob_sells(orders) -> int:
+    """Log submitted CLOB sells and add accepted ones to the redeem log. Returns the number sold."""
+    sold = 0
+    for order in orders:
+        title = order.meta["title"]
+        if not order.ok:
+            logger.error(f"   ❌ CLOB sell failed ({title[:40]}): {order.error}")
+            continue
+
+        shares, bid = order.meta["raw_shares"], order.meta["bid"]
+        logger.info(f"   ✅ SOLD {title[:40]} | Order: {order.order_id} | Status: {order.status or 'N/A'}")
         redeem_log["sells"].append({
             "timestamp": datetime.now().isoformat(),
             "market": title,
-            "outcome": outcome,
-            "token_id": token_id,
+            "outcome": order.meta["outcome"],
+            "token_id": order.token_id,
             "shares": shares,
             "bid": bid,
             "proceeds": round(shares * bid, 4),
-            "order_id": order_id,
+            "order_id": order.order_id,
         })
         redeem_log["total_collected"] = round(
             redeem_log.get("total_collected", 0) + shares * bid, 4
         )
+        sold += 1
+
+    if orders:
         save_log(redeem_log)
-        return True
-    except Exception as e:
-        logger.error(f"   ❌ CLOB sell failed: {e}")
-        return False
+    return sold
 
 
 def redeem_on_chain(token_id: str, condition_id: str, shares: float, title: str) -> bool:
@@ -331,6 +330,7 @@ def scan():
     logger.info(f"Checking {len(positions)} positions...\n")
 
     sold = redeemed = held = 0
+    exits = ExitExecutor(client)
 
     for p in positions:
         token_id     = str(p.get("asset") or p.get("asset_id") or p.get("token_id") or "")
@@ -357,12 +357,8 @@ def scan():
 
         elif bid is not None and bid > 0:
             # Resolved and CLOB still has a book — sell via CLOB at market
-            logger.info("   ✅ Market resolved — selling via CLOB")
-            ok = sell_via_clob(token_id, shares, bid, title, outcome)
-            if ok:
-                sold += 1
-            else:
-                held += 1
+            logger.info("   ✅ Market resolved — queued for CLOB sell")
+            sell_via_clob(exits, token_id, shares, bid, title, outcome)
 
         else:
             # Resolved and no CLOB book — redeem on-chain at $1.00
@@ -379,6 +375,13 @@ def scan():
 
         logger.info("")
 
+    # Submit all CLOB sells from this scan together
+    if len(exits):
+        logger.info(f"📤 Submitting {len(exits)} CLOB sells...")
+        queued = len(exits)
+        sold = record_clob_sells(exits.flush())
+        held += queued - sold
+
     logger.info("=" * 65)
     logger.info(f"SCAN COMPLETE | Sold: {sold} | Redeemed: {redeemed} | Held: {held}")
     logger.info(f"Total collected all-time: ${redeem_log.get('total_collected', 0):.2f}")
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Local relevance model for the autonomous bot
+A logistic regression over hashed question n-grams plus a few market
+numerics. It scores how likely a market is to end in a BUY signal, so
+markets that would almost surely be HOLDs skip the LLM entirely. It is
+trained offline from the bot's own logs:
+  - decisions_log.json: one line per analysed market (features + outcome)
+  - trades_log.json: every BUY, including trades from before decisions were logged
+  - the profit-taking ledger (optional): realised P&L, which weights winning
+    trades up and losing trades down
+The gate threshold is the highest score that still keeps TARGET_RECALL of
+out-of-fold BUYs, so trades we would have taken stay in. Scoring is pure
+Python and takes microseconds per market.
+
+    python relevance_model.py [--decisions decisions_log.json] [--trades trades_log.json]
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sqlite3
+import zlib
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from context_cache import normalise_question
+
+HASH_BITS = 18
+TARGET_RECALL = 0.98  # Share of past BUYs the learned threshold must keep
+MIN_POSITIVES = 20  # Below this the model is saved with threshold 0 (gate open)
+FOLDS = 5
+EPOCHS = 15
+LEARNING_RATE = 0.1
+L2 = 1e-3
+WIN_WEIGHT = 2.0  # Sample weight for BUYs that closed in profit
+LOSS_WEIGHT = 0.5  # ... and in a loss
+
+DECISIONS_LOG = "decisions_log.json"
+TRADES_LOG = "trades_log.json"
+LEDGER_DB = "profit_taking_ledger.db"
+MODEL_PATH = "relevance_model.json"
+
+Features = Dict[int, float]
+
+
+def _bucket(name: str) -> int:
+    return zlib.crc32(name.encode()) & ((1 << HASH_BITS) - 1)
+
+
+def features(question: str, mid: Optional[float] = None, spread_pct: Optional[float] = None,
+             liquidity: Optional[float] = None, hours_to_event: Optional[float] = None) -> Features:
+    """Hashed unigrams and bigrams of the question (scaled to unit weight per market) plus numerics.
+    Numerics that are unknown are left out."""
+    words = normalise_question(question).split()
+    grams = [f"w:{w}" for w in words] + [f"b:{a} {b}" for a, b in zip(words, words[1:])]
+    out: Features = {}
+    scale = 1.0 / math.sqrt(len(grams)) if grams else 0.0
+    for gram in grams:
+        index = _bucket(gram)
+        out[index] = out.get(index, 0.0) + scale
+
+    if mid is not None:
+        out[_bucket("n:mid")] = mid
+        out[_bucket("n:mid_extremity")] = (2 * mid - 1) ** 2
+    if spread_pct is not None:
+        out[_bucket("n:spread")] = min(spread_pct, 10.0) / 10.0
+    if liquidity is not None and liquidity > 0:
+        out[_bucket("n:liquidity")] = math.log10(liquidity) / 7.0
+    if hours_to_event is None:
+        horizon = "unknown"
+    elif hours_to_event <= 3:
+        horizon = "3h"
+    elif hours_to_event <= 24:
+        horizon = "24h"
+    elif hours_to_event <= 7 * 24:
+        horizon = "7d"
+    else:
+        horizon = "far"
+    out[_bucket(f"h:{horizon}")] = 1.0
+    return out
+
+
+def _sigmoid(z: float) -> float:
+    if z < -35:
+        return 0.0
+    return 1.0 / (1.0 + math.exp(-z))
+
+
+class RelevanceModel:
+    def __init__(self, weights: Dict[int, float], bias: float, threshold: float, meta: Optional[Dict] = None):
+        self.weights = weights
+        self.bias = bias
+        self.threshold = threshold
+        self.meta = meta or {}
+
+    def score_features(self, feats: Features) -> float:
+        weights = self.weights
+        return _sigmoid(self.bias + sum(weights.get(i, 0.0) * v for i, v in feats.items()))
+
+    def score(self, question: str, mid: Optional[float] = None, spread_pct: Optional[float] = None,
+              liquidity: Optional[float] = None, hours_to_event: Optional[float] = None) -> float:
+        return self.score_features(features(question, mid, spread_pct, liquidity, hours_to_event))
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump({"hash_bits": HASH_BITS, "bias": self.bias, "threshold": self.threshold,
+                       "weights": {str(i): round(w, 6) for i, w in self.weights.items() if abs(w) > 1e-6},
+                       **self.meta}, f)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["RelevanceModel"]:
+        """The saved model, or None if there isn't a usable one"""
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("hash_bits") != HASH_BITS:
+            return None
+        meta = {k: v for k, v in data.items() if k not in ("hash_bits", "bias", "threshold", "weights")}
+        return cls({int(i): w for i, w in data["weights"].items()}, data["bias"], data["threshold"], meta)
+
+
+# ============================================================================
+# TRAINING
+# ============================================================================
+
+Sample = Tuple[Features, int, float]  # (features, label, weight)
+
+
+def fit(samples: List[Sample], seed: int = 7) -> Tuple[Dict[int, float], float]:
+    """Class-balanced logistic regression by SGD with L2"""
+    positives = sum(label for _, label, _ in samples)
+    negatives = len(samples) - positives
+    balance = {1: len(samples) / (2.0 * max(positives, 1)), 0: len(samples) / (2.0 * max(negatives, 1))}
+    weights: Dict[int, float] = {}
+    bias = 0.0
+    order = list(range(len(samples)))
+    rng = random.Random(seed)
+    for epoch in range(EPOCHS):
+        rng.shuffle(order)
+        lr = LEARNING_RATE / (1 + epoch * 0.2)
+        for n in order:
+            feats, label, weight = samples[n]
+            z = bias + sum(weights.get(i, 0.0) * v for i, v in feats.items())
+            step = lr * weight * balance[label] * (_sigmoid(z) - label)
+            bias -= step
+            for i, v in feats.items():
+                w = weights.get(i, 0.0)
+                weights[i] = w - step * v - lr * L2 * w
+    return weights, bias
+
+
+def learn_threshold(scores: List[float], labels: List[int], recall: float = TARGET_RECALL) -> float:
+    """Highest threshold keeping the given share of the positives"""
+    positive_scores = sorted(s for s, label in zip(scores, labels) if label)
+    if len(positive_scores) < MIN_POSITIVES:
+        return 0.0
+    allowed_misses = int(len(positive_scores) * (1 - recall))
+    return positive_scores[allowed_misses]
+
+
+def _curve(scores: List[float], labels: List[int], threshold: float) -> Tuple[float, float]:
+    """(recall, pass rate) at threshold"""
+    positives = sum(labels)
+    passed = [s >= threshold for s in scores]
+    recall = sum(p for p, label in zip(passed, labels) if label) / positives if positives else 0.0
+    return recall, sum(passed) / len(scores) if scores else 0.0
+
+
+def train(samples: List[Sample], recall: float = TARGET_RECALL) -> RelevanceModel:
+    """Fit on everything; pick the threshold from out-of-fold scores so it isn't flattered by overfitting"""
+    oof = [0.0] * len(samples)
+    folds = [list(range(k, len(samples), FOLDS)) for k in range(FOLDS)]
+    for fold in folds:
+        held_out = set(fold)
+        weights, bias = fit([s for n, s in enumerate(samples) if n not in held_out])
+        model = RelevanceModel(weights, bias, 0.0)
+        for n in fold:
+            oof[n] = model.score_features(samples[n][0])
+
+    labels = [label for _, label, _ in samples]
+    threshold = learn_threshold(oof, labels, recall)
+    oof_recall, oof_pass_rate = _curve(oof, labels, threshold)
+    # The same trade-off at other recall targets, for choosing --recall
+    curve = {}
+    for target in (1.0, 0.98, 0.95, 0.9, 0.8, 0.7):
+        t = learn_threshold(oof, labels, target)
+        curve[str(target)] = [round(t, 4), *(round(x, 4) for x in _curve(oof, labels, t))]
+
+    weights, bias = fit(samples)
+    return RelevanceModel(weights, bias, threshold, {
+        "trained_at": datetime.now().isoformat(),
+        "samples": len(samples),
+        "positives": sum(labels),
+        "target_recall": recall,
+        "oof_recall": round(oof_recall, 4),
+        "oof_pass_rate": round(oof_pass_rate, 4),
+        "curve": curve,
+    })
+
+
+def _read_jsonl(path: str) -> List[Dict]:
+    """Records from a JSON-lines file; anything that isn't a JSON object per line is skipped"""
+    if not os.path.exists(path):
+        return []
+    records = []
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict):
+                records.append(record)
+    return records
+
+
+def _market_outcomes(ledger_path: str) -> Dict[str, float]:
+    """{token_id: realised P&L} from the profit-taking ledger's per-market rollups"""
+    if not ledger_path or not os.path.exists(ledger_path):
+        return {}
+    conn = sqlite3.connect(ledger_path)
+    try:
+        return {key: pnl for key, pnl in conn.execute("SELECT key, pnl FROM rollups WHERE scope = 'market'")}
+    except sqlite3.Error:
+        return {}
+    finally:
+        conn.close()
+
+
+def load_samples(decisions_path: str = DECISIONS_LOG, trades_path: str = TRADES_LOG,
+                 ledger_path: Optional[str] = LEDGER_DB) -> List[Sample]:
+    """Analysed markets labelled 1 if they produced a BUY signal; BUYs from the trades log
+    that no logged decision covers are added as positives too"""
+    outcomes = _market_outcomes(ledger_path)
+
+    def weight(token_id, label):
+        pnl = outcomes.get(str(token_id))
+        if not label or pnl is None:
+            return 1.0
+        return WIN_WEIGHT if pnl > 0 else LOSS_WEIGHT
+
+    bought = {str(t["token_id"]): t for t in _read_jsonl(trades_path) if t.get("action") == "BUY" and t.get("token_id")}
+    samples: List[Sample] = []
+    covered = set()
+    for d in _read_jsonl(decisions_path):
+        if not d.get("question") or not d.get("token_id"):
+            continue
+        token_id = str(d["token_id"])
+        label = 1 if d.get("signal") or token_id in bought else 0
+        if label:
+            covered.add(token_id)
+        samples.append((features(d["question"], d.get("mid"), d.get("spread_pct"), d.get("liquidity"),
+                                 d.get("hours_to_event")), label, weight(token_id, label)))
+    for token_id, trade in bought.items():
+        if token_id not in covered and trade.get("market"):
+            samples.append((features(trade["market"], trade.get("price")), 1, weight(token_id, 1)))
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the relevance model that gates LLM analysis")
+    parser.add_argument("--decisions", default=DECISIONS_LOG)
+    parser.add_argument("--trades", default=TRADES_LOG)
+    parser.add_argument("--ledger", default=LEDGER_DB, help="profit-taking ledger for trade outcomes")
+    parser.add_argument("--out", default=MODEL_PATH)
+    parser.add_argument("--recall", type=float, default=TARGET_RECALL, help="share of past BUYs to keep")
+    args = parser.parse_args()
+
+    samples = load_samples(args.decisions, args.trades, args.ledger)
+    if not samples:
+        print("No decisions or trades to train on")
+        return
+    model = train(samples, args.recall)
+    model.save(args.out)
+    meta = model.meta
+    print(f"{meta['samples']} samples ({meta['positives']} BUYs) -> {args.out}")
+    if model.threshold <= 0:
+        print(f"Fewer than {MIN_POSITIVES} BUYs - saved with threshold 0, every market passes")
+    else:
+        print(f"Threshold {model.threshold:.4f}: out-of-fold recall {meta['oof_recall']:.1%}, "
+              f"{meta['oof_pass_rate']:.1%} of markets reach the LLM")
+        print("   target recall   threshold   recall   reach LLM")
+        for target, (threshold, recall, pass_rate) in meta["curve"].items():
+            print(f"   {float(target):>12.0%}   {threshold:>9.4f}   {recall:>6.1%}   {pass_rate:>9.1%}")
+
+
+if __name__ == "__main__":
+    main()
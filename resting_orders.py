@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Resting take-profit orders
+Keeps one limit SELL at the take-profit price on the exchange for every held
+position, so take profit executes at exchange speed instead of waiting for a
+scan to see the bid. Each reconcile only cancels and posts the orders whose
+token, size or price changed. Cancels go out as one bulk request and new
+orders as one batched post.
+"""
+
+import logging
+import math
+import threading
+from typing import Callable, Dict, Iterable, Optional
+
+from exit_executor import ExitExecutor
+
+SIZE_TOLERANCE = 0.01  # Re-size a resting order only when holdings drift by more than this
+
+logger = logging.getLogger(__name__)
+
+
+class RestingTakeProfits:
+    def __init__(self, client, tracker, price: float, min_shares: float,
+                 on_change: Optional[Callable[[Dict[str, str]], None]] = None):
+        """tracker: OrderTracker fed by the user channel - the source of truth for which orders are live.
+        on_change(registry) persists {token_id: order_id} whenever it changes."""
+        self.client = client
+        self.tracker = tracker
+        self.price = math.floor(price * 100 + 1e-9) / 100
+        self.min_shares = min_shares
+        self.on_change = on_change
+        self._lock = threading.Lock()
+        self._orders: Dict[str, str] = {}  # token_id: order_id
+
+    def load(self, orders: Dict[str, str]):
+        with self._lock:
+            self._orders = dict(orders)
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change(dict(self._orders))
+
+    def _live(self):
+        """{token_id: tracked order} for resting orders still open; filled or cancelled ones are forgotten"""
+        open_orders = {order["id"]: order for order in self.tracker.open_orders()}
+        with self._lock:
+            gone = [token for token, order_id in self._orders.items() if order_id not in open_orders]
+            for token in gone:
+                del self._orders[token]
+            live = {token: open_orders[order_id] for token, order_id in self._orders.items()}
+        if gone:
+            self._changed()
+        return live
+
+    def active(self) -> set:
+        """Tokens that have a resting order open right now"""
+        return set(self._live())
+
+    def locked(self, token_id: str) -> float:
+        """Shares our resting order for token_id still holds"""
+        with self._lock:
+            order_id = self._orders.get(str(token_id))
+        if order_id is None:
+            return 0.0
+        for order in self.tracker.open_orders(token_id):
+            if order["id"] == order_id:
+                return order["original_size"] - order["size_matched"]
+        return 0.0
+
+    def cancel(self, token_ids: Iterable[str]) -> int:
+        """Bulk-cancel the resting orders for token_ids (e.g. before a stop-loss sell)"""
+        with self._lock:
+            targets = {str(t): self._orders[str(t)] for t in token_ids if str(t) in self._orders}
+        if not targets:
+            return 0
+        try:
+            result = self.client.cancel_orders(list(targets.values()))
+        except Exception as e:
+            logger.error(f"   ❌ Couldn't cancel {len(targets)} resting TP orders: {e}")
+            return 0
+
+        not_canceled = (result or {}).get("not_canceled") or {}
+        done = [order_id for order_id in targets.values() if order_id not in not_canceled]
+        self.tracker.cancelled(done)
+        with self._lock:
+            for token, order_id in targets.items():
+                if order_id in done:
+                    self._orders.pop(token, None)
+        self._changed()
+        for order_id, reason in not_canceled.items():
+            logger.warning(f"   ⚠️  Resting TP order {order_id[:16]}... not canceled: {reason}")
+        return len(done)
+
+    def reconcile(self, desired: Dict[str, float], keep: Iterable[str] = ()):
+        """Make the resting orders match desired {token_id: shares}.
+        Tokens in keep (not evaluated this scan) keep whatever they have."""
+        live = self._live()
+        keep = {str(t) for t in keep}
+        desired = {str(t): shares for t, shares in desired.items() if shares >= self.min_shares}
+
+        stale = []
+        for token, order in live.items():
+            if token in desired:
+                remaining = order["original_size"] - order["size_matched"]
+                if abs(order["price"] - self.price) > 1e-9 or abs(remaining - desired[token]) > SIZE_TOLERANCE:
+                    stale.append(token)
+            elif token not in keep:
+                stale.append(token)
+        cancelled = self.cancel(stale) if stale else 0
+
+        # Anything still registered is live, or its cancel failed - leave it rather than double up
+        with self._lock:
+            to_place = [token for token in desired if token not in self._orders]
+        placed = 0
+        if to_place:
+            executor = ExitExecutor(self.client)
+            for token in to_place:
+                executor.add(token, desired[token], self.price)
+            for order in executor.flush():
+                if not order.ok:
+                    logger.warning(f"   ⚠️  Resting TP order for {order.token_id[:20]}... rejected: {order.error}")
+                    continue
+                self.tracker.placed(order.order_id, order.token_id, "SELL", order.price, order.shares)
+                with self._lock:
+                    self._orders[order.token_id] = order.order_id
+                placed += 1
+            self._changed()
+
+        kept = len(live) - len(stale)
+        if placed or cancelled:
+            logger.info(f"   📌 Resting TP orders @ ${self.price:.2f}: {kept} kept, "
+                        f"{placed} placed, {cancelled} cancelled")
+        return placed, cancelled, kept